@@ -31,6 +31,57 @@ class Settings(BaseSettings):
     db_pool_timeout: int = 30
     db_pool_recycle: int = 3600
     
+    # Sightings list pagination
+    sightings_page_size: int = 100
+    sightings_max_page_size: int = 500
+    sightings_fast_serialization: bool = False  # column tuples + TypeAdapter instead of ORM -> model -> json
+    
+    # Media uploaded with a sighting (streamed to storage in chunks)
+    media_max_photo_bytes: int = 20 * 1024 * 1024
+    media_max_audio_bytes: int = 50 * 1024 * 1024
+    
+    # Bulk ingest (POST /v1/sightings/bulk)
+    bulk_ingest_max_rows: int = 5000
+    
+    # Group commit for POST /v1/sightings/create: concurrent creates share one transaction
+    group_commit_enabled: bool = False
+    group_commit_window_ms: float = 5.0  # how long the first row of a group waits for others
+    group_commit_max_rows: int = 500
+    
+    # Durable task queue for follow-up work (thumbnails, species enrichment)
+    task_runner_enabled: bool = True  # claim and run queued tasks on this worker
+    task_concurrency: int = 4  # tasks running at once per worker
+    task_poll_seconds: float = 1.0
+    task_visibility_seconds: int = 300  # a claimed task is retried elsewhere if not finished by then
+    task_max_attempts: int = 5
+    task_backoff_seconds: float = 5.0  # doubled after every failed attempt
+    
+    # Resized photo variants (thumb, medium) rendered in a process pool after a sighting is created
+    thumbnails_enabled: bool = True
+    thumbnail_format: str = "webp"  # or "jpeg"
+    thumbnail_workers: int = 2
+    
+    # Direct uploads (presigned S3 PUTs, or signed local upload URLs)
+    upload_draft_ttl_seconds: int = 3600
+    resumable_upload_ttl_seconds: int = 86400  # resumable (chunked) uploads, see /v1/sightings/uploads
+    resumable_upload_lock_seconds: int = 60  # a PATCH's claim on an upload, renewed while bytes arrive
+    media_orphan_grace_seconds: int = 3600  # stored media no sighting uses is removed after this long
+    media_collect_interval_seconds: int = 600  # how often the media.collect task looks for it
+    upload_signing_secret: Optional[str] = None  # must be shared by all workers; random per worker if unset
+    
+    # Wikipedia enrichment is stored on the species row and refreshed after this long
+    species_wiki_cache_hours: int = 24
+    
+    # In-memory hot window of recent sightings (per worker, opt-in)
+    hot_window_enabled: bool = False
+    hot_window_hours: int = 25  # a bit over the map's 24h window so its queries qualify
+    hot_window_sweep_seconds: int = 30
+    
+    # Live sightings feed (WebSocket / server-sent events)
+    live_feed_queue_size: int = 64  # per connection; a slow client drops its oldest events
+    live_feed_keepalive_seconds: int = 15
+    live_feed_tail_seconds: float = 0  # > 0: tail the change log (needed with several workers)
+    
     mapbox_access_token: Optional[str] = None
     directions_provider: str = "mapbox"
     api_base_url: str = "http://127.0.0.1:8000"
@@ -45,6 +96,9 @@ class Settings(BaseSettings):
     aws_secret_access_key: Optional[str] = None
     aws_region: str = "us-east-2"
     aws_s3_bucket_name: Optional[str] = None
+    aws_s3_endpoint_url: Optional[str] = None  # S3-compatible server (MinIO, moto) instead of AWS
+    s3_max_connections: int = 16  # connection pool and upload threads per worker
+    s3_max_attempts: int = 4  # including retries of throttling, 5xx and connection errors
 
     # names of animals
     animal_names: List[str] = store_animal_names()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import QueuePool
@@ -49,6 +49,60 @@ def get_db():
     finally:
         db.close()
 
+def ensure_indexes(bind=None):
+    """Create indexes declared on the models that are missing from an existing database"""
+    bind = bind or engine
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=bind, checkfirst=True)
+            except Exception as e:
+                logger.error(f"Could not create index {index.name}: {e}")
+
+def ensure_columns(bind=None):
+    """Add nullable columns declared on the models that are missing from an existing table"""
+    bind = bind or engine
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=bind.dialect)
+            try:
+                with bind.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            except Exception as e:
+                logger.error(f"Could not add column {table.name}.{column.name}: {e}")
+
+def upsert_increment(db, table, rows, key_columns, increment_columns, replace_columns=(), where=None):
+    """
+    Insert ``rows`` into ``table``, adding ``increment_columns`` onto existing rows
+    that collide on ``key_columns`` and overwriting their ``replace_columns`` (only
+    rows matching ``where``, if given, are updated). One executemany statement on
+    SQLite and PostgreSQL; returns its result.
+    """
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={
+            **{name: table.c[name] + stmt.excluded[name] for name in increment_columns},
+            **{name: stmt.excluded[name] for name in replace_columns},
+        },
+        where=where,
+    )
+    return db.execute(stmt, rows)
+
 def test_connection():
     """Test database connection"""
     try:
@@ -5,18 +5,53 @@ import os
 from dotenv import load_dotenv
 
 from app.routers import species, sightings, routing, identify, user, animalsearch
-from app.database import engine, Base
+from app.database import engine, Base, ensure_columns, ensure_indexes, SessionLocal
 from app.config import settings
+from app.services.spatial_index import ensure_spatial_index
+from app.services.hot_window import run_sweeper
+from app.services.live_feed import run_change_tail
+from app.services.media_upload import UploadSizeLimitMiddleware, schedule_collection
+from app.services import thumbnails
+from app.services.task_queue import task_runner
+import asyncio
+from contextlib import asynccontextmanager
 
 load_dotenv()
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+ensure_columns(engine)
+ensure_indexes(engine)
+ensure_spatial_index(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop in-process background tasks"""
+    tasks = []
+    if settings.hot_window_enabled:
+        # The first sweep loads the window from the database
+        tasks.append(asyncio.create_task(run_sweeper(SessionLocal, settings.hot_window_sweep_seconds)))
+    if settings.live_feed_tail_seconds > 0:
+        tasks.append(asyncio.create_task(run_change_tail(SessionLocal, settings.live_feed_tail_seconds)))
+    if settings.task_runner_enabled:
+        # Thumbnails and species enrichment queued by the routes (services/task_queue.py),
+        # and the periodic collection of unused media
+        db = SessionLocal()
+        try:
+            schedule_collection(db)
+        finally:
+            db.close()
+        tasks.append(asyncio.create_task(task_runner.run(SessionLocal)))
+    yield
+    for task in tasks:
+        task.cancel()
+    thumbnails.shutdown()
 
 app = FastAPI(
     title="Animal Explorer API",
     description="Backend API for Animal Explorer iOS app",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -28,6 +63,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads before their body is parsed
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/v1/sightings/create"])
+
 # Include routers
 app.include_router(species.router, prefix="/v1/species", tags=["species"])
 app.include_router(sightings.router, prefix="/v1/sightings", tags=["sightings"])
@@ -1,6 +1,8 @@
-from sqlalchemy import Column, String, DateTime, Boolean, Float, Integer, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, DateTime, Boolean, Float, Integer, ForeignKey, Text, JSON, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.services.spatial_index import register_spatial_index
+from app.services.change_log import register_change_log
 import uuid
 from datetime import datetime
 
@@ -15,6 +17,12 @@ class Species(Base):
     behavior = Column(Text, nullable=True)
     description = Column(Text, nullable=True)
     other_sources = Column(JSON, nullable=True)  # Array of links to other references
+    # Wikipedia enrichment (services/species_info.py)
+    english_name = Column(String, nullable=True)
+    wiki_description = Column(Text, nullable=True)
+    main_image = Column(String, nullable=True)
+    enriched_at = Column(DateTime, nullable=True)  # null until enriched once
+    enrich_requested_at = Column(DateTime, nullable=True)  # when the last species.enrich task was queued
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -32,6 +40,8 @@ class Sighting(Base):
     taken_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     is_private = Column(Boolean, nullable=False, default=False)
     media_url = Column(String, nullable=True)  # Image/photo URL
+    media_thumb_url = Column(String, nullable=True)  # Resized variants of the photo (services/thumbnails.py)
+    media_medium_url = Column(String, nullable=True)
     audio_url = Column(String, nullable=True)  # Audio recording URL
     caption = Column(Text, nullable=True)  # Optional caption
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -41,6 +51,18 @@ class Sighting(Base):
     route_waypoints = relationship("RouteWaypoint", back_populates="sighting")
     user = relationship("User", back_populates="sightings")
 
+    # Keyset pagination orders by (taken_at DESC, id DESC); both indexes serve that order
+    __table_args__ = (
+        Index("ix_sightings_taken_at_id", "taken_at", "id"),
+        Index("ix_sightings_username_taken_at_id", "username", "taken_at", "id"),
+        # Covers the "nearest sightings of a rare species" scan (see services/nearby.py)
+        Index("ix_sightings_species_lat_lon", "species_id", "lat", "lon", "id"),
+        # Finds display variants already made for the same (deduplicated) photo
+        Index("ix_sightings_media_url", "media_url"),
+    )
+
+register_spatial_index(Sighting.__table__)
+
 class Route(Base):
     __tablename__ = "routes"
     
@@ -80,3 +102,114 @@ class User(Base):
     username = Column(String, primary_key=True, index=True, unique=True, nullable=False)
 
     sightings = relationship("Sighting", back_populates="user")
+
+class SightingGridCell(Base):
+    """Pre-aggregated sightings per web-mercator grid cell, one row per (zoom, x, y)"""
+    __tablename__ = "sighting_grid_cells"
+
+    zoom = Column(Integer, primary_key=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    lat_sum = Column(Float, nullable=False, default=0.0)  # centroid = lat_sum / count
+    lon_sum = Column(Float, nullable=False, default=0.0)
+    version = Column(Integer, nullable=False, default=0)  # bumped on every change, used for tile ETags
+
+class SightingGridSpecies(Base):
+    """Per-species counts inside a grid cell, used to pick a cluster's top species"""
+    __tablename__ = "sighting_grid_species"
+
+    zoom = Column(Integer, primary_key=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    species_id = Column(Integer, ForeignKey("species.id"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class SightingDensityCell(Base):
+    """Rolling per-hour sighting counts on a fine grid, used for hotspot detection"""
+    __tablename__ = "sighting_density_cells"
+
+    bucket = Column(DateTime, primary_key=True)  # Start of the hour (UTC)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    lat_sum = Column(Float, nullable=False, default=0.0)
+    lon_sum = Column(Float, nullable=False, default=0.0)
+
+class SightingChange(Base):
+    """Append-only log of sighting inserts, updates and deletes, ordered by seq"""
+    __tablename__ = "sighting_changes"
+    __table_args__ = {"sqlite_autoincrement": True}  # never reuse a seq after deletes
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    sighting_id = Column(String, nullable=False, index=True)
+    op = Column(String, nullable=False)  # "insert", "update" or "delete"
+    lat = Column(Float, nullable=False)  # Position at the time of the change, for area filters
+    lon = Column(Float, nullable=False)
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+register_change_log(Sighting, SightingChange)
+
+class SightingDraft(Base):
+    """Media uploaded straight to storage, waiting to be finalized into a sighting"""
+    __tablename__ = "sighting_drafts"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    photo_key = Column(String, nullable=True)  # S3 key, or local path under uploads/
+    audio_key = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class ResumableUpload(Base):
+    """A media file uploaded in chunks over several requests, tus-style (services/resumable_upload.py)"""
+    __tablename__ = "resumable_uploads"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = Column(String, nullable=False)  # "photo" or "audio"
+    key = Column(String, nullable=False)  # S3 key, or local path under uploads/, of the finished file
+    content_type = Column(String, nullable=False)
+    length = Column(Integer, nullable=False)  # declared size in bytes
+    offset = Column(Integer, nullable=False, default=0)  # bytes received and stored; complete at length
+    s3_upload_id = Column(String, nullable=True)  # S3 multipart upload the parts are added to
+    parts = Column(JSON, nullable=True)  # [{"ETag", "PartNumber"}] uploaded so far
+    locked_by = Column(String, nullable=True)  # claim token of the PATCH appending to it
+    locked_until = Column(DateTime, nullable=True)  # when that claim lapses unless renewed
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class Media(Base):
+    """A stored media object, keyed by the SHA-256 of its content and shared by every sighting that uploaded it"""
+    __tablename__ = "media"
+
+    sha256 = Column(String, primary_key=True)
+    url = Column(String, nullable=False)  # S3 URL, or local path under uploads/
+    size = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=True)
+    refcount = Column(Integer, nullable=False, default=0)  # sightings created with it
+    reserved_at = Column(DateTime, nullable=True)  # last time a request stored or reused it
+    stored_at = Column(DateTime, nullable=True)  # null while the file is being written
+    collecting_at = Column(DateTime, nullable=True)  # set while collect_orphans removes the file
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Unreferenced media, collected once its last reservation is old (services/media_upload.py)
+        Index("ix_media_refcount_reserved_at", "refcount", "reserved_at"),
+    )
+
+class Task(Base):
+    """Durable queue of follow-up work, claimed and run by the in-process runners (services/task_queue.py)"""
+    __tablename__ = "tasks"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)  # name a handler was registered under
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String, nullable=False, default="queued")  # "queued", "running" or "failed"
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # due time; while running, when the claim lapses
+    claimed_by = Column(String, nullable=True)  # claim token of the runner working on it
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_tasks_kind_status_run_at", "kind", "status", "run_at"),
+    )
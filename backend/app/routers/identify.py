@@ -6,8 +6,10 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from app.database import get_db
-from app.routers.species import _enrich_with_wikipedia_with_image
+from app.routers.species import _enrich_with_wikipedia_with_image, _fetch_taxon_name
 from app.models import Species
+from app.services.species_info import needs_enrichment, request_enrichment, save_wiki, wiki_details
+from app.services.task_queue import enqueue, task_handler
 
 router = APIRouter()
 
@@ -28,8 +30,8 @@ def _require_api_key():
         raise HTTPException(status_code=500, detail="Missing OPENAI_API_KEY environment variable")
 
 
-def _get_or_create_species(db: Session, label: str, wiki_data: Optional[Dict[str, Any]]) -> Optional[int]:
-    """Ensure we have a Species row for the identified label and return its id."""
+def _get_or_create_species(db: Session, label: str) -> Optional[Species]:
+    """Ensure we have a Species row for the identified label and return it."""
 
     if not label or label == FAIL_LABEL:
         return None
@@ -40,28 +42,50 @@ def _get_or_create_species(db: Session, label: str, wiki_data: Optional[Dict[str
         .first()
     )
     if species:
-        return species.id
-
-    scientific = label
-    description = None
-    other_sources = None
-
-    if wiki_data:
-        scientific = wiki_data.get("species") or scientific
-        description = wiki_data.get("description")
-        other_sources = wiki_data.get("other_sources")
-
-    species = Species(
-        common_name=label,
-        scientific_name=scientific,
-        description=description,
-        other_sources=other_sources,
-    )
+        return species
+
+    # Wikipedia details (and the scientific name, when Wikidata has it) are filled in by
+    # the species.enrich task
+    species = Species(common_name=label, scientific_name=label)
 
     db.add(species)
     db.commit()
     db.refresh(species)
-    return species.id
+    return species
+
+
+def _species_result(db: Session, label: str) -> Dict[str, Any]:
+    """
+    Response for an identified label. Wikipedia data comes from the species row; until
+    the species has been enriched a species.enrich task (one across all workers) fetches
+    it in the background and ``wiki_data`` is null.
+    """
+    species = _get_or_create_species(db, label)
+    if species is None:
+        return {"label": label, "species_id": None, "wiki_data": None}
+    wiki_data = wiki_details(species)
+    if needs_enrichment(species) and request_enrichment(db, species.id):
+        enqueue(db, "species.enrich", {"species_id": species.id, "label": label})
+        db.commit()
+    return {"label": label, "species_id": species.id, "wiki_data": wiki_data}
+
+
+@task_handler("species.enrich")
+async def _enrich_species(db: Session, payload: Dict[str, Any]) -> None:
+    """Fetch Wikipedia data for an identified species and store it on the species row."""
+    species = db.get(Species, payload["species_id"])
+    if species is None or not needs_enrichment(species):
+        return
+    label = payload["label"]
+    wiki_data = await _enrich_with_wikipedia_with_image(label)
+    if not save_wiki(species, wiki_data):
+        return
+    # Species created from a label carry it as a placeholder scientific name
+    if species.scientific_name == label:
+        scientific_name = await _fetch_taxon_name(wiki_data)
+        if scientific_name:
+            species.scientific_name = scientific_name
+    db.commit()
 
 # ------------------ OpenAI ------------------
 
@@ -184,9 +208,7 @@ async def identify_photo(
         if label == FAIL_LABEL:
             return {"label": label, "species_id": None, "wiki_data": None}
 
-        wiki_data = await _enrich_with_wikipedia_with_image(label)
-        species_id = _get_or_create_species(db, label, wiki_data)
-        return {"label": label, "species_id": species_id, "wiki_data": wiki_data}
+        return _species_result(db, label)
     except HTTPException:
         raise
     except Exception as e:
@@ -218,9 +240,7 @@ async def identify_audio(
         if label == FAIL_LABEL:
             return {"label": label, "species_id": None, "wiki_data": None}
 
-        wiki_data = await _enrich_with_wikipedia_with_image(label)
-        species_id = _get_or_create_species(db, label, wiki_data)
-        return {"label": label, "species_id": species_id, "wiki_data": wiki_data}
+        return _species_result(db, label)
     except HTTPException:
         raise
     except Exception as e:
@@ -261,14 +281,7 @@ async def identify_photo_and_audio(
                 "wiki_data": None,
             }
 
-        wiki_data = await _enrich_with_wikipedia_with_image(final_label)
-        species_id = _get_or_create_species(db, final_label, wiki_data)
-
-        return {
-            "label": final_label,
-            "species_id": species_id,
-            "wiki_data": wiki_data,
-        }
+        return _species_result(db, final_label)
 
     except HTTPException:
         raise
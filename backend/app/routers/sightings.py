@@ -1,20 +1,285 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form, Header, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import asyncio
+import json
 import uuid
 import os
 from app.database import get_db
 from app.models import Sighting as SightingModel, Species
-from app.schemas import Sighting, SightingList, SightingCreate, SightingFilter, SightingDetail
-from app.services.s3_service import S3Service
+from app.schemas import Sighting, SightingList, SightingCreate, SightingFilter, SightingDetail, SightingClusterList, HotspotList, HotWindowStats, SightingDeltaList, SightingViewportQuery, SightingViewportList, SightingFacets, NearbySightingList, SightingBatchQuery, SightingBatch, SightingWithSpecies, SightingDraftCreate, SightingDraftUploads, SightingDraftFinalize, SightingUploadFinalize, SightingIngestReport
+from app.services.media_upload import UploadTooLarge, record_media, store_local_stream, store_uploads
+from app.services.direct_upload import KINDS as DRAFT_KINDS, DraftError, create_draft, finalize_draft, local_upload_path, max_bytes as draft_max_bytes, verify_signature
+from app.services.spatial_index import bbox_filter
+from app.services.pagination import apply_keyset, decode_cursor, encode_cursor, InvalidCursor
+from app.services.hot_window import hot_window
+from app.services.change_log import changes_since
+from app.services.live_feed import live_feed, event_stream
+from app.services.export import EXPORT_FORMATS, ExportUnavailable, export_statement, export_stream
+from app.services.viewports import query_viewports, query_viewports_in_memory
+from app.services.serialization import COMPACT_MEDIA_TYPE, dump_compact, dump_page, rows_to_dicts, select_columns, wants_compact
+from app.services.fields import InvalidFields, parse_fields
+from app.services.sighting_grid import add_sighting_to_grid, cell_version, query_clusters, tile_bounds
+from app.services.hotspots import add_sighting_to_density, query_hotspots
+from app.services.facets import BUCKETS, query_facets
+from app.services.nearby import NearbyFilters, query_knn, query_radius
+from app.services.species_info import species_bundle
+from app.services import thumbnails
+from app.services.bulk_ingest import ManifestError, ingest, parse_manifest
+from app.services.group_commit import SpeciesNotFound, group_committer
+from app.services import resumable_upload
+from app.services.resumable_upload import TUS_EXTENSIONS, TUS_VERSION, UploadError
+from app.services.tiles import build_tile, tile_cache, tile_etag, TILE_MEDIA_TYPE
 from app.config import settings
 
 router = APIRouter()
 
-# Initialize S3 service
-s3_service = S3Service()
+def _parse_area(area: str):
+    """Parse a 'west,south,east,north' bounding box"""
+    try:
+        west, south, east, north = map(float, area.split(','))
+        return west, south, east, north
+    except (ValueError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid area format. Expected: west,south,east,north. Error: {str(e)}")
+
+def _parse_time(value: str, name: str) -> datetime:
+    """Parse an ISO 8601 timestamp (a trailing Z is accepted)"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} format: {str(e)}")
+
+def _save_sighting(db: Session, sighting: SightingModel) -> SightingModel:
+    """Insert a new sighting with its grid and density counts, then tell in-process readers"""
+    db.add(sighting)
+    add_sighting_to_grid(db, sighting)
+    add_sighting_to_density(db, sighting)
+    db.flush()
+    # Thumb and medium versions of the photo are made by a task runner after the response
+    thumbnails.schedule(db, [sighting])
+    db.commit()
+    db.refresh(sighting)
+    
+    if settings.hot_window_enabled:
+        hot_window.append(sighting)
+    if settings.live_feed_tail_seconds <= 0:
+        live_feed.publish_sighting(sighting)
+    return sighting
+
+def _announce_rows(rows: List[dict]) -> None:
+    """Tell in-process readers about sightings inserted as plain rows (bulk, group commit)"""
+    for row in rows:
+        if settings.hot_window_enabled:
+            hot_window.append(Sighting.model_validate(row).model_dump())
+        if settings.live_feed_tail_seconds <= 0:
+            live_feed.publish_sighting(row)
+
+@router.get("/clusters", response_model=SightingClusterList)
+async def get_sighting_clusters(
+    area: str = Query(..., description="Bounding box: west,south,east,north"),
+    zoom: int = Query(..., ge=0, le=22, description="Map zoom level"),
+    db: Session = Depends(get_db)
+):
+    """Get pre-aggregated sighting clusters (count, centroid, top species) for a map viewport"""
+    west, south, east, north = _parse_area(area)
+    level, clusters = query_clusters(db, west, south, east, north, zoom)
+    return SightingClusterList(zoom=level, items=clusters)
+
+@router.get("/hotspots", response_model=HotspotList)
+async def get_sighting_hotspots(
+    area: str = Query(..., description="Bounding box: west,south,east,north"),
+    start_time: Optional[str] = Query(None, description="ISO 8601, defaults to 30 days ago"),
+    end_time: Optional[str] = Query(None, description="ISO 8601, defaults to now"),
+    min_count: int = Query(3, ge=1, description="Sightings required for a cell to count as a hotspot"),
+    db: Session = Depends(get_db)
+):
+    """Get high-volume areas in a bbox and time window from the rolling density grid"""
+    west, south, east, north = _parse_area(area)
+    end = _parse_time(end_time, "end_time") if end_time else datetime.utcnow()
+    start = _parse_time(start_time, "start_time") if start_time else end - timedelta(days=30)
+    hotspots = query_hotspots(db, west, south, east, north, start, end, min_count)
+    return HotspotList(items=hotspots)
+
+@router.get("/nearby", response_model=NearbySightingList)
+async def get_nearby_sightings(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: Optional[float] = Query(None, gt=0, description="Only sightings within this distance"),
+    k: Optional[int] = Query(None, ge=1, description="Only the k nearest sightings"),
+    species_id: Optional[int] = Query(None),
+    start_time: Optional[str] = Query(None),
+    end_time: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Get sightings near a point, closest first: within `radius_m`, the `k` nearest, or the
+    `k` nearest within `radius_m`. Add `species_id` for the nearest sightings of one species.
+    """
+    if radius_m is None and k is None:
+        raise HTTPException(status_code=400, detail="Either radius_m or k must be provided")
+    limit = k if k is not None else settings.sightings_max_page_size
+    if limit > settings.sightings_max_page_size:
+        raise HTTPException(status_code=400, detail=f"k must be at most {settings.sightings_max_page_size}")
+
+    filters = NearbyFilters(
+        species_id=species_id,
+        start=_parse_time(start_time, "start_time") if start_time else None,
+        end=_parse_time(end_time, "end_time") if end_time else None,
+    )
+    if k is None:
+        items = query_radius(db, lat, lon, radius_m, limit, filters)
+    else:
+        items = query_knn(db, lat, lon, k, filters, radius_m)
+    return NearbySightingList(items=items)
+
+@router.get("/facets", response_model=SightingFacets)
+async def get_sighting_facets(
+    area: str = Query(..., description="Bounding box: west,south,east,north"),
+    start_time: Optional[str] = Query(None, description="ISO 8601, defaults to 30 days ago"),
+    end_time: Optional[str] = Query(None, description="ISO 8601, defaults to now"),
+    bucket: Optional[str] = Query(None, description="hour, day or week; picked from the time range if omitted"),
+    db: Session = Depends(get_db)
+):
+    """Get per-species sighting counts and a taken_at histogram for a bbox and time range"""
+    west, south, east, north = _parse_area(area)
+    if bucket is not None and bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Invalid bucket. Expected one of: {', '.join(BUCKETS)}")
+    end = _parse_time(end_time, "end_time") if end_time else datetime.utcnow()
+    start = _parse_time(start_time, "start_time") if start_time else end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start_time must be before end_time")
+    return query_facets(db, west, south, east, north, start, end, bucket)
+
+@router.get("/tiles/{z}/{x}/{y}", response_class=Response)
+async def get_sighting_tile(
+    z: int,
+    x: int,
+    y: int,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Get the sightings inside a slippy-map tile in the packed binary format (see app/services/tiles.py)"""
+    if not 0 <= z <= 22 or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+    
+    version = cell_version(db, z, x, y)
+    etag = tile_etag(z, x, y, version)
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    data = tile_cache.get((z, x, y), version)
+    if data is None:
+        data = build_tile(db, z, x, y)
+        tile_cache.put((z, x, y), version, data)
+    
+    return Response(content=data, media_type=TILE_MEDIA_TYPE, headers=headers)
+
+@router.get("/changes", response_model=SightingDeltaList)
+async def get_sighting_changes(
+    since: int = Query(0, ge=0, description="High-water mark from the previous sync (0 for a full sync)"),
+    area: Optional[str] = Query(None, description="Bounding box: west,south,east,north"),
+    limit: int = Query(1000, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """Get sightings inserted, updated or deleted since the client's last sync"""
+    bbox = _parse_area(area) if area else None
+    items, high_water_mark, has_more = changes_since(db, since, bbox, limit)
+    return SightingDeltaList(items=items, high_water_mark=high_water_mark, has_more=has_more)
+
+@router.get("/export")
+async def export_sightings(
+    format: str = Query("ndjson", description="ndjson, csv or parquet"),
+    area: Optional[str] = Query(None, description="Bounding box: west,south,east,north"),
+    species_id: Optional[int] = Query(None),
+    start_time: Optional[str] = Query(None),
+    end_time: Optional[str] = Query(None),
+    username: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Stream every sighting matching the filters (all of them if none), joined to its species"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Expected one of: {', '.join(EXPORT_FORMATS)}")
+
+    stmt = export_statement(
+        db.get_bind().dialect.name,
+        bbox=_parse_area(area) if area else None,
+        species_id=species_id,
+        start=_parse_time(start_time, "start_time") if start_time else None,
+        end=_parse_time(end_time, "end_time") if end_time else None,
+        username=username,
+    )
+    try:
+        chunks = export_stream(db, stmt, format)
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    filename = f"sightings-{datetime.utcnow():%Y%m%dT%H%M%S}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.websocket("/live")
+async def live_sightings(websocket: WebSocket, area: Optional[str] = None, species_id: Optional[int] = None):
+    """
+    Push new sightings inside a bbox (and optionally of one species) as JSON messages.
+    Send {"area": "west,south,east,north", "species_id": 3} to move the subscription.
+    """
+    try:
+        bbox = _parse_area(area) if area else None
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+
+    async def send_loop():
+        while True:
+            await websocket.send_text(await sub.queue.get())
+
+    await websocket.accept()
+    sub = sender = None
+    try:
+        sub = live_feed.subscribe(bbox, species_id)
+        sender = asyncio.create_task(send_loop())
+        while True:
+            message = await websocket.receive_text()
+            try:
+                update = json.loads(message)
+                new_area = update.get("area")
+                live_feed.update(sub, _parse_area(new_area) if new_area else None, update.get("species_id"))
+            except (HTTPException, ValueError, AttributeError):
+                await websocket.send_json({"error": "Expected a JSON object with area and/or species_id"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if sender is not None:
+            sender.cancel()
+        if sub is not None:
+            live_feed.unsubscribe(sub)
+
+@router.get("/live/stream")
+async def live_sightings_stream(
+    area: Optional[str] = Query(None, description="Bounding box: west,south,east,north"),
+    species_id: Optional[int] = Query(None)
+):
+    """Server-sent events version of /live for clients without WebSockets"""
+    bbox = _parse_area(area) if area else None
+    return StreamingResponse(
+        event_stream(live_feed, bbox, species_id, settings.live_feed_keepalive_seconds),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/hot-window", response_model=HotWindowStats)
+async def get_hot_window_stats():
+    """Report the row count and memory cost per row of this worker's hot window"""
+    return HotWindowStats(enabled=settings.hot_window_enabled, **hot_window.stats())
 
 @router.get("/{sighting_id}", response_model=SightingDetail)
 async def get_sighting(
@@ -49,32 +314,43 @@ async def get_sighting(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/", response_model=SightingList)
+@router.post("/", response_model=SightingList, responses={
+    200: {"content": {COMPACT_MEDIA_TYPE: {}}, "description": "SightingList, or parallel column arrays when the compact shape is accepted; with a `species` dict in bundle mode"}
+})
 async def get_sightings(
     filter_data: SightingFilter,
+    accept: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Get sightings filtered by area, species, time range, and/or username"""
+    """
+    Get sightings filtered by area, species, time range, and/or username
+    
+    Send `Accept: application/vnd.sightings.compact+json` to get parallel arrays per
+    column instead of one object per sighting.
+    
+    Set `bundle` to also get `species`: the distinct species referenced by the page,
+    keyed by id, with names and the cached Wikipedia description and image.
+    
+    Set `fields` (e.g. `"id,lat,lon,species_id"`) to select and return only those fields.
+    """
+    try:
+        fields = parse_fields(filter_data.fields, Sighting)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    compact = wants_compact(accept)
+    fast = compact or filter_data.bundle or fields is not None or settings.sightings_fast_serialization
     try:
         
         # Start with base query
         query = db.query(SightingModel)
+        bbox = start_dt = end_dt = None
         
 
         # Filter by area (bounding box) if provided
         if filter_data.area:
-            try:
-                west, south, east, north = map(float, filter_data.area.split(','))
-                query = query.filter(
-                    and_(
-                        SightingModel.lat >= south,
-                        SightingModel.lat <= north,
-                        SightingModel.lon >= west,
-                        SightingModel.lon <= east
-                    )
-                )
-            except (ValueError, AttributeError) as e:
-                raise HTTPException(status_code=400, detail=f"Invalid area format. Expected: west,south,east,north. Error: {str(e)}")
+            bbox = west, south, east, north = _parse_area(filter_data.area)
+            dialect = db.get_bind().dialect.name
+            query = query.filter(bbox_filter(SightingModel, dialect, west, south, east, north))
         
 
         # Filter by username if provided (may match multiple users if duplicates exist)
@@ -83,18 +359,12 @@ async def get_sightings(
         
         # Filter by time range if provided
         if filter_data.start_time:
-            try:
-                start_dt = datetime.fromisoformat(filter_data.start_time.replace('Z', '+00:00'))
-                query = query.filter(SightingModel.taken_at >= start_dt)
-            except ValueError as e:
-                raise HTTPException(status_code=400, detail=f"Invalid start_time format: {str(e)}")
+            start_dt = _parse_time(filter_data.start_time, "start_time")
+            query = query.filter(SightingModel.taken_at >= start_dt)
         
         if filter_data.end_time:
-            try:
-                end_dt = datetime.fromisoformat(filter_data.end_time.replace('Z', '+00:00'))
-                query = query.filter(SightingModel.taken_at <= end_dt)
-            except ValueError as e:
-                raise HTTPException(status_code=400, detail=f"Invalid end_time format: {str(e)}")
+            end_dt = _parse_time(filter_data.end_time, "end_time")
+            query = query.filter(SightingModel.taken_at <= end_dt)
         
 
         # Filter by species if provided
@@ -117,20 +387,366 @@ async def get_sightings(
         
         
         
-        # Order by most recent and limit results
-        query = query.order_by(SightingModel.taken_at.desc()).limit(100)
+        # Resume after the last row of the previous page
+        if filter_data.cursor:
+            try:
+                query = apply_keyset(query, SightingModel, filter_data.cursor)
+            except InvalidCursor as e:
+                raise HTTPException(status_code=400, detail=str(e))
         
-
-        # Debug: Log the query (optional, remove in production)
-        sightings = query.all()
+        page_size = settings.sightings_page_size if filter_data.limit is None else filter_data.limit
+        if not 1 <= page_size <= settings.sightings_max_page_size:
+            raise HTTPException(
+                status_code=400,
+                detail=f"limit must be between 1 and {settings.sightings_max_page_size}"
+            )
+        
+        if settings.hot_window_enabled and hot_window.covers(start_dt):
+            # Recent-window query: answer from the in-memory hot window, no SQL
+            sightings = hot_window.query(bbox, start_dt, end_dt, filter_data.species_id or None, filter_data.username or None)
+            if filter_data.cursor:
+                after = decode_cursor(filter_data.cursor)
+                sightings = [row for row in sightings if (row["taken_at"], row["id"]) < after]
+            sightings = sightings[:page_size + 1]
+            sort_key = lambda row: (row["taken_at"], row["id"])
+        else:
+            # Order by most recent (id breaks ties) and fetch one extra row to detect a next page
+            query = query.order_by(SightingModel.taken_at.desc(), SightingModel.id.desc()).limit(page_size + 1)
+            if fast:
+                # Plain column tuples instead of ORM objects, only the requested columns
+                columns = select_columns(fields, ("id", "taken_at", "species_id") if filter_data.bundle else ("id", "taken_at"))
+                sightings = rows_to_dicts(query.with_entities(*columns).all(), columns)
+                sort_key = lambda row: (row["taken_at"], row["id"])
+            else:
+                sightings = query.all()
+                sort_key = lambda row: (row.taken_at, row.id)
         
-        return SightingList(items=sightings)
+        next_cursor = None
+        if len(sightings) > page_size:
+            sightings = sightings[:page_size]
+            next_cursor = encode_cursor(*sort_key(sightings[-1]))
+        
+        species = species_bundle(db, (row["species_id"] for row in sightings)) if filter_data.bundle else None
+        if compact:
+            return Response(content=dump_compact(sightings, next_cursor, species, fields), media_type=COMPACT_MEDIA_TYPE, headers={"Vary": "Accept"})
+        if fast:
+            return Response(content=dump_page(sightings, next_cursor, species, fields), media_type="application/json", headers={"Vary": "Accept"})
+        return SightingList(items=sightings, next_cursor=next_cursor)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid filter format: {str(e)}")
 
+MAX_VIEWPORTS = 32
+
+@router.post("/viewports", response_model=SightingViewportList)
+async def get_sightings_for_viewports(
+    query: SightingViewportQuery,
+    db: Session = Depends(get_db)
+):
+    """
+    Get sightings for several viewports (bboxes and/or z/x/y tiles) at once, e.g. to
+    prefetch the areas around the visible map. Sightings in overlapping viewports are
+    returned once in `items`; each group lists the ids in its viewport.
+    """
+    labels = list(query.areas) + list(query.tiles)
+    if not labels:
+        raise HTTPException(status_code=400, detail="At least one area or tile must be provided")
+    if len(labels) > MAX_VIEWPORTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_VIEWPORTS} viewports per request")
+
+    bboxes = [_parse_area(area) for area in query.areas]
+    for tile in query.tiles:
+        try:
+            z, x, y = map(int, tile.split('/'))
+            if not (0 <= z <= 22 and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+                raise ValueError("tile out of range")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid tile format. Expected: z/x/y. Error: {str(e)}")
+        bboxes.append(tile_bounds(z, x, y))
+
+    limit = settings.sightings_page_size if query.limit is None else query.limit
+    if not 1 <= limit <= settings.sightings_max_page_size:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {settings.sightings_max_page_size}")
+
+    start_dt = _parse_time(query.start_time, "start_time") if query.start_time else None
+    end_dt = _parse_time(query.end_time, "end_time") if query.end_time else None
+    filters = dict(species_id=query.species_id or None, start=start_dt, end=end_dt, username=query.username or None)
+
+    if settings.hot_window_enabled and hot_window.covers(start_dt):
+        items, groups = query_viewports_in_memory(hot_window, bboxes, limit, **filters)
+    else:
+        items, groups = query_viewports(db, bboxes, limit, **filters)
+
+    return SightingViewportList(
+        items=items,
+        groups=[{"area": label, "ids": ids, "truncated": truncated} for label, (ids, truncated) in zip(labels, groups)],
+    )
+
+@router.post("/drafts", response_model=SightingDraftUploads)
+async def create_sighting_draft(
+    draft: SightingDraftCreate,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Start a sighting whose media goes straight to storage: returns one upload URL per
+    file (PUT the bytes there with the given headers), then call
+    POST /drafts/{draft_id}/finalize
+    """
+    files = {kind: file.model_dump() for kind, file in (("photo", draft.photo), ("audio", draft.audio)) if file}
+    if not files:
+        raise HTTPException(status_code=400, detail="At least one media file (photo or audio) is required")
+    try:
+        return await create_draft(
+            db, files, lambda draft_id, kind: str(request.url_for("upload_draft_file", draft_id=draft_id, kind=kind))
+        )
+    except DraftError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.put("/drafts/{draft_id}/{kind}", name="upload_draft_file")
+async def upload_draft_file(
+    draft_id: str,
+    kind: str,
+    request: Request,
+    expires: int = Query(...),
+    signature: str = Query(...),
+    db: Session = Depends(get_db)
+):
+    """Signed upload URL for local storage (used instead of S3 presigned URLs when S3 is not configured)"""
+    if kind not in DRAFT_KINDS or not verify_signature(draft_id, kind, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload URL")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > draft_max_bytes(kind):
+        raise HTTPException(status_code=413, detail=f"{kind} is larger than {draft_max_bytes(kind)} bytes")
+    try:
+        path = local_upload_path(db, draft_id, kind)
+        stored = await store_local_stream(request.stream(), path, draft_max_bytes(kind))
+    except DraftError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return {"size": stored.size, "sha256": stored.sha256}
+
+@router.post("/drafts/{draft_id}/finalize", response_model=Sighting)
+async def finalize_sighting_draft(
+    draft_id: str,
+    details: SightingDraftFinalize,
+    db: Session = Depends(get_db)
+):
+    """Create the sighting once the draft's media has been uploaded"""
+    species = db.query(Species).filter(Species.id == details.species_id).first()
+    if not species:
+        raise HTTPException(status_code=404, detail="Species not found")
+    try:
+        urls = await finalize_draft(db, draft_id)
+    except DraftError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    sighting = SightingModel(
+        species_id=details.species_id,
+        lat=details.lat,
+        lon=details.lon,
+        taken_at=datetime.utcnow(),
+        is_private=details.is_private,
+        username=details.username,
+        caption=details.caption,
+        **urls
+    )
+    return _save_sighting(db, sighting)
+
+def _tus_headers(upload=None, **headers) -> dict:
+    headers = {"Tus-Resumable": TUS_VERSION, **headers}
+    if upload is not None:
+        headers["Upload-Offset"] = str(upload.offset)
+        headers["Upload-Expires"] = format_datetime(upload.expires_at.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+def _check_tus_version(request: Request) -> None:
+    version = request.headers.get("tus-resumable")
+    if version is not None and version != TUS_VERSION:
+        raise HTTPException(status_code=412, detail=f"Only tus {TUS_VERSION} is supported",
+                            headers={"Tus-Version": TUS_VERSION})
+
+@router.options("/uploads")
+async def resumable_upload_options():
+    """tus discovery: protocol version, extensions and the largest upload accepted"""
+    return Response(status_code=204, headers={
+        "Tus-Resumable": TUS_VERSION,
+        "Tus-Version": TUS_VERSION,
+        "Tus-Extension": TUS_EXTENSIONS,
+        "Tus-Max-Size": str(max(draft_max_bytes(kind) for kind in DRAFT_KINDS)),
+    })
+
+@router.post("/uploads", status_code=201)
+async def create_resumable_upload(
+    request: Request,
+    upload_length: Optional[str] = Header(None),
+    upload_metadata: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Start a resumable (tus) upload of `Upload-Length` bytes. `Upload-Metadata` carries the
+    `filename` and optionally `filetype` or `kind` (photo/audio), base64-encoded. PATCH the
+    bytes to the returned Location, then call POST /uploads/finalize
+    """
+    _check_tus_version(request)
+    if upload_length is None or not upload_length.isdigit():
+        raise HTTPException(status_code=400, detail="Upload-Length is required")
+    try:
+        upload = await resumable_upload.create_upload(
+            db, int(upload_length), resumable_upload.parse_metadata(upload_metadata)
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=_tus_headers())
+    location = str(request.url_for("resumable_upload", upload_id=upload.id))
+    return Response(status_code=201, headers=_tus_headers(upload, Location=location))
+
+@router.head("/uploads/{upload_id}", name="resumable_upload")
+async def get_resumable_upload_offset(upload_id: str, db: Session = Depends(get_db)):
+    """Progress of a resumable upload: resume PATCHing from `Upload-Offset`"""
+    try:
+        upload = resumable_upload.get_upload(db, upload_id)
+    except UploadError as e:
+        return Response(status_code=e.status_code, headers=_tus_headers())
+    return Response(status_code=200, headers=_tus_headers(
+        upload, **{"Upload-Length": str(upload.length), "Cache-Control": "no-store"}
+    ))
+
+@router.patch("/uploads/{upload_id}")
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: Optional[str] = Header(None),
+    content_type: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Send the next bytes of a resumable upload, starting at `Upload-Offset` (as last
+    acknowledged), with Content-Type application/offset+octet-stream. Bytes that arrived
+    before a dropped connection are kept: check the offset with HEAD and continue from there
+    """
+    _check_tus_version(request)
+    if content_type != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type must be application/offset+octet-stream")
+    if upload_offset is None or not upload_offset.isdigit():
+        raise HTTPException(status_code=400, detail="Upload-Offset is required")
+    try:
+        upload = await resumable_upload.append(db, upload_id, int(upload_offset), request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=_tus_headers())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e), headers=_tus_headers())
+    return Response(status_code=204, headers=_tus_headers(upload))
+
+@router.delete("/uploads/{upload_id}", status_code=204)
+async def delete_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Abandon a resumable upload and remove what was uploaded"""
+    try:
+        await resumable_upload.delete_upload(db, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=_tus_headers())
+    return Response(status_code=204, headers=_tus_headers())
+
+@router.post("/uploads/finalize", response_model=Sighting)
+async def finalize_resumable_uploads(
+    details: SightingUploadFinalize,
+    db: Session = Depends(get_db)
+):
+    """Create the sighting from finished resumable uploads (`photo_upload_id` and/or `audio_upload_id`)"""
+    if not details.photo_upload_id and not details.audio_upload_id:
+        raise HTTPException(status_code=400, detail="At least one media file (photo or audio) is required")
+    species = db.query(Species).filter(Species.id == details.species_id).first()
+    if not species:
+        raise HTTPException(status_code=404, detail="Species not found")
+    try:
+        urls = await resumable_upload.finalize_uploads(
+            db, {"photo": details.photo_upload_id, "audio": details.audio_upload_id}
+        )
+    except UploadError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    sighting = SightingModel(
+        species_id=details.species_id,
+        lat=details.lat,
+        lon=details.lon,
+        taken_at=datetime.utcnow(),
+        is_private=details.is_private,
+        username=details.username,
+        caption=details.caption,
+        **urls
+    )
+    return _save_sighting(db, sighting)
+
+@router.post("/bulk", response_model=SightingIngestReport)
+async def bulk_ingest_sightings(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Import many sightings in one request. The manifest (a JSON array of rows, or NDJSON
+    with one row per line) is the body, or the `manifest` part of a multipart/form-data
+    request whose other parts are the media files rows refer to by part name in `photo`
+    and `audio`. Valid rows are inserted together; every row gets a result.
+    """
+    form = None
+    files = {}
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form(max_files=settings.bulk_ingest_max_rows * 2, max_fields=10)
+            manifest = form.get("manifest")
+            if manifest is None:
+                raise HTTPException(status_code=400, detail="Missing manifest part")
+            text = manifest if isinstance(manifest, str) else (await manifest.read()).decode("utf-8")
+            files = {name: value for name, value in form.multi_items() if name != "manifest" and not isinstance(value, str)}
+        else:
+            text = (await request.body()).decode("utf-8")
+        entries = parse_manifest(text)
+        if len(entries) > settings.bulk_ingest_max_rows:
+            raise HTTPException(status_code=413, detail=f"At most {settings.bulk_ingest_max_rows} rows per request")
+        report, rows = await ingest(db, entries, files)
+    except (ManifestError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if form is not None:
+            await form.close()
+
+    _announce_rows(rows)
+    return report
+
+MAX_BATCH_IDS = 500
+
+@router.post("/batch", response_model=SightingBatch)
+async def get_sightings_batch(
+    query: SightingBatchQuery,
+    db: Session = Depends(get_db)
+):
+    """
+    Get several sightings by id, with their species, in one query. `items` follows the
+    order of `ids`, with null for every id that was not found (also listed in `missing`).
+    """
+    if len(query.ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+
+    found = {}
+    if query.ids:
+        sightings = db.query(SightingModel).options(joinedload(SightingModel.species)).filter(
+            SightingModel.id.in_(set(query.ids))
+        ).all()
+        found = {sighting.id: SightingWithSpecies.model_validate(sighting) for sighting in sightings}
+
+    return SightingBatch(
+        items=[found.get(sighting_id) for sighting_id in query.ids],
+        missing=list(dict.fromkeys(sighting_id for sighting_id in query.ids if sighting_id not in found)),
+    )
+
 @router.post("/create", response_model=Sighting)
 async def create_sighting(
     species_id: int = Form(...),
@@ -158,62 +774,54 @@ async def create_sighting(
         audio: Optional audio file
     """
     try:
-        # Verify species exists
-        species = db.query(Species).filter(Species.id == species_id).first()
-        if not species:
-            raise HTTPException(status_code=404, detail="Species not found")
+        # Verify species exists (a group commit checks the species of the whole group at once)
+        if not settings.group_commit_enabled:
+            species = db.query(Species).filter(Species.id == species_id).first()
+            if not species:
+                raise HTTPException(status_code=404, detail="Species not found")
         
         # Require at least one media file
         if not photo and not audio:
             raise HTTPException(status_code=400, detail="At least one media file (photo or audio) is required")
         
-        media_url = None
-        audio_url = None
-        
-        # Upload photo to S3 if provided
+        # Stream both files to storage at once, in chunks (size-limited and hashed on the
+        # way); content that is already stored is not written again
+        uploads = []
         if photo:
-            photo_content = await photo.read()
-            photo_filename = f"{uuid.uuid4()}_{photo.filename}"
-            content_type = s3_service.get_content_type(photo.filename)
-            
-            if settings.aws_s3_bucket_name:
-                # Use S3
-                print("using aws")
-                media_url = await s3_service.upload_file(
-                    file_content=photo_content,
-                    file_name=photo_filename,
-                    content_type=content_type,
-                    folder="sightings/photos"
-                )
-            else:
-                # Fallback to local storage
-                os.makedirs("uploads/photos", exist_ok=True)
-                file_path = f"uploads/photos/{photo_filename}"
-                with open(file_path, "wb") as buffer:
-                    buffer.write(photo_content)
-                media_url = file_path
-        
-        # Upload audio to S3 if provided
+            uploads.append((photo, "photos", settings.media_max_photo_bytes))
         if audio:
-            audio_content = await audio.read()
-            audio_filename = f"{uuid.uuid4()}_{audio.filename}"
-            content_type = s3_service.get_content_type(audio.filename)
-            
-            if settings.aws_s3_bucket_name:
-                # Use S3
-                audio_url = await s3_service.upload_file(
-                    file_content=audio_content,
-                    file_name=audio_filename,
-                    content_type=content_type,
-                    folder="sightings/audio"
-                )
-            else:
-                # Fallback to local storage
-                os.makedirs("uploads/audio", exist_ok=True)
-                file_path = f"uploads/audio/{audio_filename}"
-                with open(file_path, "wb") as buffer:
-                    buffer.write(audio_content)
-                audio_url = file_path
+            uploads.append((audio, "audio", settings.media_max_audio_bytes))
+        try:
+            stored = await store_uploads(db, uploads)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        media_url = stored[0].url if photo else None
+        audio_url = stored[-1].url if audio else None
+        
+        if settings.group_commit_enabled:
+            # Give the connection back while waiting: the group needs one to commit
+            db.rollback()
+            now = datetime.utcnow()
+            try:
+                row = await group_committer.create(db.get_bind(), {
+                    "id": str(uuid.uuid4()),
+                    "username": username,
+                    "species_id": species_id,
+                    "lat": lat,
+                    "lon": lon,
+                    "taken_at": now,
+                    "is_private": is_private,
+                    "media_url": media_url,
+                    "media_thumb_url": None,
+                    "media_medium_url": None,
+                    "audio_url": audio_url,
+                    "caption": caption,
+                    "created_at": now,
+                }, stored)
+            except SpeciesNotFound as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            _announce_rows([row])
+            return row
         
         # Create sighting
         sighting = SightingModel(
@@ -229,13 +837,11 @@ async def create_sighting(
             audio_url=audio_url
         )
         
-        db.add(sighting)
-        db.commit()
-        db.refresh(sighting)
-        
-        return sighting
+        record_media(db, stored)
+        return _save_sighting(db, sighting)
         
     except HTTPException:
+        # Stored media nothing references is collected later (media_upload.collect_orphans)
         db.rollback()
         raise
     except Exception as e:
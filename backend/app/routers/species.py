@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import List, Optional, Dict, Any
@@ -6,11 +6,14 @@ import httpx
 from app.database import get_db
 from app.models import Species as SpeciesModel
 from app.schemas import Species, SpeciesSearch, SpeciesDetail, SpeciesDetails, ImageLink
+from app.services.species_info import needs_enrichment, save_wiki, wiki_details
+from app.services.fields import InvalidFields, columns_for, parse_fields, sparse_list_adapter, sparse_row_adapter
 
 router = APIRouter()
 
 WIKI_SUMMARY_URL = "https://en.wikipedia.org/api/rest_v1/page/summary/{title}"
 WIKI_SEARCH_URL = "https://en.wikipedia.org/w/api.php"
+WIKIDATA_ENTITY_URL = "https://www.wikidata.org/wiki/Special:EntityData/{item}.json"
 
 DEFAULT_UA = "AnimalExplorer/1.0 (contact: ios-app)"
 HTTP_TIMEOUT = 8.0 # seconds
@@ -49,6 +52,25 @@ async def _search_wikipedia_title(q: str) -> Optional[str]:
         return search[0].get("title")
 
 
+async def _fetch_taxon_name(wiki: Dict[str, Any]) -> Optional[str]:
+    """Scientific name (Wikidata taxon name, P225) of the item linked from ``other_sources``, or None"""
+    prefix = "https://www.wikidata.org/wiki/"
+    items = [url[len(prefix):] for url in wiki.get("other_sources") or [] if url.startswith(prefix)]
+    if not items:
+        return None
+    headers = {"User-Agent": DEFAULT_UA, "Accept": "application/json"}
+    async with httpx.AsyncClient(timeout=HTTP_TIMEOUT, headers=headers) as client:
+        r = await client.get(WIKIDATA_ENTITY_URL.format(item=items[0]))
+        if r.status_code != 200:
+            return None
+        entity = r.json().get("entities", {}).get(items[0], {})
+    for claim in entity.get("claims", {}).get("P225", []):
+        value = claim.get("mainsnak", {}).get("datavalue", {}).get("value")
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+
 def _extract_fields_from_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
     """
     Extract from  summary JSON:
@@ -125,26 +147,48 @@ async def _enrich_with_wikipedia(scientific_name: str) -> Dict[str, Any]:
     return {"english_name": None, "description": None, "other_sources": []}
 
 
+def _parse_species_fields(fields: Optional[str]):
+    try:
+        return parse_fields(fields, Species)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/", response_model=SpeciesSearch)
 async def search_species(
     q: str = Query(..., description="Search query"),
     limit: int = Query(10, ge=1, le=50),
+    fields: Optional[str] = Query(None, description="Only these fields, e.g. id,common_name"),
     db: Session = Depends(get_db)
 ):
     """Search species by common or scientific name"""
+    fields = _parse_species_fields(fields)
     query = db.query(SpeciesModel).filter(
         func.lower(SpeciesModel.common_name).contains(q.lower()) |
         func.lower(SpeciesModel.scientific_name).contains(q.lower())
     ).limit(limit)
     
+    if fields is not None:
+        columns = columns_for(SpeciesModel, fields)
+        rows = [dict(zip(columns, row)) for row in query.with_entities(*columns.values()).all()]
+        return Response(content=sparse_list_adapter(Species, fields).dump_json({"items": rows}), media_type="application/json")
+    
     species_list = query.all()
     return SpeciesSearch(items=species_list)
 
 @router.get("/id/{species_id}", response_model=Species)
 async def get_species_by_id(
     species_id: int,
+    fields: Optional[str] = Query(None, description="Only these fields, e.g. id,common_name"),
     db: Session = Depends(get_db)
 ):
+    fields = _parse_species_fields(fields)
+    if fields is not None:
+        columns = columns_for(SpeciesModel, fields)
+        row = db.query(*columns.values()).filter(SpeciesModel.id == species_id).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Species not found")
+        return Response(content=sparse_row_adapter(Species, fields).dump_json(dict(zip(columns, row))), media_type="application/json")
+    
     species = db.query(SpeciesModel).filter(SpeciesModel.id == species_id).first()
     if not species:
         raise HTTPException(status_code=404, detail="Species not found")
@@ -162,8 +206,13 @@ async def get_species(
     
     scientific_name = getattr(species, "scientific_name", None)
     
-    # Enrich with Wikipedia data
-    wiki = await _enrich_with_wikipedia_with_image(scientific_name)
+    # Enrich with Wikipedia data (stored on the species row, refreshed when stale)
+    wiki = wiki_details(species)
+    if wiki is None or needs_enrichment(species):
+        fetched = await _enrich_with_wikipedia_with_image(scientific_name)
+        if save_wiki(species, fetched):
+            db.commit()
+        wiki = wiki_details(species) or fetched
     
     # Return the species details with image
     return SpeciesDetails(
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # Species schemas
@@ -58,6 +58,7 @@ class Sighting(SightingBase):
     id: str
     username: Optional[str] = None
     media_thumb_url: Optional[str] = None
+    media_medium_url: Optional[str] = None
     media_url: Optional[str] = None
     caption: Optional[str] = None
     created_at: datetime
@@ -78,6 +79,7 @@ class SightingDetail(BaseModel):
 
 class SightingList(BaseModel):
     items: List[Sighting]
+    next_cursor: Optional[str] = None  # Pass back as `cursor` to get the next page
 
 class SightingFilter(BaseModel):
     area: Optional[str] = None
@@ -85,6 +87,165 @@ class SightingFilter(BaseModel):
     start_time: Optional[str] = None
     end_time: Optional[str] = None
     username: Optional[str] = None
+    cursor: Optional[str] = None  # Opaque token from a previous page's next_cursor
+    limit: Optional[int] = None  # Page size (defaults to settings.sightings_page_size)
+    bundle: bool = False  # Also return the referenced species, keyed by id
+    fields: Optional[str] = None  # Sparse fieldset, e.g. "id,lat,lon,species_id"
+
+class NearbySighting(Sighting):
+    distance_m: float  # Great-circle distance from the query point
+
+class NearbySightingList(BaseModel):
+    items: List[NearbySighting]  # Closest first
+
+class SpeciesSummary(SpeciesBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+class SightingWithSpecies(Sighting):
+    species: SpeciesSummary
+
+class SightingBatchQuery(BaseModel):
+    ids: List[str]
+
+class SightingBatch(BaseModel):
+    items: List[Optional[SightingWithSpecies]]  # One per requested id, in request order; null if not found
+    missing: List[str]  # Requested ids that were not found
+
+class SightingDraftFile(BaseModel):
+    filename: str
+    size: Optional[int] = None  # Checked against the size limit up front when given
+
+class SightingDraftCreate(BaseModel):
+    photo: Optional[SightingDraftFile] = None
+    audio: Optional[SightingDraftFile] = None
+
+class SightingDraftUpload(BaseModel):
+    url: str
+    method: str  # Always "PUT"
+    headers: Dict[str, str]  # Send these with the upload
+
+class SightingDraftUploads(BaseModel):
+    draft_id: str
+    expires_at: datetime  # Upload and finalize before this
+    uploads: Dict[str, SightingDraftUpload]  # "photo" and/or "audio"
+
+class SightingDraftFinalize(BaseModel):
+    species_id: int
+    lat: float
+    lon: float
+    is_private: bool = False
+    username: Optional[str] = None
+    caption: Optional[str] = None
+
+class SightingUploadFinalize(SightingDraftFinalize):
+    photo_upload_id: Optional[str] = None  # Finished resumable uploads (POST /v1/sightings/uploads)
+    audio_upload_id: Optional[str] = None
+
+class SightingIngestItem(BaseModel):
+    """One row of a bulk ingest manifest"""
+    species_id: int
+    lat: float
+    lon: float
+    username: str
+    taken_at: Optional[datetime] = None  # Defaults to the time of the import
+    is_private: bool = False
+    caption: Optional[str] = None
+    photo: Optional[str] = None  # Name of a multipart part holding the photo
+    audio: Optional[str] = None  # Name of a multipart part holding the audio
+
+class SightingIngestResult(BaseModel):
+    index: int  # Position in the manifest
+    status: str  # "created" or "error"
+    id: Optional[str] = None
+    detail: Optional[str] = None
+
+class SightingIngestReport(BaseModel):
+    created: int
+    failed: int
+    results: List[SightingIngestResult]
+
+class SightingViewportQuery(BaseModel):
+    """Several viewports (bboxes and/or tiles) sharing the other SightingFilter filters"""
+    areas: List[str] = []  # Each "west,south,east,north"
+    tiles: List[str] = []  # Each "z/x/y"
+    species_id: Optional[int] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    username: Optional[str] = None
+    limit: Optional[int] = None  # Per viewport (defaults to settings.sightings_page_size)
+
+class SightingViewportGroup(BaseModel):
+    area: str  # The requested bbox or tile, as sent
+    ids: List[str]  # Most recent first; look the sightings up in `items`
+    truncated: bool  # More sightings match than `limit`
+
+class SightingViewportList(BaseModel):
+    items: List[Sighting]  # Every sighting in any group, once
+    groups: List[SightingViewportGroup]  # One per requested viewport, areas then tiles
+
+class SpeciesFacet(BaseModel):
+    species_id: int
+    common_name: Optional[str] = None
+    count: int
+
+class SightingTimeBucket(BaseModel):
+    start: datetime  # Bucket covers [start, start + bucket width)
+    count: int
+
+class SightingFacets(BaseModel):
+    """Per-species counts and a taken_at histogram for a viewport"""
+    area: str  # The bbox counted, as requested
+    start_time: datetime  # Time range actually counted, snapped to whole buckets
+    end_time: datetime
+    bucket: str  # "hour", "day" or "week"
+    total: int
+    species: List[SpeciesFacet]  # Most sightings first
+    histogram: List[SightingTimeBucket]
+
+class SightingCluster(BaseModel):
+    """Aggregated sightings in one grid cell"""
+    lat: float  # Centroid of the sightings in the cell
+    lon: float
+    count: int
+    top_species_id: Optional[int] = None
+    top_species_name: Optional[str] = None
+    top_species_count: int = 0
+
+class SightingClusterList(BaseModel):
+    zoom: int  # Grid level the clusters were computed at
+    items: List[SightingCluster]
+
+class Hotspot(BaseModel):
+    """A grid cell with at least `min_count` sightings in the requested time window"""
+    lat: float  # Centroid of the sightings in the cell
+    lon: float
+    count: int
+
+class HotspotList(BaseModel):
+    items: List[Hotspot]
+
+class SightingDelta(BaseModel):
+    """One entry of a delta sync: the latest change to a sighting after the client's mark"""
+    seq: int
+    op: str  # "insert", "update" or "delete"
+    id: str
+    sighting: Optional[Sighting] = None  # Current row; None for deletes
+
+class SightingDeltaList(BaseModel):
+    items: List[SightingDelta]
+    high_water_mark: int  # Pass back as `since` on the next sync
+    has_more: bool
+
+class HotWindowStats(BaseModel):
+    """Size and memory cost of the in-memory hot window"""
+    enabled: bool
+    rows: int
+    column_bytes: int  # NumPy filter columns
+    payload_bytes: int  # Estimated size of the per-row response payloads
+    bytes_per_row: float
 
 # Route schemas
 class RoutePoint(BaseModel):
@@ -0,0 +1,189 @@
+"""
+Bulk sighting ingest for field surveys (POST /v1/sightings/bulk).
+
+A batch is a manifest, a JSON array (or ``{"sightings": [...]}``) or NDJSON, sent as
+the request body or as the ``manifest`` part of a multipart request whose other parts
+are media files that rows name in ``photo`` / ``audio``.
+
+Rows are checked one by one but written together: every species id is validated with
+one query, media parts are stored concurrently (content-addressed, see media_upload.py),
+and the valid rows are inserted with one executemany INSERT, together with their
+change-log rows, media references, grid/density counts merged per cell and thumbnail
+tasks, in a single transaction. A bad row does not stop the others; every row gets a result.
+"""
+import asyncio
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Sighting, Species
+from app.schemas import SightingIngestItem
+from app.services.change_log import log_bulk_insert
+from app.services.hotspots import add_points_to_density
+from app.services.media_upload import UploadTooLarge, StoredMedia, record_media, store_upload
+from app.services.sighting_grid import add_points_to_grid
+from app.services import thumbnails
+
+# Manifest field -> (storage folder, size limit setting)
+MEDIA_FIELDS = {"photo": ("photos", "media_max_photo_bytes"), "audio": ("audio", "media_max_audio_bytes")}
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def parse_manifest(text: str) -> List[Any]:
+    """
+    Entries of a JSON or NDJSON manifest. An NDJSON line that is not valid JSON becomes
+    a ``ManifestError`` entry, reported against that row only.
+    """
+    text = text.strip()
+    if not text:
+        raise ManifestError("The manifest is empty")
+    if text.startswith("["):
+        try:
+            entries = json.loads(text)
+        except ValueError as e:
+            raise ManifestError(f"Invalid JSON manifest: {e}")
+        return entries
+
+    try:
+        document = json.loads(text)
+    except ValueError:
+        document = None
+    if isinstance(document, dict) and isinstance(document.get("sightings"), list):
+        return document["sightings"]
+
+    entries = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError as e:
+            entries.append(ManifestError(f"Line {number} is not valid JSON: {e}"))
+    return entries
+
+
+def insert_rows(db: Session, rows: List[dict], media: List[StoredMedia], returning: bool = False) -> List[dict]:
+    """
+    Insert new sightings (dicts with every column) with one executemany INSERT, plus their
+    change-log rows, media references, grid/density counts and thumbnail tasks. Does not
+    commit. With ``returning`` the rows are read back by the INSERT itself (``RETURNING``,
+    one multi-row statement per batch) where the dialect supports it.
+    """
+    table = Sighting.__table__
+    if returning and db.get_bind().dialect.insert_executemany_returning:
+        stored = db.execute(insert(table).returning(*table.c), rows).mappings().all()
+        by_id = {row["id"]: dict(row) for row in stored}
+        rows = [by_id[row["id"]] for row in rows]
+    else:
+        db.execute(insert(table), rows)
+    log_bulk_insert(db, rows)
+    record_media(db, media)
+    add_points_to_grid(db, [(row["lat"], row["lon"], row["species_id"]) for row in rows])
+    add_points_to_density(db, [(row["lat"], row["lon"], row["taken_at"]) for row in rows])
+    thumbnails.schedule(db, rows)
+    return rows
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}" for e in error.errors())
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo is not None else dt
+
+
+def _check(entry, files: Dict[str, Any]) -> SightingIngestItem:
+    """Validate one manifest entry on its own; raises ValueError with the reason."""
+    if isinstance(entry, ManifestError):
+        raise entry
+    try:
+        item = SightingIngestItem.model_validate(entry)
+    except ValidationError as e:
+        raise ValueError(_describe(e))
+    if not -90 <= item.lat <= 90 or not -180 <= item.lon <= 180:
+        raise ValueError("lat must be within [-90, 90] and lon within [-180, 180]")
+    for field in MEDIA_FIELDS:
+        name = getattr(item, field)
+        if name is not None and name not in files:
+            raise ValueError(f"No file part named {name!r} for {field}")
+    return item
+
+
+async def ingest(db: Session, entries: List[Any], files: Dict[str, Any]) -> Tuple[dict, List[dict]]:
+    """
+    Insert the valid rows of a manifest in one transaction. ``files`` maps multipart part
+    names to uploads. Returns the report ({"created", "failed", "results"}) and the rows
+    inserted, shaped like ``schemas.Sighting``.
+    """
+    results: List[dict] = [{"index": i, "status": "error"} for i in range(len(entries))]
+    items: Dict[int, SightingIngestItem] = {}
+    for i, entry in enumerate(entries):
+        try:
+            items[i] = _check(entry, files)
+        except ValueError as e:
+            results[i]["detail"] = str(e)
+
+    # One query for every species id in the batch
+    species_ids = {item.species_id for item in items.values()}
+    known = {row.id for row in db.query(Species.id).filter(Species.id.in_(species_ids))} if species_ids else set()
+    for i in [i for i, item in items.items() if item.species_id not in known]:
+        results[i]["detail"] = "Species not found"
+        del items[i]
+
+    # Each referenced part is stored once, however many rows use it (parts no inserted
+    # row ends up using are collected later, see media_upload.collect_orphans)
+    wanted = sorted({(getattr(item, field), field) for item in items.values() for field in MEDIA_FIELDS if getattr(item, field)})
+    outcomes = await asyncio.gather(*(
+        store_upload(db, files[name], MEDIA_FIELDS[field][0], getattr(settings, MEDIA_FIELDS[field][1]))
+        for name, field in wanted
+    ), return_exceptions=True)
+    media: Dict[Tuple[str, str], Any] = dict(zip(wanted, outcomes))
+
+    now = datetime.utcnow()
+    rows, row_media = [], []
+    for i, item in items.items():
+        keys = {field: (getattr(item, field), field) for field in MEDIA_FIELDS if getattr(item, field)}
+        stored = {field: media[key] for field, key in keys.items()}
+        failed = [(field, outcome) for field, outcome in stored.items() if isinstance(outcome, BaseException)]
+        if failed:
+            field, error = failed[0]
+            results[i]["detail"] = str(error) if isinstance(error, UploadTooLarge) else f"Could not store {field}: {error}"
+            continue
+        row = {
+            "id": str(uuid.uuid4()),
+            "username": item.username,
+            "species_id": item.species_id,
+            "lat": item.lat,
+            "lon": item.lon,
+            "taken_at": _naive_utc(item.taken_at) if item.taken_at else now,
+            "is_private": item.is_private,
+            "media_thumb_url": None,
+            "media_medium_url": None,
+            "media_url": stored["photo"].url if "photo" in stored else None,
+            "audio_url": stored["audio"].url if "audio" in stored else None,
+            "caption": item.caption,
+            "created_at": now,
+        }
+        rows.append(row)
+        row_media.extend(stored.values())
+        results[i] = {"index": i, "status": "created", "id": row["id"]}
+
+    try:
+        if rows:
+            insert_rows(db, rows, row_media)
+            db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+    report = {"created": len(rows), "failed": len(entries) - len(rows), "results": results}
+    return report, rows
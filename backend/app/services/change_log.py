@@ -0,0 +1,186 @@
+"""
+Change log for sightings, the source of the delta-sync endpoint.
+
+Every insert, update (e.g. a privacy flip) and delete of a sighting appends a row with a
+monotonically increasing ``seq`` to ``sighting_changes``, in the same transaction as the
+change itself. ORM writes are captured by mapper events; bulk ``Query.delete()`` calls
+and executemany inserts bypass those, so callers log them with ``log_bulk_delete`` and
+``log_bulk_insert``.
+
+Clients keep the highest ``seq`` they have seen (the high-water mark) and ask only for
+what changed after it.
+
+On PostgreSQL, sequence values are handed out before commit, so a transaction holding
+seq N can commit after one holding N+1, however long it runs (a 5000-row bulk ingest, a
+group commit). ``settled_changes`` therefore holds back every change logged after the
+oldest write transaction still in progress started (``write_horizon``, read from
+``pg_stat_activity`` and compared on the database clock): whatever seq that transaction
+holds, changes numbered after it were logged later. A client's high-water mark can then
+never pass a change that has yet to commit. SQLite runs one write transaction at a time,
+so there seq order is commit order already.
+
+Sessions of other database roles are only visible in ``pg_stat_activity`` with
+``pg_read_all_stats``, so every writer should use the application's role.
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import event, func, insert, literal, text
+from sqlalchemy.orm import Session
+
+# Oldest start of a transaction (other than ours) that has written, or the current time
+# if there is none; the clock is read first so a writer starting meanwhile is covered too
+WRITE_HORIZON_SQL = [
+    "SELECT timezone('UTC', clock_timestamp())",
+    "SELECT pg_stat_clear_snapshot()",
+    """SELECT timezone('UTC', min(xact_start)) FROM pg_stat_activity
+        WHERE backend_xid IS NOT NULL AND datname = current_database() AND pid <> pg_backend_pid()""",
+]
+
+
+def _changed_at(dialect: str):
+    """Timestamp for a change row; on PostgreSQL the database clock, which write_horizon uses."""
+    if dialect == "postgresql":
+        return func.timezone("UTC", func.clock_timestamp())
+    return datetime.utcnow()
+
+
+def _begin_write(db_or_connection, dialect: str) -> None:
+    if dialect == "postgresql":
+        # Take an xid before the first seq, so pg_stat_activity lists us as a writer by then
+        db_or_connection.execute(text("SELECT txid_current()"))
+
+
+def register_change_log(sighting_model, change_model) -> None:
+    """Log ORM inserts, updates and deletes of ``sighting_model`` into ``change_model``."""
+    changes = change_model.__table__
+
+    def record(op):
+        def listener(mapper, connection, target):
+            # The sighting row was written first, so the transaction has its xid already
+            connection.execute(changes.insert().values(
+                sighting_id=target.id,
+                op=op,
+                lat=target.lat,
+                lon=target.lon,
+                changed_at=_changed_at(connection.dialect.name),
+            ))
+        return listener
+
+    event.listen(sighting_model, "after_insert", record("insert"))
+    event.listen(sighting_model, "after_update", record("update"))
+    event.listen(sighting_model, "after_delete", record("delete"))
+
+
+def log_bulk_delete(db: Session, query) -> None:
+    """Log deletes for every sighting matched by ``query`` before it is bulk-deleted."""
+    from app.models import Sighting, SightingChange
+
+    dialect = db.get_bind().dialect.name
+    _begin_write(db, dialect)
+    changed_at = _changed_at(dialect)
+    rows = query.with_entities(
+        Sighting.id, literal("delete"), Sighting.lat, Sighting.lon,
+        changed_at if dialect == "postgresql" else literal(changed_at),
+    )
+    db.execute(insert(SightingChange).from_select(
+        ["sighting_id", "op", "lat", "lon", "changed_at"], rows.statement
+    ))
+
+
+def log_bulk_insert(db: Session, rows) -> None:
+    """Log inserts for sightings added with a bulk (executemany) insert; ``rows`` are its parameters."""
+    from app.models import SightingChange
+
+    dialect = db.get_bind().dialect.name
+    _begin_write(db, dialect)
+    db.execute(insert(SightingChange).values(changed_at=_changed_at(dialect)), [
+        {"sighting_id": row["id"], "op": "insert", "lat": row["lat"], "lon": row["lon"]}
+        for row in rows
+    ])
+
+
+def write_horizon(db: Session) -> Optional[datetime]:
+    """
+    Changes logged at or after this time may still be preceded by an uncommitted one (see
+    the module docstring); None when seq order is commit order.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    now, _, oldest = (db.execute(text(sql)).scalar() for sql in WRITE_HORIZON_SQL)
+    return min(now, oldest) if oldest is not None else now
+
+
+def settled_changes(db: Session, since: int):
+    """Query of changes with seq > ``since`` that are safe to advance a high-water mark past."""
+    from app.models import SightingChange
+
+    query = db.query(SightingChange).filter(SightingChange.seq > since)
+    horizon = write_horizon(db)
+    if horizon is not None:
+        query = query.filter(SightingChange.changed_at < horizon)
+    return query
+
+
+def changes_since(
+    db: Session,
+    since: int,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    limit: int = 1000,
+):
+    """
+    Return (changes, high_water_mark, has_more) for changes with seq > ``since``.
+
+    Only the latest change per sighting is returned. Inserts and updates carry the current
+    row; deletes carry only the id.
+    """
+    from app.models import Sighting, SightingChange
+
+    query = settled_changes(db, since)
+    settled_max = query.with_entities(func.max(SightingChange.seq)).scalar()
+
+    if bbox is not None:
+        west, south, east, north = bbox
+        query = query.filter(
+            SightingChange.lat >= south,
+            SightingChange.lat <= north,
+            SightingChange.lon >= west,
+            SightingChange.lon <= east,
+        )
+
+    rows = query.order_by(SightingChange.seq).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if has_more:
+        high_water_mark = rows[-1].seq
+    else:
+        # Nothing else in the area, so the client can skip straight past filtered-out changes
+        high_water_mark = max(since, settled_max or 0)
+
+    latest = {}
+    for change in rows:
+        latest[change.sighting_id] = change
+
+    live_ids = [sid for sid, change in latest.items() if change.op != "delete"]
+    current = {
+        s.id: s for s in db.query(Sighting).filter(Sighting.id.in_(live_ids)).all()
+    } if live_ids else {}
+
+    items = []
+    for change in sorted(latest.values(), key=lambda c: c.seq):
+        if change.op == "delete":
+            items.append({"seq": change.seq, "op": "delete", "id": change.sighting_id, "sighting": None})
+        elif change.sighting_id in current:
+            items.append({"seq": change.seq, "op": change.op, "id": change.sighting_id,
+                          "sighting": current[change.sighting_id]})
+        # else: deleted after this page's changes; its delete change comes later
+
+    return items, high_water_mark, has_more
+
+
+def latest_seq(db: Session) -> int:
+    """Highest settled change seq, a safe starting high-water mark (0 when there is none)."""
+    from app.models import SightingChange
+
+    return settled_changes(db, 0).with_entities(func.max(SightingChange.seq)).scalar() or 0
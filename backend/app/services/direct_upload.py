@@ -0,0 +1,160 @@
+"""
+Two-phase sighting creation with media uploaded straight to storage.
+
+1. ``create_draft`` records a draft and hands out one upload URL per file: a presigned
+   S3 PUT when S3 is configured, otherwise a signed URL for the local upload endpoint
+   (PUT /v1/sightings/drafts/{draft_id}/{kind}), which streams the body to uploads/.
+2. ``finalize_draft`` checks that every announced object exists and is within the size
+   limits, then the caller creates the sighting from it.
+
+With S3 the API worker never handles media bytes. Drafts expire after
+``settings.upload_draft_ttl_seconds``; ``expire_drafts`` removes stale ones together
+with anything that was uploaded for them.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import SightingDraft
+from app.services.media_upload import LOCAL_ROOT
+from app.services.s3_service import s3_service
+
+KINDS = {"photo": "photos", "audio": "audio"}
+EXPIRE_BATCH = 100
+
+# Signs local upload URLs; set UPLOAD_SIGNING_SECRET when running several workers
+_secret = (settings.upload_signing_secret or secrets.token_hex(32)).encode()
+
+
+class DraftError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def max_bytes(kind: str) -> int:
+    return settings.media_max_photo_bytes if kind == "photo" else settings.media_max_audio_bytes
+
+
+def sign(draft_id: str, kind: str, expires: int) -> str:
+    message = f"{draft_id}:{kind}:{expires}".encode()
+    return hmac.new(_secret, message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(draft_id: str, kind: str, expires: int, signature: str) -> bool:
+    if expires < int(datetime.utcnow().timestamp()):
+        return False
+    return hmac.compare_digest(sign(draft_id, kind, expires), signature)
+
+
+def _key(kind: str, filename: str) -> str:
+    file_name = f"{uuid.uuid4()}_{os.path.basename(filename)}"
+    if settings.aws_s3_bucket_name:
+        return f"sightings/{KINDS[kind]}/{file_name}"
+    return f"{LOCAL_ROOT}/{KINDS[kind]}/{file_name}"
+
+
+def media_url(key: str) -> str:
+    return s3_service.public_url(key) if settings.aws_s3_bucket_name else key
+
+
+async def create_draft(db: Session, files: Dict[str, dict], local_upload_url) -> dict:
+    """
+    Record a draft for ``files`` ({"photo": {"filename", "size"}, ...}) and return
+    {"draft_id", "expires_at", "uploads": {kind: {"url", "method", "headers"}}}.
+    ``local_upload_url(draft_id, kind)`` builds the URL of the local upload endpoint.
+    """
+    for kind, file in files.items():
+        if file.get("size") is not None and file["size"] > max_bytes(kind):
+            raise DraftError(413, f"{kind} is larger than {max_bytes(kind)} bytes")
+
+    await expire_drafts(db)
+    ttl = settings.upload_draft_ttl_seconds
+    draft = SightingDraft(expires_at=datetime.utcnow() + timedelta(seconds=ttl))
+    for kind, file in files.items():
+        setattr(draft, f"{kind}_key", _key(kind, file["filename"]))
+    db.add(draft)
+    db.flush()
+
+    uploads = {}
+    expires = int(draft.expires_at.timestamp())
+    for kind, file in files.items():
+        key = getattr(draft, f"{kind}_key")
+        content_type = s3_service.get_content_type(file["filename"])
+        if settings.aws_s3_bucket_name:
+            url, headers = await s3_service.presigned_put(key, content_type, ttl)
+        else:
+            url = f"{local_upload_url(draft.id, kind)}?expires={expires}&signature={sign(draft.id, kind, expires)}"
+            headers = {"Content-Type": content_type}
+        uploads[kind] = {"url": url, "method": "PUT", "headers": headers}
+    db.commit()
+    return {"draft_id": draft.id, "expires_at": draft.expires_at, "uploads": uploads}
+
+
+def local_upload_path(db: Session, draft_id: str, kind: str) -> str:
+    """Where a signed local upload for the draft goes; raises DraftError if it has no such file."""
+    draft = db.query(SightingDraft).filter(SightingDraft.id == draft_id).first()
+    key = getattr(draft, f"{kind}_key", None) if draft else None
+    if not key:
+        raise DraftError(404, "Draft not found")
+    return key
+
+
+async def _object_size(key: str) -> Optional[int]:
+    if settings.aws_s3_bucket_name:
+        return await s3_service.object_size(key)
+    return os.path.getsize(key) if os.path.exists(key) else None
+
+
+async def finalize_draft(db: Session, draft_id: str) -> Dict[str, Optional[str]]:
+    """
+    Check the draft's objects and consume it; returns {"media_url", "audio_url"}.
+    The caller adds the sighting in the same transaction.
+    """
+    draft = db.query(SightingDraft).filter(SightingDraft.id == draft_id).with_for_update().first()
+    if not draft:
+        raise DraftError(404, "Draft not found")
+    if draft.expires_at < datetime.utcnow():
+        raise DraftError(410, "Draft expired")
+
+    urls = {"media_url": None, "audio_url": None}
+    for kind, field in (("photo", "media_url"), ("audio", "audio_url")):
+        key = getattr(draft, f"{kind}_key")
+        if not key:
+            continue
+        size = await _object_size(key)
+        if size is None:
+            raise DraftError(409, f"{kind} has not been uploaded")
+        if size > max_bytes(kind):
+            await _delete(key)
+            raise DraftError(413, f"{kind} is larger than {max_bytes(kind)} bytes")
+        urls[field] = media_url(key)
+
+    db.delete(draft)
+    return urls
+
+
+async def _delete(key: str) -> None:
+    if settings.aws_s3_bucket_name:
+        await s3_service.delete_file(s3_service.public_url(key))
+    elif os.path.exists(key):
+        os.remove(key)
+
+
+async def expire_drafts(db: Session) -> int:
+    """Delete up to EXPIRE_BATCH expired drafts and anything uploaded for them."""
+    expired = db.query(SightingDraft).filter(SightingDraft.expires_at < datetime.utcnow()).limit(EXPIRE_BATCH).all()
+    for draft in expired:
+        for key in (draft.photo_key, draft.audio_key):
+            if key:
+                await _delete(key)
+        db.delete(draft)
+    return len(expired)
@@ -0,0 +1,178 @@
+"""
+Streaming bulk export of sightings joined to species.
+
+Rows are read through a server-side cursor (``stream_results`` + ``yield_per``) in
+batches, and each batch is encoded and handed to the caller before the next one is
+fetched, so memory stays flat however many rows match. The same generators back the
+``/v1/sightings/export`` endpoint and ``export_sightings.py``.
+
+Formats:
+    ndjson   one JSON object per line
+    csv      header row, then one row per sighting
+    parquet  one row group per batch (needs the optional ``pyarrow`` package)
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.models import Sighting, Species
+from app.services.spatial_index import bbox_filter
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_COLUMNS = [
+    Sighting.id,
+    Sighting.username,
+    Sighting.species_id,
+    Species.common_name.label("species_common_name"),
+    Species.scientific_name.label("species_scientific_name"),
+    Sighting.lat,
+    Sighting.lon,
+    Sighting.taken_at,
+    Sighting.created_at,
+    Sighting.is_private,
+    Sighting.caption,
+    Sighting.media_url,
+    Sighting.audio_url,
+]
+COLUMN_NAMES = [column.key for column in EXPORT_COLUMNS]
+
+
+class ExportUnavailable(RuntimeError):
+    """The requested format needs a package that is not installed."""
+
+
+def export_statement(
+    dialect: str,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    species_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    username: Optional[str] = None,
+):
+    """SELECT for the export, with the same filters as ``SightingFilter``."""
+    stmt = select(*EXPORT_COLUMNS).join(Species, Species.id == Sighting.species_id)
+    if bbox is not None:
+        stmt = stmt.where(bbox_filter(Sighting, dialect, *bbox))
+    if species_id:
+        stmt = stmt.where(Sighting.species_id == species_id)
+    if start is not None:
+        stmt = stmt.where(Sighting.taken_at >= start)
+    if end is not None:
+        stmt = stmt.where(Sighting.taken_at <= end)
+    if username:
+        stmt = stmt.where(Sighting.username == username)
+    # Primary key order keeps dumps stable and lets the database walk an index
+    return stmt.order_by(Sighting.id)
+
+
+def iter_batches(db: Session, stmt, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List[tuple]]:
+    """Yield lists of result tuples from a server-side cursor."""
+    if db.get_bind().dialect.name == "postgresql":
+        # A full dump can outlive the connection's default statement_timeout
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+    result = db.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+    for partition in result.partitions():
+        yield [tuple(row) for row in partition]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def iter_ndjson(batches) -> Iterator[bytes]:
+    for batch in batches:
+        lines = [json.dumps(dict(zip(COLUMN_NAMES, row)), default=_json_default) for row in batch]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_csv(batches) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMN_NAMES)
+    for batch in batches:
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row] for row in batch
+        )
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects bytes until the caller drains them."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_parquet(batches) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("username", pa.string()),
+        ("species_id", pa.int64()),
+        ("species_common_name", pa.string()),
+        ("species_scientific_name", pa.string()),
+        ("lat", pa.float64()),
+        ("lon", pa.float64()),
+        ("taken_at", pa.timestamp("us")),
+        ("created_at", pa.timestamp("us")),
+        ("is_private", pa.bool_()),
+        ("caption", pa.string()),
+        ("media_url", pa.string()),
+        ("audio_url", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            columns = list(zip(*batch)) if batch else [[] for _ in COLUMN_NAMES]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_stream(db: Session, stmt, fmt: str, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Encoded chunks of the export in ``fmt`` (one of ``EXPORT_FORMATS``)."""
+    encoders = {"ndjson": iter_ndjson, "csv": iter_csv, "parquet": iter_parquet}
+    if fmt not in encoders:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportUnavailable("Parquet export requires the pyarrow package")
+    return encoders[fmt](iter_batches(db, stmt, batch_size))
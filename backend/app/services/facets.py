@@ -0,0 +1,211 @@
+"""
+Species facet counts and a ``taken_at`` histogram for a map viewport.
+
+Both come from grouped queries over the spatial index, grouped by species and time
+bucket: summing over buckets gives the species counts, summing over species gives the
+histogram. Counts are for exactly the requested bbox; the time range is snapped to whole
+buckets.
+
+So that panning around the same area does not re-aggregate, the bbox is split along the
+slippy-map tiles of the finest grid level at which it spans at most ``FACET_TILE_SPAN``
+tiles per axis. The tiles entirely inside it are aggregated (and cached) one by one;
+only the partial tiles along its edges are counted afresh each time. A cached tile is
+valid for the version of its grid cell (see sighting_grid), so a sighting inserted
+inside it, by any worker, invalidates exactly the tile it belongs to.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import BigInteger, and_, case, cast, func, literal, or_
+from sqlalchemy.orm import Session
+
+from app.models import Sighting, SightingGridCell, Species
+from app.services.sighting_grid import GRID_MAX_ZOOM, level_query, tile_bounds, tile_range
+from app.services.spatial_index import bbox_filter
+from app.services.versioned_cache import VersionedLRU
+
+FACET_TILE_SPAN = 16
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+MAX_HISTOGRAM_BUCKETS = 1000
+
+_EPOCH = datetime(1970, 1, 1)
+
+# One entry per (tile, time range, bucket): {"counts": {(species_id, bucket): n}, "names": {species_id: name}}
+facet_cache = VersionedLRU(max_entries=8192)
+
+
+def facet_tiles(west: float, south: float, east: float, north: float) -> Tuple[int, Tuple[int, int, int, int]]:
+    """Return (level, tile range) the bbox is split along."""
+    for level in range(GRID_MAX_ZOOM, -1, -1):
+        x_min, y_min, x_max, y_max = tile_range(west, south, east, north, level)
+        if x_max - x_min < FACET_TILE_SPAN and y_max - y_min < FACET_TILE_SPAN:
+            break
+    return level, (x_min, y_min, x_max, y_max)
+
+
+def pick_bucket(start: datetime, end: datetime) -> str:
+    """Finest bucket that keeps the histogram under ~200 bars."""
+    span = (end - start).total_seconds()
+    for name, width in BUCKETS.items():
+        if span / width <= 200:
+            return name
+    return "week"
+
+
+def _to_naive_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = (dt - dt.utcoffset()).replace(tzinfo=None)
+    return dt
+
+
+def _bucket_expression(dialect: str, width: int):
+    if dialect == "postgresql":
+        seconds = func.floor(func.extract("epoch", Sighting.taken_at))
+    else:
+        seconds = func.strftime("%s", Sighting.taken_at)
+    return cast(seconds, BigInteger) // width
+
+
+def _west_edge(level: int, x: int) -> float:
+    return tile_bounds(level, x, 0)[0]
+
+
+def _north_edge(level: int, y: int) -> float:
+    return tile_bounds(level, 0, y)[3]
+
+
+def _in_tiles(dialect: str, level: int, x0: int, y0: int, x1: int, y1: int):
+    """Rows in tiles x0..x1, y0..y1, as sighting_grid.tile_for assigns them (west and north edges included)."""
+    west, east = _west_edge(level, x0), _west_edge(level, x1 + 1)
+    north, south = _north_edge(level, y0), _north_edge(level, y1 + 1)
+    return and_(bbox_filter(Sighting, dialect, west, south, east, north), Sighting.lon < east, Sighting.lat > south)
+
+
+def _edges(dialect: str, bbox, level: int, interior):
+    """Rows in ``bbox`` outside the interior tiles: a strip along each side."""
+    west, south, east, north = bbox
+    x0, y0, x1, y1 = interior
+    inner_west, inner_east = _west_edge(level, x0), _west_edge(level, x1 + 1)
+    inner_north, inner_south = _north_edge(level, y0), _north_edge(level, y1 + 1)
+    band = and_(Sighting.lat > inner_south, Sighting.lat <= inner_north)
+    return or_(
+        and_(bbox_filter(Sighting, dialect, west, inner_north, east, north), Sighting.lat > inner_north),
+        and_(bbox_filter(Sighting, dialect, west, south, east, inner_south), Sighting.lat <= inner_south),
+        and_(bbox_filter(Sighting, dialect, west, inner_south, inner_west, inner_north), band, Sighting.lon < inner_west),
+        and_(bbox_filter(Sighting, dialect, inner_east, inner_south, east, inner_north), band, Sighting.lon >= inner_east),
+    )
+
+
+def _tile_index(column, edges, first: int, last: int, above: bool):
+    """SQL expression numbering the tile (first..last) a coordinate falls in, given each tile's far edge."""
+    if first == last:
+        return literal(first)
+    whens = [((column > edge) if above else (column < edge), i) for i, edge in zip(range(first, last), edges)]
+    return case(*whens, else_=last)
+
+
+def query_facets(
+    db: Session,
+    west: float, south: float, east: float, north: float,
+    start: datetime, end: datetime,
+    bucket: Optional[str] = None,
+) -> dict:
+    """Species counts and taken_at histogram for the bbox and the bucket-snapped time range."""
+    start, end = _to_naive_utc(start), _to_naive_utc(end)
+    bucket = bucket or pick_bucket(start, end)
+    width = BUCKETS[bucket]
+
+    # Snap the time range outward to whole buckets
+    first = int((start - _EPOCH).total_seconds()) // width
+    last = -(-int((end - _EPOCH).total_seconds()) // width)
+    start_q = _EPOCH + timedelta(seconds=first * width)
+    end_q = _EPOCH + timedelta(seconds=last * width)
+
+    dialect = db.get_bind().dialect.name
+    bucket_expr = _bucket_expression(dialect, width).label("bucket")
+
+    def aggregate(where, *group_columns):
+        return db.query(
+            *group_columns, Sighting.species_id, Species.common_name, bucket_expr, func.count().label("count")
+        ).join(
+            Species, Species.id == Sighting.species_id
+        ).filter(
+            where,
+            Sighting.taken_at >= start_q,
+            Sighting.taken_at < end_q,
+        ).group_by(*group_columns, Sighting.species_id, Species.common_name, bucket_expr).all()
+
+    counts: Dict[Tuple[int, int], int] = {}
+    names: Dict[int, str] = {}
+
+    def add(species_id, common_name, bucket_index, count):
+        key = (species_id, int(bucket_index))
+        counts[key] = counts.get(key, 0) + count
+        names[species_id] = common_name
+
+    bbox = (west, south, east, north)
+    level, (x_min, y_min, x_max, y_max) = facet_tiles(*bbox)
+    interior = (x_min + 1, y_min + 1, x_max - 1, y_max - 1)
+    if interior[0] > interior[2] or interior[1] > interior[3]:
+        for row in aggregate(bbox_filter(Sighting, dialect, *bbox)):
+            add(*row)
+    else:
+        versions = {
+            (x, y): version
+            for x, y, version in level_query(db, SightingGridCell, level, interior, sums=("version",))
+        }
+        partials, missing = {}, []
+        for x in range(interior[0], interior[2] + 1):
+            for y in range(interior[1], interior[3] + 1):
+                cached = facet_cache.get((level, x, y, first, last, bucket), versions.get((x, y), 0))
+                if cached is None:
+                    missing.append((x, y))
+                else:
+                    partials[(x, y)] = cached
+
+        if missing:
+            # One query over the rectangle of uncached tiles, grouped by tile
+            x0, x1 = min(x for x, _ in missing), max(x for x, _ in missing)
+            y0, y1 = min(y for _, y in missing), max(y for _, y in missing)
+            tile_x = _tile_index(Sighting.lon, [_west_edge(level, x + 1) for x in range(x0, x1)], x0, x1, above=False)
+            tile_y = _tile_index(Sighting.lat, [_north_edge(level, y + 1) for y in range(y0, y1)], y0, y1, above=True)
+            fresh = {tile: {"counts": {}, "names": {}} for tile in missing}
+            for x, y, species_id, common_name, bucket_index, count in aggregate(
+                _in_tiles(dialect, level, x0, y0, x1, y1), tile_x.label("tile_x"), tile_y.label("tile_y")
+            ):
+                partial = fresh.get((x, y))
+                if partial is not None:
+                    partial["counts"][(species_id, int(bucket_index))] = count
+                    partial["names"][species_id] = common_name
+            for (x, y), partial in fresh.items():
+                facet_cache.put((level, x, y, first, last, bucket), versions.get((x, y), 0), partial)
+            partials.update(fresh)
+
+        for partial in partials.values():
+            for (species_id, bucket_index), count in partial["counts"].items():
+                add(species_id, partial["names"][species_id], bucket_index, count)
+        for row in aggregate(_edges(dialect, bbox, level, interior)):
+            add(*row)
+
+    species = {}
+    histogram = {}
+    for (species_id, bucket_index), count in counts.items():
+        entry = species.setdefault(species_id, {"species_id": species_id, "common_name": names[species_id], "count": 0})
+        entry["count"] += count
+        histogram[bucket_index] = histogram.get(bucket_index, 0) + count
+
+    if last - first <= MAX_HISTOGRAM_BUCKETS:
+        indexes = range(first, last)
+    else:
+        indexes = sorted(histogram)
+    return {
+        "area": ",".join(f"{value:.6f}" for value in bbox),
+        "start_time": start_q,
+        "end_time": end_q,
+        "bucket": bucket,
+        "total": sum(histogram.values()),
+        "species": sorted(species.values(), key=lambda s: (-s["count"], s["species_id"])),
+        "histogram": [
+            {"start": _EPOCH + timedelta(seconds=i * width), "count": histogram.get(i, 0)} for i in indexes
+        ],
+    }
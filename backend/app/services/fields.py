@@ -0,0 +1,63 @@
+"""
+Sparse fieldsets: ``fields=id,lat,lon,species_id`` on a list endpoint.
+
+The requested names are checked against the response schema, only the matching columns
+are selected in SQL, and rows are serialized through a TypedDict built for exactly
+those fields. The generated types and their ``TypeAdapter``s are cached per field
+list, so a map client repeating the same selector pays for building them once.
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, TypeAdapter
+from typing_extensions import TypedDict
+
+Fields = Tuple[str, ...]
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> Optional[Fields]:
+    """Validated, de-duplicated field names in request order, or None for every field."""
+    if fields is None:
+        return None
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    if not names:
+        raise InvalidFields("fields must name at least one field")
+    unknown = [name for name in names if name not in schema.model_fields]
+    if unknown:
+        raise InvalidFields(
+            f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(schema.model_fields)}"
+        )
+    return names
+
+
+@lru_cache(maxsize=256)
+def sparse_row_type(schema: Type[BaseModel], fields: Fields) -> type:
+    """A TypedDict with only ``fields`` of ``schema``, same types."""
+    return TypedDict(
+        f"Sparse{schema.__name__}",
+        {name: schema.model_fields[name].annotation for name in fields},
+    )
+
+
+@lru_cache(maxsize=256)
+def sparse_row_adapter(schema: Type[BaseModel], fields: Fields) -> TypeAdapter:
+    return TypeAdapter(sparse_row_type(schema, fields))
+
+
+@lru_cache(maxsize=256)
+def sparse_list_adapter(schema: Type[BaseModel], fields: Fields) -> TypeAdapter:
+    """Adapter for ``{"items": [row, ...]}`` with sparse rows."""
+    return TypeAdapter(TypedDict(f"Sparse{schema.__name__}List", {"items": List[sparse_row_type(schema, fields)]}))
+
+
+def project(rows: List[dict], fields: Fields) -> List[dict]:
+    return [{name: row[name] for name in fields} for row in rows]
+
+
+def columns_for(model, fields: Fields) -> Dict[str, object]:
+    """Model columns behind ``fields``; names without a column are left out."""
+    return {name: getattr(model, name) for name in fields if name in model.__table__.columns}
@@ -0,0 +1,138 @@
+"""
+Group commit for POST /v1/sightings/create (optional, ``group_commit_enabled``).
+
+Normally every create runs its own species SELECT, INSERT, COMMIT and refresh SELECT, so
+under a burst the database spends its time on round trips and one fsync per sighting.
+In group-commit mode a request hands its row to ``group_committer`` instead and waits:
+rows that arrive within ``group_commit_window_ms`` of each other (and any that arrive
+while the previous group is still committing) are written together in one transaction,
+checking every species id with one query and inserting with a multi-row
+``INSERT ... RETURNING`` (see bulk_ingest.insert_rows), then each caller gets its own row.
+
+If the group's transaction fails, its rows are retried one at a time so that only the
+request whose row is at fault sees the error.
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Species
+from app.services.bulk_ingest import insert_rows
+from app.services.media_upload import StoredMedia
+
+logger = logging.getLogger(__name__)
+
+
+class SpeciesNotFound(LookupError):
+    pass
+
+
+class _Pending:
+    __slots__ = ("row", "media", "future")
+
+    def __init__(self, row: dict, media: List[StoredMedia], future: asyncio.Future):
+        self.row = row
+        self.media = media
+        self.future = future
+
+
+class _Queue:
+    """Rows waiting to be written to one database (bind), and the task writing them."""
+
+    def __init__(self):
+        self.pending: List[_Pending] = []
+        self.flush: Optional[asyncio.Task] = None
+
+
+def _write(bind, group: List[_Pending]) -> List[object]:
+    """Insert a group in one transaction; returns each row as stored, or its exception."""
+    db = Session(bind=bind)
+    try:
+        species_ids = {item.row["species_id"] for item in group}
+        known = {row.id for row in db.query(Species.id).filter(Species.id.in_(species_ids))}
+        results: List[object] = [None] * len(group)
+        valid = []
+        for i, item in enumerate(group):
+            if item.row["species_id"] in known:
+                valid.append(i)
+            else:
+                results[i] = SpeciesNotFound("Species not found")
+        if valid:
+            stored = insert_rows(
+                db,
+                [group[i].row for i in valid],
+                [media for i in valid for media in group[i].media],
+                returning=True,
+            )
+            db.commit()
+            for i, row in zip(valid, stored):
+                results[i] = row
+        return results
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _write_group(bind, group: List[_Pending]) -> List[object]:
+    try:
+        return _write(bind, group)
+    except Exception as e:
+        if len(group) == 1:
+            return [e]
+        logger.warning(f"Group commit of {len(group)} sightings failed ({e}); writing them one by one")
+    results = []
+    for item in group:
+        try:
+            results.extend(_write(bind, [item]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class GroupCommitter:
+    """Collects new sighting rows per database and commits them in groups."""
+
+    def __init__(self):
+        self._queues: Dict[object, _Queue] = {}
+
+    async def create(self, bind, row: dict, media: List[StoredMedia]) -> dict:
+        """
+        Insert ``row`` (a dict with every sighting column) and count references to
+        ``media`` in the next group commit; returns the row as stored. Raises
+        ``SpeciesNotFound``, or whatever writing the row on its own raised.
+        """
+        loop = asyncio.get_running_loop()
+        queue = self._queues.setdefault(bind, _Queue())
+        future = loop.create_future()
+        queue.pending.append(_Pending(row, media, future))
+        if queue.flush is None or queue.flush.done() or queue.flush.get_loop() is not loop:
+            queue.flush = asyncio.create_task(self._flush(bind, queue))
+        return await future
+
+    async def _flush(self, bind, queue: _Queue) -> None:
+        await asyncio.sleep(settings.group_commit_window_ms / 1000)
+        # Rows that arrive while a group is committing form the next group
+        while queue.pending:
+            group = queue.pending[:settings.group_commit_max_rows]
+            del queue.pending[:len(group)]
+            try:
+                results = await asyncio.to_thread(_write_group, bind, group)
+            except asyncio.CancelledError:
+                for item in group + queue.pending:
+                    item.future.cancel()
+                raise
+            for item, result in zip(group, results):
+                if item.future.done():  # the request went away
+                    continue
+                if isinstance(result, BaseException):
+                    item.future.set_exception(result)
+                else:
+                    item.future.set_result(result)
+
+
+group_committer = GroupCommitter()
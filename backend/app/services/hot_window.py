@@ -0,0 +1,329 @@
+"""
+In-process columnar index of recent sightings (the "hot window").
+
+The map only asks for the last day of sightings, so each worker can keep that window in
+memory and answer those queries without touching the database:
+
+    - filter columns live in NumPy arrays (lat, lon, taken_at, species_id, grid cell and
+      an offset into the row payload list), sorted by grid cell so a bbox only visits the
+      cells it overlaps; the masks inside those cells are vectorized
+    - response payloads (one dict per row, shaped like ``schemas.Sighting``) are only
+      touched for rows that match
+    - new rows land in a small unsorted tail that is merged on the next sweep
+
+``create_sighting`` appends to the local store; a background sweep evicts expired rows
+and replays the sighting change log (see change_log) since its last sweep, picking up
+rows other workers inserted, updated or deleted, so staleness across workers is bounded
+by the sweep interval. The store is opt-in (``settings.hot_window_enabled``).
+
+Reads take the store's lock from async request handlers, so it is never held across
+a database query or a rebuild of the arrays: loads, sweeps and merges read or build first
+and only swap or apply the result under it.
+"""
+import asyncio
+import logging
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Sighting as SightingModel, SightingChange
+from app.schemas import Sighting
+from app.services.change_log import latest_seq, settled_changes
+from app.services.sighting_grid import tile_for, tile_range
+
+logger = logging.getLogger(__name__)
+
+CELL_ZOOM = 12  # ~10 km cells
+MAX_TAIL_ROWS = 1024
+MAX_CELL_ROWS_SCANNED = 512  # above this many grid rows in a bbox, mask the whole window instead
+
+
+def _to_micros(dt: datetime) -> int:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+
+
+def _cell_key(x: int, y: int) -> int:
+    return (y << CELL_ZOOM) | x
+
+
+class HotWindowStore:
+    """Columnar store of sightings whose ``taken_at`` is within ``window`` of now."""
+
+    def __init__(self, window: timedelta):
+        self.window = window
+        self.loaded = False
+        self.change_seq = 0  # last change log seq applied
+        self._lock = threading.RLock()
+        self._merging = threading.Lock()  # one merge (or load swap) at a time
+        self._reset()
+
+    def _reset(self):
+        self.lat = np.empty(0, dtype=np.float64)
+        self.lon = np.empty(0, dtype=np.float64)
+        self.taken_at = np.empty(0, dtype=np.int64)  # microseconds since epoch, UTC
+        self.species_id = np.empty(0, dtype=np.int32)
+        self.cell = np.empty(0, dtype=np.int64)
+        self.offset = np.empty(0, dtype=np.int32)  # index into self._rows
+        self._rows: List[dict] = []
+        self._ids: Dict[str, int] = {}
+        self._removed = bytearray()  # tombstone per entry of self._rows
+        self._tail: List[Tuple[float, float, int, int, int, int]] = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    # ------------------ writes ------------------
+
+    def append(self, sighting) -> None:
+        """Add an ORM sighting (or a dict shaped like ``schemas.Sighting``) to the tail."""
+        row = sighting if isinstance(sighting, dict) else Sighting.model_validate(sighting).model_dump()
+        taken = _to_micros(row["taken_at"])
+        if taken < self._cutoff():
+            return
+        with self._lock:
+            full = self._add(row, taken)
+        if full:
+            self._compact()
+
+    def _add(self, row: dict, taken: int) -> bool:
+        """Add a row to the tail under the lock; True once the tail is due to be merged."""
+        if row["id"] in self._ids:
+            return False
+        x, y = tile_for(row["lat"], row["lon"], CELL_ZOOM)
+        offset = len(self._rows)
+        self._rows.append(row)
+        self._removed.append(0)
+        self._ids[row["id"]] = offset
+        self._tail.append((row["lat"], row["lon"], taken, row["species_id"], _cell_key(x, y), offset))
+        return len(self._tail) >= MAX_TAIL_ROWS
+
+    def remove(self, sighting_id: str) -> None:
+        """Drop a row; its column entries are skipped by reads and released on the next sweep."""
+        with self._lock:
+            offset = self._ids.pop(sighting_id, None)
+            if offset is not None:
+                self._removed[offset] = 1
+
+    def _cutoff(self) -> int:
+        return _to_micros(datetime.utcnow() - self.window)
+
+    def _compact(self, evict: bool = False) -> None:
+        """Merge the tail into the sorted arrays; with ``evict`` also drop expired and removed rows.
+
+        The new arrays are built from a snapshot outside the lock; rows appended or removed
+        meanwhile are carried over when they are swapped in.
+        """
+        # A merge triggered by append can wait for the one already running
+        if not self._merging.acquire(blocking=evict):
+            return
+        try:
+            with self._lock:
+                tail = list(self._tail)
+                rows, n_rows = self._rows, len(self._rows)
+                removed = np.frombuffer(bytes(self._removed), dtype=bool)
+                lat, lon, taken_at = self.lat, self.lon, self.taken_at
+                species_id, cell, offset = self.species_id, self.cell, self.offset
+
+            if tail:
+                columns = np.array(tail, dtype=object).T
+                lat = np.concatenate([lat, columns[0].astype(np.float64)])
+                lon = np.concatenate([lon, columns[1].astype(np.float64)])
+                taken_at = np.concatenate([taken_at, columns[2].astype(np.int64)])
+                species_id = np.concatenate([species_id, columns[3].astype(np.int32)])
+                cell = np.concatenate([cell, columns[4].astype(np.int64)])
+                offset = np.concatenate([offset, columns[5].astype(np.int32)])
+
+            kept = None
+            if evict:
+                live = (taken_at >= self._cutoff()) & ~removed[offset]
+                if not live.all():
+                    keep = np.flatnonzero(live)
+                    kept = offset[keep]  # old offsets, in the order of the new payload list
+                    lat, lon, taken_at = lat[keep], lon[keep], taken_at[keep]
+                    species_id, cell = species_id[keep], cell[keep]
+                    offset = np.arange(len(keep), dtype=np.int32)
+                    # Rebuild the payload list so evicted rows are released
+                    new_rows = [rows[i] for i in kept.tolist()]
+                    new_ids = {row["id"]: i for i, row in enumerate(new_rows)}
+
+            order = np.argsort(cell, kind="stable")
+            lat, lon, taken_at = lat[order], lon[order], taken_at[order]
+            species_id, cell, offset = species_id[order], cell[order], offset[order]
+
+            with self._lock:
+                later = self._tail[len(tail):]
+                if kept is not None:
+                    removed = np.frombuffer(bytes(self._removed), dtype=bool)
+                    new_removed = bytearray(removed[kept].tobytes())
+                    for i in np.flatnonzero(removed[kept]).tolist():
+                        new_ids.pop(new_rows[i]["id"], None)
+                    # Rows appended since the snapshot move down to follow the kept ones
+                    shift = n_rows - len(new_rows)
+                    for old in range(n_rows, len(self._rows)):
+                        row = self._rows[old]
+                        new_rows.append(row)
+                        new_removed.append(self._removed[old])
+                        if not self._removed[old]:
+                            new_ids[row["id"]] = old - shift
+                    later = [entry[:5] + (entry[5] - shift,) for entry in later]
+                    self._rows, self._ids, self._removed = new_rows, new_ids, new_removed
+                self.lat, self.lon, self.taken_at = lat, lon, taken_at
+                self.species_id, self.cell, self.offset = species_id, cell, offset
+                self._tail = later
+        finally:
+            self._merging.release()
+
+    # ------------------ sync with the database ------------------
+
+    def load(self, db: Session) -> None:
+        """(Re)load the whole window from the database."""
+        since = datetime.utcnow() - self.window
+        change_seq = latest_seq(db)
+        # Read and index into a separate store, so queries are not held up meanwhile
+        fresh = HotWindowStore(self.window)
+        for sighting in db.query(SightingModel).filter(SightingModel.taken_at >= since).yield_per(5000):
+            row = Sighting.model_validate(sighting).model_dump()
+            fresh._add(row, _to_micros(row["taken_at"]))
+        fresh._compact()
+        with self._merging, self._lock:
+            self.lat, self.lon, self.taken_at = fresh.lat, fresh.lon, fresh.taken_at
+            self.species_id, self.cell, self.offset = fresh.species_id, fresh.cell, fresh.offset
+            self._rows, self._ids, self._tail = fresh._rows, fresh._ids, fresh._tail
+            self._removed = fresh._removed
+            # Rows appended here while loading are replayed from the change log
+            self.change_seq = change_seq
+            self.loaded = True
+        logger.info(f"Hot window loaded {len(self)} sightings ({self.stats()['bytes_per_row']} bytes/row)")
+
+    def sweep(self, db: Session) -> None:
+        """Apply changes logged since the last sweep and evict expired rows."""
+        if not self.loaded:
+            self.load(db)
+            return
+        changes = settled_changes(db, self.change_seq).order_by(SightingChange.seq).all()
+        if changes:
+            live_ids = {c.sighting_id for c in changes if c.op != "delete"}
+            current = [Sighting.model_validate(sighting).model_dump() for sighting in self._current(db, live_ids)]
+            with self._lock:
+                for change in changes:
+                    if change.op != "insert":
+                        self.remove(change.sighting_id)
+                for row in current:
+                    self._add(row, _to_micros(row["taken_at"]))
+                self.change_seq = changes[-1].seq
+        self._compact(evict=True)
+
+    def _current(self, db: Session, ids) -> List[SightingModel]:
+        """Current in-window rows for ``ids`` (rows deleted since are simply missing)."""
+        ids = list(ids)
+        rows = []
+        for i in range(0, len(ids), 500):
+            rows.extend(db.query(SightingModel).filter(
+                SightingModel.id.in_(ids[i:i + 500]),
+                SightingModel.taken_at >= datetime.utcnow() - self.window,
+            ).all())
+        return rows
+
+    # ------------------ reads ------------------
+
+    def covers(self, start: Optional[datetime]) -> bool:
+        """True if every row with ``taken_at >= start`` is in the store."""
+        return self.loaded and start is not None and _to_micros(start) >= self._cutoff()
+
+    def _candidates(self, bbox) -> np.ndarray:
+        """Indices of sorted rows in the grid cells a bbox overlaps."""
+        if bbox is None:
+            return np.arange(len(self.cell))
+        x_min, y_min, x_max, y_max = tile_range(*bbox, CELL_ZOOM)
+        if y_max - y_min + 1 > MAX_CELL_ROWS_SCANNED:
+            return np.arange(len(self.cell))
+        starts = np.searchsorted(self.cell, [_cell_key(x_min, y) for y in range(y_min, y_max + 1)], "left")
+        ends = np.searchsorted(self.cell, [_cell_key(x_max, y) for y in range(y_min, y_max + 1)], "right")
+        ranges = [np.arange(s, e) for s, e in zip(starts, ends) if e > s]
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def query(
+        self,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        species_id: Optional[int] = None,
+        username: Optional[str] = None,
+    ) -> List[dict]:
+        """Return matching payload rows ordered by (taken_at, id) DESC."""
+        with self._lock:
+            idx = self._candidates(bbox)
+            mask = np.ones(len(idx), dtype=bool)
+            if bbox is not None:
+                west, south, east, north = bbox
+                lat, lon = self.lat[idx], self.lon[idx]
+                mask &= (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+            if start is not None:
+                mask &= self.taken_at[idx] >= _to_micros(start)
+            if end is not None:
+                mask &= self.taken_at[idx] <= _to_micros(end)
+            if species_id is not None:
+                mask &= self.species_id[idx] == species_id
+            offsets = self.offset[idx[mask]].tolist()
+
+            # The unsorted tail is small; filter it row by row
+            west, south, east, north = bbox if bbox is not None else (None,) * 4
+            for lat, lon, taken, sid, _, offset in self._tail:
+                if bbox is not None and not (south <= lat <= north and west <= lon <= east):
+                    continue
+                if start is not None and taken < _to_micros(start):
+                    continue
+                if end is not None and taken > _to_micros(end):
+                    continue
+                if species_id is not None and sid != species_id:
+                    continue
+                offsets.append(offset)
+
+            rows = [self._rows[i] for i in offsets if not self._removed[i]]
+
+        if username is not None:
+            rows = [row for row in rows if row["username"] == username]
+        rows.sort(key=lambda row: (row["taken_at"], row["id"]), reverse=True)
+        return rows
+
+    def stats(self) -> dict:
+        """Row count and memory cost, split into filter columns and row payloads."""
+        with self._lock:
+            n = len(self)
+            column_bytes = sum(a.nbytes for a in (self.lat, self.lon, self.taken_at, self.species_id, self.cell, self.offset))
+            column_bytes += len(self._tail) * 40  # same six fields, not yet in the arrays
+            sample = self._rows[:100]
+            per_payload = (
+                sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values()) for row in sample) / len(sample)
+                if sample else 0
+            )
+        payload_bytes = int(per_payload * n)
+        return {
+            "rows": n,
+            "column_bytes": column_bytes,
+            "payload_bytes": payload_bytes,
+            "bytes_per_row": round((column_bytes + payload_bytes) / n, 1) if n else 0,
+        }
+
+
+hot_window = HotWindowStore(timedelta(hours=settings.hot_window_hours))
+
+
+async def run_sweeper(session_factory, interval_s: float) -> None:
+    """Background task: keep the hot window in sync with the database."""
+    while True:
+        db = session_factory()
+        try:
+            await asyncio.to_thread(hot_window.sweep, db)
+        except Exception as e:
+            logger.error(f"Hot window sweep failed: {e}")
+        finally:
+            db.close()
+        await asyncio.sleep(interval_s)
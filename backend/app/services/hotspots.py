@@ -0,0 +1,139 @@
+"""
+High-volume-area (hotspot) detection from a rolling density grid.
+
+Sightings are counted per fine grid cell (zoom ``HOTSPOT_ZOOM`` tiles, roughly 200-300 m
+across at our latitudes) and per hour. A hotspot query sums the buckets in the requested
+time window for the cells in a bbox and keeps the cells at or over a threshold, all in
+one grouped read of the density table. Buckets older than ``RETENTION`` are aged out.
+"""
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database import upsert_increment
+from app.models import Sighting, SightingDensityCell
+from app.services.sighting_grid import tile_for, tile_range
+
+HOTSPOT_ZOOM = 17
+RETENTION = timedelta(days=90)
+EXPIRE_INTERVAL_S = 3600  # how often the write path sweeps expired buckets
+
+_last_expired_at = 0.0
+
+
+def _to_naive_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def bucket_for(dt: datetime) -> datetime:
+    """Floor a timestamp to its hourly bucket (naive UTC, like the sightings columns)."""
+    return _to_naive_utc(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def add_sighting_to_density(db: Session, sighting: Sighting, delta: int = 1) -> None:
+    """Count ``sighting`` in its density cell; runs inside the caller's transaction."""
+    add_points_to_density(db, [(sighting.lat, sighting.lon, sighting.taken_at)], delta)
+
+
+def add_points_to_density(db: Session, points: Iterable[Tuple[float, float, datetime]], delta: int = 1) -> None:
+    """Count many (lat, lon, taken_at) sightings, one upsert per density cell touched."""
+    cells: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    for lat, lon, taken_at in points:
+        x, y = tile_for(lat, lon, HOTSPOT_ZOOM)
+        cell = cells[(bucket_for(taken_at), x, y)]
+        cell[0] += delta
+        cell[1] += lat * delta
+        cell[2] += lon * delta
+    upsert_increment(
+        db,
+        SightingDensityCell.__table__,
+        [
+            {"bucket": bucket, "x": x, "y": y, "count": count, "lat_sum": lat_sum, "lon_sum": lon_sum}
+            for (bucket, x, y), (count, lat_sum, lon_sum) in cells.items()
+        ],
+        ["bucket", "x", "y"],
+        ["count", "lat_sum", "lon_sum"],
+    )
+    _maybe_expire(db)
+
+
+def expire_density(db: Session, now: Optional[datetime] = None) -> int:
+    """Delete buckets that fell out of the retention window. Returns rows deleted."""
+    now = now or datetime.utcnow()
+    cutoff = bucket_for(now - RETENTION)
+    return db.query(SightingDensityCell).filter(SightingDensityCell.bucket < cutoff).delete(
+        synchronize_session=False
+    )
+
+
+def _maybe_expire(db: Session) -> None:
+    global _last_expired_at
+    if time.monotonic() - _last_expired_at >= EXPIRE_INTERVAL_S:
+        _last_expired_at = time.monotonic()
+        expire_density(db)
+
+
+def query_hotspots(
+    db: Session,
+    west: float,
+    south: float,
+    east: float,
+    north: float,
+    start: datetime,
+    end: datetime,
+    min_count: int,
+):
+    """Return hotspot dicts (centroid and count) for cells at or over ``min_count``."""
+    x_min, y_min, x_max, y_max = tile_range(west, south, east, north, HOTSPOT_ZOOM)
+    total = func.sum(SightingDensityCell.count)
+
+    rows = db.query(
+        SightingDensityCell.x,
+        SightingDensityCell.y,
+        total.label("count"),
+        func.sum(SightingDensityCell.lat_sum).label("lat_sum"),
+        func.sum(SightingDensityCell.lon_sum).label("lon_sum"),
+    ).filter(
+        SightingDensityCell.bucket >= bucket_for(start),
+        SightingDensityCell.bucket <= _to_naive_utc(end),
+        SightingDensityCell.x.between(x_min, x_max),
+        SightingDensityCell.y.between(y_min, y_max),
+    ).group_by(
+        SightingDensityCell.x, SightingDensityCell.y
+    ).having(total >= min_count).order_by(total.desc()).all()
+
+    return [
+        {"lat": r.lat_sum / r.count, "lon": r.lon_sum / r.count, "count": r.count}
+        for r in rows
+    ]
+
+
+def rebuild_density(db: Session, batch_size: int = 10000) -> int:
+    """Recompute the density grid for the retention window from the sightings table."""
+    cutoff = bucket_for(datetime.utcnow() - RETENTION)
+    db.query(SightingDensityCell).delete()
+
+    cells = {}
+    rows = db.query(Sighting.lat, Sighting.lon, Sighting.taken_at).filter(
+        Sighting.taken_at >= cutoff
+    ).yield_per(batch_size)
+    for lat, lon, taken_at in rows:
+        x, y = tile_for(lat, lon, HOTSPOT_ZOOM)
+        key = (bucket_for(taken_at), x, y)
+        cell = cells.setdefault(key, [0, 0.0, 0.0])
+        cell[0] += 1
+        cell[1] += lat
+        cell[2] += lon
+
+    db.bulk_insert_mappings(SightingDensityCell, [
+        {"bucket": b, "x": x, "y": y, "count": c, "lat_sum": la, "lon_sum": lo}
+        for (b, x, y), (c, la, lo) in cells.items()
+    ])
+    db.commit()
+    return sum(c[0] for c in cells.values())
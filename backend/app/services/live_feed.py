@@ -0,0 +1,224 @@
+"""
+Live feed of new sightings for map clients (WebSocket and server-sent events).
+
+A client subscribes with a bbox and an optional species filter, and each new sighting is
+pushed only to the subscriptions that contain it. Subscriptions are indexed in the
+slippy-map tile grid of sighting_grid: a bbox is registered in the (at most 2x2) tiles of
+the finest level that covers it that way, so publishing a point looks up one tile per
+level in use instead of looping over every connection.
+
+Each subscription owns a small bounded queue and a slow client loses its oldest events
+rather than holding up the publisher. An idle connection costs one queue and a few index
+entries, so a worker can hold thousands of them.
+
+Publishing happens on the event loop. With one worker, ``create_sighting`` publishes
+directly; with several, set ``settings.live_feed_tail_seconds`` so each worker tails the
+sighting change log instead and sees inserts from every worker.
+"""
+import asyncio
+import itertools
+import json
+import logging
+from collections import Counter, defaultdict
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from app.config import settings
+from app.schemas import Sighting
+from app.services.sighting_grid import tile_for, tile_range
+
+logger = logging.getLogger(__name__)
+
+MAX_INDEX_LEVEL = 16
+MAX_CELLS_PER_SUBSCRIPTION = 4  # a bbox is registered in at most 2x2 tiles
+
+BBox = Tuple[float, float, float, float]
+
+
+class Subscription:
+    """One connected client: its filter and its outgoing queue of encoded messages."""
+
+    __slots__ = ("id", "bbox", "species_id", "queue", "dropped", "cells")
+
+    def __init__(self, sub_id: int, bbox: Optional[BBox], species_id: Optional[int], queue_size: int):
+        self.id = sub_id
+        self.bbox = bbox
+        self.species_id = species_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.cells: Tuple[Tuple[int, int, int], ...] = ()
+
+    def matches(self, lat: float, lon: float, species_id: int) -> bool:
+        if self.species_id is not None and species_id != self.species_id:
+            return False
+        if self.bbox is None:
+            return True
+        west, south, east, north = self.bbox
+        return south <= lat <= north and west <= lon <= east
+
+    def put(self, message: str) -> None:
+        """Queue a message, dropping the oldest one if the client is not keeping up."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+def index_cells(bbox: Optional[BBox]) -> Tuple[Tuple[int, int, int], ...]:
+    """Tiles (zoom, x, y) a subscription bbox is registered in."""
+    if bbox is None:
+        return ((0, 0, 0),)
+    west, south, east, north = bbox
+    for level in range(MAX_INDEX_LEVEL, -1, -1):
+        x_min, y_min, x_max, y_max = tile_range(west, south, east, north, level)
+        if (x_max - x_min + 1) * (y_max - y_min + 1) <= MAX_CELLS_PER_SUBSCRIPTION:
+            return tuple(
+                (level, x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)
+            )
+    return ((0, 0, 0),)
+
+
+class LiveFeed:
+    """In-process hub of live subscriptions with a tile index over their bboxes."""
+
+    def __init__(self, queue_size: int = 64):
+        self.queue_size = queue_size
+        self._subs: Dict[int, Subscription] = {}
+        self._cells: Dict[Tuple[int, int, int], Set[int]] = defaultdict(set)
+        self._levels: Counter = Counter()  # registered cells per level, to skip empty levels
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self._subs)
+
+    def subscribe(self, bbox: Optional[BBox] = None, species_id: Optional[int] = None) -> Subscription:
+        sub = Subscription(next(self._ids), bbox, species_id, self.queue_size)
+        self._register(sub)
+        self._subs[sub.id] = sub
+        return sub
+
+    def update(self, sub: Subscription, bbox: Optional[BBox], species_id: Optional[int]) -> None:
+        """Move a subscription to a new bbox/species (e.g. when the client pans the map)."""
+        self._unregister(sub)
+        sub.bbox, sub.species_id = bbox, species_id
+        self._register(sub)
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        if self._subs.pop(sub.id, None) is not None:
+            self._unregister(sub)
+
+    def _register(self, sub: Subscription) -> None:
+        sub.cells = index_cells(sub.bbox)
+        for cell in sub.cells:
+            self._cells[cell].add(sub.id)
+            self._levels[cell[0]] += 1
+
+    def _unregister(self, sub: Subscription) -> None:
+        for cell in sub.cells:
+            ids = self._cells.get(cell)
+            if ids is not None:
+                ids.discard(sub.id)
+                if not ids:
+                    del self._cells[cell]
+            self._levels[cell[0]] -= 1
+            if self._levels[cell[0]] <= 0:
+                del self._levels[cell[0]]
+        sub.cells = ()
+
+    def matching(self, lat: float, lon: float, species_id: int):
+        """Subscriptions that want a sighting at (lat, lon) of ``species_id``."""
+        seen = set()
+        for level in list(self._levels):
+            x, y = tile_for(lat, lon, level)
+            for sub_id in self._cells.get((level, x, y), ()):
+                if sub_id in seen:
+                    continue
+                seen.add(sub_id)
+                sub = self._subs[sub_id]
+                if sub.matches(lat, lon, species_id):
+                    yield sub
+
+    def publish(self, row: dict) -> int:
+        """Fan a sighting (shaped like ``schemas.Sighting``) out to matching subscribers."""
+        if not self._subs:
+            return 0
+        message = None
+        delivered = 0
+        for sub in self.matching(row["lat"], row["lon"], row["species_id"]):
+            if message is None:
+                # Encode once, only if someone is listening
+                message = json.dumps(row, default=str)
+            sub.put(message)
+            delivered += 1
+        return delivered
+
+    def publish_sighting(self, sighting) -> int:
+        """Publish an ORM sighting."""
+        if not self._subs:
+            return 0
+        return self.publish(Sighting.model_validate(sighting).model_dump(mode="json"))
+
+    def stats(self) -> dict:
+        return {
+            "subscriptions": len(self._subs),
+            "index_cells": len(self._cells),
+            "dropped": sum(sub.dropped for sub in self._subs.values()),
+        }
+
+
+live_feed = LiveFeed(settings.live_feed_queue_size)
+
+
+async def event_stream(
+    feed: LiveFeed, bbox: Optional[BBox], species_id: Optional[int], keepalive_s: float
+) -> AsyncIterator[str]:
+    """Server-sent event frames for a new subscription, with comment keepalives while idle.
+
+    The subscription only exists while the stream is being iterated, so a response that is
+    never started (the client left first) leaves nothing behind.
+    """
+    sub = feed.subscribe(bbox, species_id)
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(sub.queue.get(), timeout=keepalive_s)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: sighting\ndata: {message}\n\n"
+    finally:
+        feed.unsubscribe(sub)
+
+
+async def run_change_tail(session_factory, interval_s: float) -> None:
+    """Background task: publish sightings inserted by any worker, read from the change log."""
+    from app.models import Sighting as SightingModel, SightingChange
+    from app.services.change_log import latest_seq, settled_changes
+
+    def poll(since: Optional[int], load_rows: bool):
+        db = session_factory()
+        try:
+            if since is None:
+                return latest_seq(db), []
+            changes = settled_changes(db, since).filter(SightingChange.op == "insert").all()
+            if not changes:
+                return since, []
+            seq = max(change.seq for change in changes)
+            if not load_rows:
+                return seq, []
+            ids = [change.sighting_id for change in changes]
+            rows = db.query(SightingModel).filter(SightingModel.id.in_(ids)).all()
+            by_id = {row.id: Sighting.model_validate(row).model_dump(mode="json") for row in rows}
+            return seq, [by_id[i] for i in ids if i in by_id]
+        finally:
+            db.close()
+
+    seq = None
+    while True:
+        try:
+            # Rows are only loaded while someone is listening
+            seq, rows = await asyncio.to_thread(poll, seq, len(live_feed) > 0)
+            for row in rows:
+                live_feed.publish(row)
+        except Exception as e:
+            logger.error(f"Live feed tail failed: {e}")
+        await asyncio.sleep(interval_s)
@@ -0,0 +1,324 @@
+"""
+Streaming, content-addressed storage for media uploaded with a sighting.
+
+Uploaded files are never read whole. Each one is read in ``CHUNK_SIZE`` pieces from the
+multipart parser's spooled file, size-checked and hashed (SHA-256) as it goes. Media is
+stored under its hash (``sightings/photos/<sha256>.jpg``) and recorded in the ``media``
+table with a reference count, so a file that was uploaded before (a retried request, a
+re-posted photo) is not written again: the sighting points at the existing object.
+
+A new file is then streamed to storage in chunks: an S3 multipart upload (see
+S3Service.upload_stream), or a ``.part`` file under uploads/ that is renamed into place
+once complete. Memory per upload stays at a few chunk buffers whatever the file size.
+
+The files of one request are uploaded concurrently (``store_uploads``), all or nothing.
+
+Files are never deleted by the request that stored them, since a concurrent request with
+the same content may be about to use them. Instead every request reserves the media row
+of each file it stores or reuses (committed on its own, with ``refcount`` unchanged, 0 for
+new content) before writing or using it; a row is reused only once ``stored_at`` says the
+file is complete. The periodic ``media.collect`` task (``collect_orphans``) removes files
+no sighting references once their last reservation is
+``settings.media_orphan_grace_seconds`` old: it marks their rows ``collecting_at`` and
+commits, removes the files, then deletes the rows. Reservations skip marked rows, and a
+request that has to write marked content waits until its row is gone.
+
+Limits are enforced twice: ``UploadSizeLimitMiddleware`` rejects a request whose
+Content-Length is already over the total before its body is parsed, and the per-file
+limit stops the copy as soon as a file goes over it.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from app.config import settings
+from app.database import upsert_increment
+from app.models import Media, Task
+from app.services.s3_service import s3_service
+from app.services.task_queue import enqueue, task_handler
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+LOCAL_ROOT = "uploads"
+ORPHAN_BATCH = 100
+COLLECT_STALE_SECONDS = 300  # a collecting mark this old is from a collector that died
+RESERVE_ATTEMPTS = 40
+RESERVE_RETRY_SECONDS = 0.25
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StoredMedia:
+    """
+    Where an upload was stored, with its size and SHA-256 computed on the way.
+    ``created`` is False when the content was already stored and nothing was written.
+    """
+
+    __slots__ = ("url", "size", "sha256", "content_type", "created")
+
+    def __init__(self, url: str, size: int, sha256: str, content_type: str, created: bool = True):
+        self.url = url
+        self.size = size
+        self.sha256 = sha256
+        self.content_type = content_type
+        self.created = created
+
+
+class _Digest:
+    def __init__(self):
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+
+async def _read_upload(upload: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _limited(source: AsyncIterator[bytes], name: str, max_bytes: int, digest: _Digest) -> AsyncIterator[bytes]:
+    async for chunk in source:
+        digest.size += len(chunk)
+        if digest.size > max_bytes:
+            raise UploadTooLarge(f"{name} is larger than {max_bytes} bytes")
+        digest.sha256.update(chunk)
+        yield chunk
+
+
+async def _write_local(chunks: AsyncIterator[bytes], path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique, as two requests may store the same content at once
+    partial = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    f = await run_in_threadpool(open, partial, "wb")
+    try:
+        async for chunk in chunks:
+            await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        f.close()
+        os.remove(partial)
+        raise
+    f.close()
+    os.replace(partial, path)
+
+
+def _collecting_stale() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=COLLECT_STALE_SECONDS)
+
+
+def _reserve_existing(bind, sha256: str) -> Optional[str]:
+    """Reserve the stored media with this hash, if it is complete and not being collected, and return its URL."""
+    db = Session(bind=bind)
+    try:
+        reserved = db.execute(
+            update(Media)
+            .where(Media.sha256 == sha256, Media.stored_at.isnot(None), Media.collecting_at.is_(None))
+            .values(reserved_at=datetime.utcnow())
+        ).rowcount
+        url = db.query(Media.url).filter(Media.sha256 == sha256).scalar() if reserved else None
+        db.commit()
+        return url
+    finally:
+        db.close()
+
+
+def _reserve(bind, sha256: str, url: str, size: int, content_type: str) -> bool:
+    """
+    Reserve the row of content this request is about to write (unreferenced if new, and
+    not reusable until ``_mark_stored``). False while collect_orphans is removing it.
+    """
+    now = datetime.utcnow()
+    table = Media.__table__
+    db = Session(bind=bind)
+    try:
+        result = upsert_increment(db, table, [
+            {"sha256": sha256, "url": url, "size": size, "content_type": content_type, "refcount": 0,
+             "reserved_at": now, "stored_at": None, "collecting_at": None, "created_at": now}
+        ], ["sha256"], ["refcount"], ["reserved_at", "stored_at", "collecting_at"],
+            where=or_(table.c.collecting_at.is_(None), table.c.collecting_at < _collecting_stale()))
+        db.commit()
+        return result.rowcount == 1
+    finally:
+        db.close()
+
+
+def _mark_stored(bind, sha256: str) -> None:
+    db = Session(bind=bind)
+    try:
+        db.execute(update(Media).where(Media.sha256 == sha256).values(stored_at=datetime.utcnow()))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def store_upload(db: Session, upload: UploadFile, kind: str, max_bytes: int) -> StoredMedia:
+    """
+    Store ``upload`` under ``kind`` (photos/audio) in S3 (if configured) or local storage,
+    unless the same content is already stored.
+    """
+    content_type = s3_service.get_content_type(upload.filename or "")
+    # First pass over the parser's spooled copy: size limit and hash, no storage I/O
+    digest = _Digest()
+    async for _ in _limited(_read_upload(upload), upload.filename or "file", max_bytes, digest):
+        pass
+    sha256 = digest.sha256.hexdigest()
+
+    bind = db.get_bind()
+    file_name = f"{sha256}{os.path.splitext(upload.filename or '')[1].lower()}"
+    if settings.aws_s3_bucket_name:
+        url = s3_service.public_url(f"sightings/{kind}/{file_name}")
+    else:
+        url = f"{LOCAL_ROOT}/{kind}/{file_name}"
+    for _ in range(RESERVE_ATTEMPTS):
+        existing = await run_in_threadpool(_reserve_existing, bind, sha256)
+        if existing:
+            return StoredMedia(existing, digest.size, sha256, content_type, created=False)
+        if await run_in_threadpool(_reserve, bind, sha256, url, digest.size, content_type):
+            break
+        # Being removed by collect_orphans; stored again once it is gone
+        await asyncio.sleep(RESERVE_RETRY_SECONDS)
+    else:
+        raise RuntimeError(f"{file_name} is being removed from storage, try again")
+
+    await upload.seek(0)
+    if settings.aws_s3_bucket_name:
+        url = await s3_service.upload_stream(_read_upload(upload), file_name, content_type, folder=f"sightings/{kind}")
+    else:
+        await _write_local(_read_upload(upload), url)
+    await run_in_threadpool(_mark_stored, bind, sha256)
+    return StoredMedia(url, digest.size, sha256, content_type)
+
+
+async def store_local_stream(source: AsyncIterator[bytes], path: str, max_bytes: int) -> StoredMedia:
+    """Write a raw request body (a signed direct upload) to ``path`` under uploads/."""
+    digest = _Digest()
+    await _write_local(_limited(source, os.path.basename(path), max_bytes, digest), path)
+    return StoredMedia(path, digest.size, digest.sha256.hexdigest(), s3_service.get_content_type(path))
+
+
+async def store_uploads(db: Session, uploads: List[Tuple[UploadFile, str, int]]) -> List[StoredMedia]:
+    """``store_upload`` each (upload, kind, max_bytes) concurrently, all or nothing."""
+    results = await asyncio.gather(*(store_upload(db, *upload) for upload in uploads), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        raise errors[0]
+    return results
+
+
+def record_media(db: Session, stored: List[StoredMedia]) -> None:
+    """Count a reference to each stored file; commits with the sighting that uses them."""
+    upsert_increment(db, Media.__table__, [
+        {"sha256": media.sha256, "url": media.url, "size": media.size,
+         "content_type": media.content_type, "refcount": 1, "stored_at": datetime.utcnow(), "created_at": datetime.utcnow()}
+        for media in stored
+    ], ["sha256"], ["refcount"])
+
+
+def _mark_orphans(bind) -> List[Tuple[str, str, datetime]]:
+    """Mark up to ORPHAN_BATCH collectable rows ``collecting_at`` and commit; returns (sha256, url, mark)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.media_orphan_grace_seconds)
+    orphaned = (
+        Media.refcount == 0,
+        Media.reserved_at < cutoff,
+        or_(Media.collecting_at.is_(None), Media.collecting_at < _collecting_stale()),
+    )
+    mark = datetime.utcnow()
+    db = Session(bind=bind)
+    try:
+        batch = select(Media.sha256).where(*orphaned).limit(ORPHAN_BATCH)
+        db.execute(update(Media).where(Media.sha256.in_(batch), *orphaned).values(collecting_at=mark))
+        rows = db.query(Media.sha256, Media.url).filter(Media.collecting_at == mark).all()
+        db.commit()
+        return [(sha256, url, mark) for sha256, url in rows]
+    finally:
+        db.close()
+
+
+def _finish_collecting(bind, sha256: str, mark: datetime, removed: bool) -> None:
+    """Delete the row of a removed file, or unmark it to be retried."""
+    db = Session(bind=bind)
+    try:
+        mine = (Media.sha256 == sha256, Media.collecting_at == mark)
+        if removed:
+            db.execute(delete(Media).where(*mine))
+        else:
+            db.execute(update(Media).where(*mine).values(collecting_at=None))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def collect_orphans(bind) -> int:
+    """
+    Remove up to ORPHAN_BATCH stored files that no sighting references and no request
+    has reserved within ``settings.media_orphan_grace_seconds``. No transaction is
+    open while a file is removed: rows are marked first, and deleted afterwards.
+    """
+    removed = 0
+    for sha256, url, mark in await run_in_threadpool(_mark_orphans, bind):
+        try:
+            if url.startswith(f"{LOCAL_ROOT}/"):
+                if os.path.exists(url):
+                    await run_in_threadpool(os.remove, url)
+            elif not await s3_service.delete_file(url):
+                raise RuntimeError("S3 delete failed")
+            done = True
+        except Exception as e:
+            logger.error(f"Could not remove unused media {url}: {e}")
+            done = False
+        await run_in_threadpool(_finish_collecting, bind, sha256, mark, done)
+        if done:
+            removed += 1
+    return removed
+
+
+@task_handler("media.collect", concurrency=1)
+async def _collect(db: Session, payload: dict) -> None:
+    """Collect unused media, then queue the next run."""
+    await collect_orphans(db.get_bind())
+    schedule_collection(db, settings.media_collect_interval_seconds)
+
+
+def schedule_collection(db: Session, delay_seconds: float = 0) -> None:
+    """Queue a media.collect run unless one is queued already (each run queues the next)."""
+    if db.query(Task.id).filter(Task.kind == "media.collect", Task.status == "queued").first() is None:
+        enqueue(db, "media.collect", {}, delay_seconds)
+        db.commit()
+
+
+def max_request_bytes() -> int:
+    # Both files at their limits plus room for the form fields and multipart framing
+    return settings.media_max_photo_bytes + settings.media_max_audio_bytes + 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """Reject uploads to ``paths`` whose declared Content-Length is over ``max_request_bytes``."""
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and int(value) > max_request_bytes():
+                        response = JSONResponse({"detail": "Upload too large"}, status_code=413)
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
@@ -0,0 +1,153 @@
+"""
+Radius and k-nearest-neighbour sighting queries around a point.
+
+Every mode prefilters with a bbox through the spatial index, reading only
+(id, lat, lon) for the candidates, and then computes exact haversine distances for all
+of them at once with NumPy. Full rows are loaded only for the winners, sorted by
+distance.
+
+    radius    the bbox around the circle, then the exact distance cut
+    k         an expanding search: start small and grow the radius 4x until at least k
+              candidates fall inside the circle (anything outside is farther, so those k
+              are the true nearest), optionally capped by ``radius_m``
+    species   same as k, except that for a rare species (few sightings overall, read from
+              the coarsest stored grid level) all of its sightings are scanned directly through the
+              (species_id, lat, lon, id) index, instead of growing a bbox over everyone
+              else's sightings
+"""
+import math
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import Sighting, SightingGridSpecies
+from app.services.serialization import SIGHTING_COLUMNS, rows_to_dicts
+from app.services.sighting_grid import GRID_MIN_ZOOM
+from app.services.spatial_index import bbox_filter
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.radians(1) * EARTH_RADIUS_M  # of latitude, on the sphere haversine_m uses
+INITIAL_RADIUS_M = 2000.0
+MAX_RADIUS_M = math.pi * EARTH_RADIUS_M  # half the circumference reaches everywhere
+RARE_SPECIES_MAX_SIGHTINGS = 20000
+
+
+def haversine_m(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances in meters from one point to arrays of points."""
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lons) - math.radians(lon)
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bbox_around(lat: float, lon: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) containing the circle; the full longitude range near the poles or antimeridian."""
+    dlat = radius_m / METERS_PER_DEGREE
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+    if cos_lat <= 1e-6:
+        return -180.0, south, 180.0, north
+    dlon = radius_m / (METERS_PER_DEGREE * cos_lat)
+    if dlon >= 180.0 or lon - dlon < -180.0 or lon + dlon > 180.0:
+        return -180.0, south, 180.0, north
+    return lon - dlon, south, lon + dlon, north
+
+
+class NearbyFilters:
+    """Filters shared by every candidate query."""
+
+    def __init__(self, species_id: Optional[int] = None, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        self.species_id = species_id
+        self.start = start
+        self.end = end
+
+    def apply(self, query):
+        if self.species_id:
+            query = query.filter(Sighting.species_id == self.species_id)
+        if self.start is not None:
+            query = query.filter(Sighting.taken_at >= self.start)
+        if self.end is not None:
+            query = query.filter(Sighting.taken_at <= self.end)
+        return query
+
+
+def _candidates(query):
+    rows = query.all()
+    if not rows:
+        return [], np.empty(0), np.empty(0)
+    ids, lats, lons = zip(*rows)
+    return list(ids), np.fromiter(lats, dtype=np.float64, count=len(rows)), np.fromiter(lons, dtype=np.float64, count=len(rows))
+
+
+def _in_bbox(db: Session, lat: float, lon: float, radius_m: float, filters: NearbyFilters):
+    dialect = db.get_bind().dialect.name
+    query = db.query(Sighting.id, Sighting.lat, Sighting.lon).filter(
+        bbox_filter(Sighting, dialect, *bbox_around(lat, lon, radius_m))
+    )
+    return _candidates(filters.apply(query))
+
+
+def _nearest(ids: List[str], distances: np.ndarray, limit: int, radius_m: Optional[float]):
+    """(id, distance) of the ``limit`` closest candidates within ``radius_m``, closest first."""
+    if radius_m is not None:
+        keep = np.flatnonzero(distances <= radius_m)
+    else:
+        keep = np.arange(len(ids))
+    if len(keep) > limit:
+        keep = keep[np.argpartition(distances[keep], limit - 1)[:limit]]
+    keep = keep[np.argsort(distances[keep], kind="stable")]
+    return [(ids[i], float(distances[i])) for i in keep]
+
+
+def _load(db: Session, nearest) -> List[dict]:
+    if not nearest:
+        return []
+    rows = rows_to_dicts(db.query(*SIGHTING_COLUMNS).filter(Sighting.id.in_([i for i, _ in nearest])).all())
+    by_id = {row["id"]: row for row in rows}
+    items = []
+    for sighting_id, distance in nearest:
+        row = by_id.get(sighting_id)
+        if row is not None:
+            row["distance_m"] = round(distance, 1)
+            items.append(row)
+    return items
+
+
+def species_total(db: Session, species_id: int) -> int:
+    """Sightings of a species overall, summed from the coarsest stored grid level."""
+    count = db.query(func.sum(SightingGridSpecies.count)).filter(
+        SightingGridSpecies.zoom == GRID_MIN_ZOOM, SightingGridSpecies.species_id == species_id,
+    ).scalar()
+    return count or 0
+
+
+def query_radius(db: Session, lat: float, lon: float, radius_m: float, limit: int, filters: NearbyFilters) -> List[dict]:
+    """Sightings within ``radius_m``, closest first, at most ``limit``."""
+    ids, lats, lons = _in_bbox(db, lat, lon, radius_m, filters)
+    return _load(db, _nearest(ids, haversine_m(lat, lon, lats, lons), limit, radius_m))
+
+
+def query_knn(
+    db: Session, lat: float, lon: float, k: int, filters: NearbyFilters, radius_m: Optional[float] = None
+) -> List[dict]:
+    """The ``k`` sightings closest to the point (within ``radius_m`` if given), closest first."""
+    limit_radius = min(radius_m, MAX_RADIUS_M) if radius_m is not None else MAX_RADIUS_M
+
+    if filters.species_id and species_total(db, filters.species_id) <= RARE_SPECIES_MAX_SIGHTINGS:
+        # Rare species: scanning all of its sightings beats growing a bbox over everyone else's
+        query = filters.apply(db.query(Sighting.id, Sighting.lat, Sighting.lon))
+        ids, lats, lons = _candidates(query)
+        return _load(db, _nearest(ids, haversine_m(lat, lon, lats, lons), k, limit_radius))
+
+    search = min(INITIAL_RADIUS_M, limit_radius)
+    while True:
+        ids, lats, lons = _in_bbox(db, lat, lon, search, filters)
+        distances = haversine_m(lat, lon, lats, lons)
+        if search >= limit_radius or int(np.count_nonzero(distances <= search)) >= k:
+            return _load(db, _nearest(ids, distances, k, search))
+        search = min(search * 4, limit_radius)
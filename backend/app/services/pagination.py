@@ -0,0 +1,38 @@
+"""
+Keyset (cursor) pagination helpers for sighting lists.
+
+Pages are ordered by ``(taken_at DESC, id DESC)``. A cursor encodes the sort key of the
+last row of a page, so the next page is a single index range scan no matter how deep
+the client has paged (unlike OFFSET, which re-reads every skipped row).
+"""
+import base64
+from datetime import datetime
+from typing import Tuple
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def encode_cursor(taken_at: datetime, sighting_id: str) -> str:
+    """Build an opaque, URL-safe cursor from the sort key of a row."""
+    raw = f"{taken_at.isoformat()}|{sighting_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of ``encode_cursor``."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        taken_at, sighting_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(taken_at), sighting_id
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def apply_keyset(query, model, cursor: str):
+    """Restrict ``query`` to rows strictly after ``cursor`` in (taken_at, id) DESC order."""
+    taken_at, sighting_id = decode_cursor(cursor)
+    return query.filter(tuple_(model.taken_at, model.id) < tuple_(taken_at, sighting_id))
@@ -0,0 +1,374 @@
+"""
+Resumable media uploads in the style of tus (https://tus.io, core protocol 1.0.0 with the
+creation, termination and expiration extensions), for long audio recordings sent over
+unreliable networks.
+
+1. ``create_upload`` records an upload of a declared length (POST /v1/sightings/uploads).
+2. The client PATCHes the bytes in order, each request starting at the current offset.
+   ``append`` stores what arrives and advances the offset, also when the connection
+   drops halfway, so after a failure the client asks for the offset (HEAD) and resumes
+   from the last acknowledged byte instead of starting over.
+3. Once every byte has arrived the file is in its final place; ``finalize_uploads``
+   consumes the uploads and the caller creates the sighting from them.
+
+One PATCH at a time appends to an upload, whichever worker it reaches: it claims the
+upload with a conditional UPDATE of ``locked_by`` (a token) and ``locked_until``, renews
+the claim while bytes arrive, and advances the offset only if it still holds it. Another
+PATCH or a DELETE meanwhile gets 423; the claim of a request that died lapses after
+``settings.resumable_upload_lock_seconds``.
+
+Locally, the bytes are appended to ``<key>.part`` under uploads/ (fsynced before they are
+acknowledged) and the file is renamed into place once the final offset is committed. With S3 they go into a
+multipart upload in parts of MULTIPART_PART_SIZE; bytes that do not fill a part yet are
+kept in a small ``<key>.tail-<n>`` object (n = parts before it), so any worker can resume
+the upload. Unfinished or unused uploads expire after
+``settings.resumable_upload_ttl_seconds``, together with their data.
+"""
+import base64
+import binascii
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from app.config import settings
+from app.models import ResumableUpload
+from app.services.direct_upload import KINDS, _key, max_bytes, media_url
+from app.services.media_upload import UploadTooLarge
+from app.services.s3_service import MULTIPART_PART_SIZE, s3_service
+
+TUS_VERSION = "1.0.0"
+TUS_EXTENSIONS = "creation,termination,expiration"
+EXPIRE_BATCH = 100
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def parse_metadata(header: Optional[str]) -> Dict[str, str]:
+    """Decode an Upload-Metadata header: comma-separated ``key base64(value)`` pairs."""
+    metadata = {}
+    for pair in (header or "").split(","):
+        if not pair.strip():
+            continue
+        key, _, value = pair.strip().partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode("utf-8") if value else ""
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(400, f"Invalid Upload-Metadata value for {key!r}")
+    return metadata
+
+
+def _kind(metadata: Dict[str, str], filename: str) -> str:
+    kind = metadata.get("kind")
+    if kind is None:
+        content_type = metadata.get("filetype") or s3_service.get_content_type(filename)
+        kind = "photo" if content_type.startswith("image/") else "audio"
+    if kind not in KINDS:
+        raise UploadError(400, f"kind must be one of {', '.join(KINDS)}")
+    return kind
+
+
+async def create_upload(db: Session, length: int, metadata: Dict[str, str]) -> ResumableUpload:
+    """
+    Record an upload of ``length`` bytes. ``metadata`` should name the ``filename``; the
+    ``kind`` (photo/audio) defaults to what its ``filetype`` or extension says.
+    """
+    filename = os.path.basename(metadata.get("filename") or "recording.m4a")
+    kind = _kind(metadata, filename)
+    if length > max_bytes(kind):
+        raise UploadError(413, f"{kind} is larger than {max_bytes(kind)} bytes")
+
+    await expire_uploads(db)
+    upload = ResumableUpload(
+        kind=kind,
+        key=_key(kind, filename),
+        content_type=s3_service.get_content_type(filename),
+        length=length,
+        offset=0,
+        expires_at=datetime.utcnow() + timedelta(seconds=settings.resumable_upload_ttl_seconds),
+    )
+    db.add(upload)
+    db.commit()
+    return upload
+
+
+def get_upload(db: Session, upload_id: str) -> ResumableUpload:
+    upload = db.query(ResumableUpload).filter(ResumableUpload.id == upload_id).first()
+    if not upload:
+        raise UploadError(404, "Upload not found")
+    if upload.expires_at < datetime.utcnow():
+        raise UploadError(410, "Upload expired")
+    return upload
+
+
+def _check_length(upload: ResumableUpload, offset: int) -> None:
+    if offset > upload.length:
+        raise UploadTooLarge(f"The upload is {upload.length} bytes long")
+
+
+def _partial_path(upload: ResumableUpload) -> str:
+    return f"{upload.key}.part"
+
+
+def _tail_key(upload: ResumableUpload, n_parts: int) -> str:
+    return f"{upload.key}.tail-{n_parts}"
+
+
+def _sync(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+
+async def _append_local(upload: ResumableUpload, chunks: AsyncIterator[bytes]) -> int:
+    path = _partial_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = await run_in_threadpool(open, path, "r+b" if os.path.exists(path) else "wb")
+    offset = upload.offset
+    try:
+        # Anything past the acknowledged offset is from a request that failed before it was acknowledged
+        f.truncate(offset)
+        f.seek(offset)
+        try:
+            async for chunk in chunks:
+                _check_length(upload, offset + len(chunk))
+                await run_in_threadpool(f.write, chunk)
+                offset += len(chunk)
+        except ClientDisconnect:
+            pass  # keep what arrived
+        await run_in_threadpool(_sync, f)
+    finally:
+        f.close()
+    return offset
+
+
+def _complete_local(upload: ResumableUpload) -> None:
+    """Move a finished local upload into place; only once its final offset is committed."""
+    path = _partial_path(upload)
+    if os.path.exists(path):
+        os.replace(path, upload.key)
+
+
+async def _append_s3(db: Session, upload: ResumableUpload, chunks: AsyncIterator[bytes]) -> int:
+    parts = list(upload.parts or [])
+    buffer = bytearray()
+    offset = upload.offset
+    if offset > len(parts) * MULTIPART_PART_SIZE:
+        tail = await s3_service.download_file(_tail_key(upload, len(parts)))
+        buffer += tail[:offset - len(parts) * MULTIPART_PART_SIZE]
+
+    async def send_part(data: bytes):
+        if upload.s3_upload_id is None:
+            upload.s3_upload_id = await s3_service.create_multipart_upload(upload.key, upload.content_type)
+            db.commit()  # so the multipart upload is aborted on expiry whatever happens next
+        parts.append(await s3_service.upload_part(upload.key, upload.s3_upload_id, len(parts) + 1, data))
+
+    try:
+        async for chunk in chunks:
+            _check_length(upload, offset + len(chunk))
+            buffer += chunk
+            offset += len(chunk)
+            while len(buffer) >= MULTIPART_PART_SIZE:
+                await send_part(bytes(buffer[:MULTIPART_PART_SIZE]))
+                del buffer[:MULTIPART_PART_SIZE]
+    except ClientDisconnect:
+        pass
+
+    if offset == upload.length:
+        if upload.s3_upload_id is None:
+            # Smaller than one part: a single object
+            folder, file_name = upload.key.rsplit("/", 1)
+            await s3_service.upload_file(bytes(buffer), file_name, upload.content_type, folder)
+        else:
+            if buffer:
+                await send_part(bytes(buffer))
+            await s3_service.complete_multipart_upload(upload.key, upload.s3_upload_id, parts)
+            upload.s3_upload_id = None
+    elif buffer:
+        await s3_service.put_object(_tail_key(upload, len(parts)), bytes(buffer))
+    upload.parts = parts
+    return offset
+
+
+def _unclaimed(now: datetime):
+    return or_(ResumableUpload.locked_by.is_(None), ResumableUpload.locked_until < now)
+
+
+def _claim(db: Session, upload_id: str, offset: int) -> str:
+    """Claim the upload for a PATCH at ``offset``, committed at once; returns the claim token."""
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    claimed = db.query(ResumableUpload).filter(
+        ResumableUpload.id == upload_id,
+        ResumableUpload.offset == offset,
+        ResumableUpload.expires_at >= now,
+        _unclaimed(now),
+    ).update({
+        "locked_by": token,
+        "locked_until": now + timedelta(seconds=settings.resumable_upload_lock_seconds),
+    }, synchronize_session=False)
+    db.commit()
+    if not claimed:
+        current = db.query(ResumableUpload.offset).filter(ResumableUpload.id == upload_id).scalar()
+        if current is None:
+            raise UploadError(404, "Upload not found")
+        if current != offset:
+            raise UploadError(409, f"Upload-Offset must be {current}")
+        raise UploadError(423, "Another request is uploading to this upload")
+    return token
+
+
+def _renew(bind, upload_id: str, token: str) -> bool:
+    db = Session(bind=bind)
+    try:
+        renewed = db.query(ResumableUpload).filter(
+            ResumableUpload.id == upload_id, ResumableUpload.locked_by == token
+        ).update({
+            "locked_until": datetime.utcnow() + timedelta(seconds=settings.resumable_upload_lock_seconds),
+        }, synchronize_session=False)
+        db.commit()
+        return bool(renewed)
+    finally:
+        db.close()
+
+
+def _release(db: Session, upload_id: str, token: str) -> None:
+    db.query(ResumableUpload).filter(
+        ResumableUpload.id == upload_id, ResumableUpload.locked_by == token
+    ).update({"locked_by": None, "locked_until": None}, synchronize_session=False)
+    db.commit()
+
+
+async def _renewing(bind, upload_id: str, token: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Pass ``chunks`` on, renewing the claim before the next one once a third of it has
+    passed, so bytes are only written while the claim is held.
+    """
+    renewed = time.monotonic()
+    async for chunk in chunks:
+        if time.monotonic() - renewed > settings.resumable_upload_lock_seconds / 3:
+            if not _renew(bind, upload_id, token):
+                raise UploadError(409, "The upload was taken over by another request")
+            renewed = time.monotonic()
+        yield chunk
+
+
+async def append(db: Session, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> ResumableUpload:
+    """
+    Store the bytes of a PATCH that starts at ``offset`` and acknowledge them; returns the
+    upload with its new offset. A dropped connection keeps the bytes that arrived.
+    """
+    upload = get_upload(db, upload_id)
+    if offset != upload.offset:
+        raise UploadError(409, f"Upload-Offset must be {upload.offset}")
+    token = _claim(db, upload_id, offset)
+
+    previous_parts = len(upload.parts or [])
+    chunks = _renewing(db.get_bind(), upload_id, token, chunks)
+    try:
+        if settings.aws_s3_bucket_name:
+            new_offset = await _append_s3(db, upload, chunks)
+        else:
+            new_offset = await _append_local(upload, chunks)
+        # Only while this request still holds the claim, which it gives up
+        updated = db.query(ResumableUpload).filter(
+            ResumableUpload.id == upload_id, ResumableUpload.locked_by == token, ResumableUpload.offset == offset
+        ).update({"offset": new_offset, "parts": upload.parts, "s3_upload_id": upload.s3_upload_id,
+                  "locked_by": None, "locked_until": None},
+                 synchronize_session=False)
+        if not updated:
+            raise UploadError(409, "The upload was changed by another request")
+        db.commit()
+    except BaseException:
+        db.rollback()
+        _release(db, upload_id, token)
+        raise
+
+    db.refresh(upload)
+    if upload.offset == upload.length and not settings.aws_s3_bucket_name:
+        _complete_local(upload)
+    if settings.aws_s3_bucket_name and offset > previous_parts * MULTIPART_PART_SIZE:
+        if new_offset == upload.length or len(upload.parts or []) != previous_parts:
+            # The tail went into a part (or the finished object)
+            await _delete_key(_tail_key(upload, previous_parts))
+    return upload
+
+
+async def _delete_key(key: str) -> None:
+    if settings.aws_s3_bucket_name:
+        await s3_service.delete_file(s3_service.public_url(key))
+    elif os.path.exists(key):
+        os.remove(key)
+
+
+async def _discard(upload: ResumableUpload) -> None:
+    """Remove whatever was stored for an upload."""
+    if upload.offset == upload.length:
+        await _delete_key(upload.key)
+        if not settings.aws_s3_bucket_name:
+            await _delete_key(_partial_path(upload))  # if it was not moved into place yet
+    elif settings.aws_s3_bucket_name:
+        if upload.s3_upload_id:
+            await s3_service.abort_multipart_upload(upload.key, upload.s3_upload_id)
+        if upload.offset > len(upload.parts or []) * MULTIPART_PART_SIZE:
+            await _delete_key(_tail_key(upload, len(upload.parts or [])))
+    else:
+        await _delete_key(_partial_path(upload))
+
+
+async def delete_upload(db: Session, upload_id: str) -> None:
+    """Terminate an upload and remove its data."""
+    upload = get_upload(db, upload_id)
+    # Only if no PATCH holds it; the row stays locked by the delete until the data is gone
+    deleted = db.query(ResumableUpload).filter(
+        ResumableUpload.id == upload_id, _unclaimed(datetime.utcnow())
+    ).delete(synchronize_session=False)
+    if not deleted:
+        db.rollback()
+        raise UploadError(423, "Another request is uploading to this upload")
+    await _discard(upload)
+    db.commit()
+
+
+async def finalize_uploads(db: Session, upload_ids: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+    """
+    Consume the finished uploads named in ``upload_ids`` ({"photo": id, "audio": id});
+    returns {"media_url", "audio_url"}. The caller adds the sighting in the same transaction.
+    """
+    urls = {"media_url": None, "audio_url": None}
+    for kind, field in (("photo", "media_url"), ("audio", "audio_url")):
+        upload_id = upload_ids.get(kind)
+        if not upload_id:
+            continue
+        upload = get_upload(db, upload_id)
+        if upload.kind != kind:
+            raise UploadError(400, f"Upload {upload_id} is not a {kind}")
+        if upload.offset < upload.length:
+            raise UploadError(409, f"{kind} upload is incomplete ({upload.offset} of {upload.length} bytes)")
+        if not settings.aws_s3_bucket_name:
+            _complete_local(upload)  # in case the PATCH that finished it stopped short of that
+        urls[field] = media_url(upload.key)
+        db.delete(upload)
+    return urls
+
+
+async def expire_uploads(db: Session) -> int:
+    """Delete up to EXPIRE_BATCH expired uploads no PATCH holds, and their data."""
+    now = datetime.utcnow()
+    expired = db.query(ResumableUpload).filter(
+        ResumableUpload.expires_at < now, _unclaimed(now)
+    ).limit(EXPIRE_BATCH).all()
+    for upload in expired:
+        await _discard(upload)
+        db.delete(upload)
+    return len(expired)
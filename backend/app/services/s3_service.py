@@ -1,125 +1,311 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Optional
+
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
-import os
-from typing import Optional
 from app.config import settings
 
+# S3 requires every part but the last to be at least 5 MiB
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+
+ACL_UNSUPPORTED_CODES = {"AccessControlListNotSupported", "InvalidRequest"}
+
+
+def _acl_unsupported(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ACL_UNSUPPORTED_CODES
+
+
 class S3Service:
-    """Service for handling S3 file uploads"""
-    
+    """
+    Service for handling S3 file uploads
+
+    boto3 is blocking, so every call runs on a dedicated thread pool the size of the
+    client's connection pool (``settings.s3_max_connections``); the event loop never
+    waits on S3 and at most that many requests are in flight. botocore retries
+    throttling, 5xx and connection errors (``settings.s3_max_attempts``, standard mode).
+
+    Whether the bucket accepts ACLs is probed once (bucket ownership controls) and
+    cached, so uploads to a bucket with ACLs disabled do not fail and retry every time.
+    """
+
     def __init__(self):
         self.s3_client = None
         self.bucket_name = settings.aws_s3_bucket_name
-        
+        self._executor = None
+        self._acl_supported: Optional[bool] = None
+        self._acl_lock = threading.Lock()
+
         # Only initialize S3 client if credentials are available
         if settings.aws_access_key_id and settings.aws_secret_access_key and settings.aws_s3_bucket_name:
             self.s3_client = boto3.client(
                 's3',
                 aws_access_key_id=settings.aws_access_key_id,
                 aws_secret_access_key=settings.aws_secret_access_key,
-                region_name=settings.aws_region
+                region_name=settings.aws_region,
+                endpoint_url=settings.aws_s3_endpoint_url,
+                config=Config(
+                    max_pool_connections=settings.s3_max_connections,
+                    retries={"max_attempts": settings.s3_max_attempts, "mode": "standard"},
+                )
             )
-        
+            self._executor = ThreadPoolExecutor(max_workers=settings.s3_max_connections, thread_name_prefix="s3")
+
+    async def _call(self, method: str, **kwargs):
+        """Run a boto3 client method on the S3 thread pool"""
+        if self.s3_client is None:
+            raise Exception("S3 client not initialized. Please configure AWS credentials in .env file.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(getattr(self.s3_client, method), **kwargs))
+
+    def _probe_acl(self) -> bool:
+        """Whether objects can be given an ACL; True when the bucket does not say otherwise"""
+        try:
+            controls = self.s3_client.get_bucket_ownership_controls(Bucket=self.bucket_name)
+        except ClientError:
+            # No ownership controls (ACLs allowed), or not allowed to read them: try ACLs
+            # and learn from the first refusal
+            return True
+        rules = controls.get("OwnershipControls", {}).get("Rules", [])
+        return not any(rule.get("ObjectOwnership") == "BucketOwnerEnforced" for rule in rules)
+
+    async def _acl_args(self) -> dict:
+        if self._acl_supported is None:
+            loop = asyncio.get_running_loop()
+            supported = await loop.run_in_executor(self._executor, self._probe_acl)
+            with self._acl_lock:
+                if self._acl_supported is None:
+                    self._acl_supported = supported
+        return {"ACL": "public-read"} if self._acl_supported else {}
+
+    async def _call_with_acl(self, method: str, **kwargs):
+        """Call ``method`` with a public-read ACL if the bucket takes ACLs"""
+        acl = await self._acl_args()
+        try:
+            return await self._call(method, **kwargs, **acl)
+        except ClientError as e:
+            if acl and _acl_unsupported(e):
+                self._acl_supported = False
+                return await self._call(method, **kwargs)
+            raise
+
+    def public_url(self, s3_key: str) -> str:
+        if settings.aws_s3_endpoint_url:
+            return f"{settings.aws_s3_endpoint_url.rstrip('/')}/{self.bucket_name}/{s3_key}"
+        return f"https://{self.bucket_name}.s3.{settings.aws_region}.amazonaws.com/{s3_key}"
+
+    def key_from_url(self, file_url: str) -> Optional[str]:
+        prefix = self.public_url("")
+        if file_url.startswith(prefix):
+            return file_url[len(prefix):]
+        # URL format: https://bucket-name.s3.region.amazonaws.com/folder/filename
+        parts = file_url.split('.amazonaws.com/')
+        return parts[1] if len(parts) == 2 else None
+
     async def upload_file(
-        self, 
-        file_content: bytes, 
-        file_name: str, 
+        self,
+        file_content: bytes,
+        file_name: str,
         content_type: str,
         folder: str = "sightings"
     ) -> str:
         """
         Upload a file to S3 and return the public URL
-        
+
         Args:
             file_content: The file content as bytes
             file_name: The name to save the file as in S3
             content_type: The MIME type of the file (e.g., 'image/jpeg', 'audio/mpeg')
             folder: The folder prefix in S3 (e.g., 'sightings', 'audio')
-            
+
         Returns:
             The public URL of the uploaded file
         """
         try:
             # Create the S3 key (path)
             s3_key = f"{folder}/{file_name}"
-            
-            # Upload file to S3
-            if self.s3_client is None:
-                raise Exception("S3 client not initialized. Please configure AWS credentials in .env file.")
-            
-            # Try to upload with ACL first (for buckets with ACL enabled)
-            try:
-                self.s3_client.put_object(
-                    Bucket=self.bucket_name,
-                    Key=s3_key,
-                    Body=file_content,
-                    ContentType=content_type,
-                    ACL='public-read'  # Make file publicly accessible
-                )
-            except Exception as e:
-                # If ACL is not supported, upload without ACL and make bucket public
-                if 'AccessControlListNotSupported' in str(e) or 'Invalid request' in str(e):
-                    self.s3_client.put_object(
-                        Bucket=self.bucket_name,
-                        Key=s3_key,
-                        Body=file_content,
-                        ContentType=content_type
-                    )
-                else:
-                    raise
-            
-            # Generate public URL
-            url = f"https://{self.bucket_name}.s3.{settings.aws_region}.amazonaws.com/{s3_key}"
-            
-            return url
-            
+
+            await self._call_with_acl(
+                "put_object",
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                Body=file_content,
+                ContentType=content_type
+            )
+
+            return self.public_url(s3_key)
+
         except ClientError as e:
             print(f"Error uploading file to S3: {e}")
             raise Exception(f"Failed to upload file to S3: {str(e)}")
-    
+
+    async def upload_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        file_name: str,
+        content_type: str,
+        folder: str = "sightings"
+    ) -> str:
+        """
+        Upload a file to S3 from an async iterator of chunks and return the public URL
+
+        Chunks are gathered into parts of MULTIPART_PART_SIZE and sent with a multipart
+        upload, so at most one part is held in memory. Files smaller than one part are
+        sent with a single put_object. A failed multipart upload is aborted.
+        """
+        if self.s3_client is None:
+            raise Exception("S3 client not initialized. Please configure AWS credentials in .env file.")
+
+        s3_key = f"{folder}/{file_name}"
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+
+        async def send_part():
+            part_number = len(parts) + 1
+            response = await self._call(
+                "upload_part", Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id,
+                PartNumber=part_number, Body=bytes(buffer)
+            )
+            parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+            buffer.clear()
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                if len(buffer) >= MULTIPART_PART_SIZE:
+                    if upload_id is None:
+                        response = await self._call_with_acl(
+                            "create_multipart_upload", Bucket=self.bucket_name, Key=s3_key, ContentType=content_type
+                        )
+                        upload_id = response['UploadId']
+                    await send_part()
+
+            if upload_id is None:
+                # Small file: one request
+                return await self.upload_file(bytes(buffer), file_name, content_type, folder)
+
+            if buffer:
+                await send_part()
+            await self._call(
+                "complete_multipart_upload", Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            if upload_id is not None:
+                try:
+                    await self._call("abort_multipart_upload", Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+                except ClientError as e:
+                    print(f"Error aborting multipart upload: {e}")
+            raise
+
+        return self.public_url(s3_key)
+
+    async def create_multipart_upload(self, s3_key: str, content_type: str) -> str:
+        """Start a multipart upload that parts are added to over several requests; returns its id"""
+        response = await self._call_with_acl(
+            "create_multipart_upload", Bucket=self.bucket_name, Key=s3_key, ContentType=content_type
+        )
+        return response['UploadId']
+
+    async def upload_part(self, s3_key: str, upload_id: str, part_number: int, data: bytes) -> dict:
+        """Upload one part; returns the {'ETag', 'PartNumber'} entry completing the upload needs"""
+        response = await self._call(
+            "upload_part", Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id,
+            PartNumber=part_number, Body=data
+        )
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+    async def complete_multipart_upload(self, s3_key: str, upload_id: str, parts: list) -> None:
+        await self._call(
+            "complete_multipart_upload", Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+
+    async def abort_multipart_upload(self, s3_key: str, upload_id: str) -> None:
+        await self._call("abort_multipart_upload", Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+
+    async def put_object(self, s3_key: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+        """Store ``data`` under ``s3_key`` as is (private, no ACL)"""
+        await self._call("put_object", Bucket=self.bucket_name, Key=s3_key, Body=data, ContentType=content_type)
+
+    async def presigned_put(self, s3_key: str, content_type: str, expires_in: int):
+        """
+        A presigned PUT URL for ``s3_key`` and the headers the client must send with it
+
+        Returns:
+            (url, headers)
+        """
+        if self.s3_client is None:
+            raise Exception("S3 client not initialized. Please configure AWS credentials in .env file.")
+        params = {"Bucket": self.bucket_name, "Key": s3_key, "ContentType": content_type}
+        headers = {"Content-Type": content_type}
+        if await self._acl_args():
+            params["ACL"] = "public-read"
+            headers["x-amz-acl"] = "public-read"
+        # Signing is local, no request is made
+        url = self.s3_client.generate_presigned_url("put_object", Params=params, ExpiresIn=expires_in)
+        return url, headers
+
+    async def object_size(self, s3_key: str) -> Optional[int]:
+        """Size of an uploaded object, or None if it does not exist"""
+        try:
+            response = await self._call("head_object", Bucket=self.bucket_name, Key=s3_key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return response["ContentLength"]
+
+    def _read_object(self, s3_key: str) -> bytes:
+        return self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)["Body"].read()
+
+    async def download_file(self, s3_key: str) -> bytes:
+        """Whole content of an object (used for photos, which are size-limited)"""
+        if self.s3_client is None:
+            raise Exception("S3 client not initialized. Please configure AWS credentials in .env file.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._read_object, s3_key)
+
     async def delete_file(self, file_url: str) -> bool:
         """
         Delete a file from S3 based on its URL
-        
+
         Args:
             file_url: The public URL of the file to delete
-            
+
         Returns:
             True if successful, False otherwise
         """
         try:
-            # Extract the key from the URL
-            # URL format: https://bucket-name.s3.region.amazonaws.com/folder/filename
-            parts = file_url.split('.amazonaws.com/')
-            if len(parts) != 2:
+            s3_key = self.key_from_url(file_url)
+            if s3_key is None:
                 return False
-                
-            s3_key = parts[1]
-            
+
             # Delete the object
-            self.s3_client.delete_object(
-                Bucket=self.bucket_name,
-                Key=s3_key
-            )
-            
+            await self._call("delete_object", Bucket=self.bucket_name, Key=s3_key)
+
             return True
-            
+
         except ClientError as e:
             print(f"Error deleting file from S3: {e}")
             return False
-    
+
     def get_content_type(self, filename: str) -> str:
         """
         Determine content type based on file extension
-        
+
         Args:
             filename: The filename
-            
+
         Returns:
             MIME type string
         """
         extension = filename.split('.')[-1].lower() if '.' in filename else ''
-        
+
         content_types = {
             'jpg': 'image/jpeg',
             'jpeg': 'image/jpeg',
@@ -132,6 +318,8 @@ class S3Service:
             'ogg': 'audio/ogg',
             'flac': 'audio/flac',
         }
-        
+
         return content_types.get(extension, 'application/octet-stream')
 
+
+s3_service = S3Service()
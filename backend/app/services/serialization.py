@@ -0,0 +1,146 @@
+"""
+Fast JSON encoding for sightings list responses.
+
+The default path loads ORM objects, validates each into a ``schemas.Sighting`` and lets
+FastAPI run the result through ``jsonable_encoder`` and the stdlib ``json`` module. The
+fast path selects only the response columns as plain tuples and encodes the whole page
+in one call through pre-built pydantic ``TypeAdapter``s over TypedDicts, which serialize
+in pydantic-core without building model instances.
+
+Two shapes are available:
+
+    object   ``{"items": [{...}, ...], "next_cursor": ...}`` (same JSON as ``SightingList``)
+    compact  ``{"count": n, "next_cursor": ..., "columns": {"id": [...], "lat": [...], ...}}``
+             parallel arrays, requested with ``Accept: application/vnd.sightings.compact+json``
+
+Either shape can also carry ``"species": {id: {...}}``, one entry per distinct species
+referenced by the page (bundle mode), and either can be limited to a sparse fieldset
+(see fields.py): only those columns are selected and serialized.
+"""
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+
+from app.models import Sighting
+from app.schemas import Sighting as SightingSchema
+from app.services.fields import Fields, project, sparse_row_type
+
+COMPACT_MEDIA_TYPE = "application/vnd.sightings.compact+json"
+
+# Columns behind ``schemas.Sighting``
+SIGHTING_COLUMNS = [
+    Sighting.id,
+    Sighting.username,
+    Sighting.species_id,
+    Sighting.lat,
+    Sighting.lon,
+    Sighting.taken_at,
+    Sighting.is_private,
+    Sighting.media_thumb_url,
+    Sighting.media_medium_url,
+    Sighting.media_url,
+    Sighting.caption,
+    Sighting.created_at,
+]
+COLUMN_NAMES = [column.key for column in SIGHTING_COLUMNS]
+
+
+class SightingRow(TypedDict):
+    id: str
+    username: Optional[str]
+    species_id: int
+    lat: float
+    lon: float
+    taken_at: datetime
+    is_private: bool
+    media_thumb_url: Optional[str]
+    media_medium_url: Optional[str]
+    media_url: Optional[str]
+    caption: Optional[str]
+    created_at: Optional[datetime]
+
+
+class SightingPage(TypedDict):
+    items: List[SightingRow]
+    next_cursor: Optional[str]
+
+
+class CompactSightingPage(TypedDict):
+    count: int
+    next_cursor: Optional[str]
+    columns: Dict[str, list]
+
+
+class SpeciesInfo(TypedDict):
+    id: int
+    common_name: Optional[str]
+    scientific_name: Optional[str]
+    description: Optional[str]
+    main_image: Optional[str]
+
+
+class SightingBundlePage(SightingPage):
+    species: Dict[int, SpeciesInfo]
+
+
+class CompactSightingBundlePage(CompactSightingPage):
+    species: Dict[int, SpeciesInfo]
+
+
+_page_adapter = TypeAdapter(SightingPage)
+_compact_adapter = TypeAdapter(CompactSightingPage)
+_bundle_adapter = TypeAdapter(SightingBundlePage)
+_compact_bundle_adapter = TypeAdapter(CompactSightingBundlePage)
+
+
+@lru_cache(maxsize=256)
+def _sparse_page_adapter(fields: Fields, bundle: bool) -> TypeAdapter:
+    page = {"items": List[sparse_row_type(SightingSchema, fields)], "next_cursor": Optional[str]}
+    if bundle:
+        page["species"] = Dict[int, SpeciesInfo]
+    return TypeAdapter(TypedDict("SparseSightingPage", page))
+
+
+def select_columns(fields: Optional[Fields], required: Tuple[str, ...] = ("id", "taken_at")) -> list:
+    """``SIGHTING_COLUMNS`` limited to ``fields`` plus ``required`` (needed for the cursor)."""
+    if fields is None:
+        return SIGHTING_COLUMNS
+    names = set(fields) | set(required)
+    return [column for column in SIGHTING_COLUMNS if column.key in names]
+
+
+def rows_to_dicts(rows, columns=SIGHTING_COLUMNS) -> List[dict]:
+    """Turn ``columns`` tuples (``SIGHTING_COLUMNS`` by default) into dicts shaped like ``SightingRow``."""
+    names = [column.key for column in columns]
+    return [dict(zip(names, row)) for row in rows]
+
+
+def dump_page(
+    rows: List[dict], next_cursor: Optional[str], species: Optional[Dict[int, dict]] = None, fields: Optional[Fields] = None
+) -> bytes:
+    if fields is not None:
+        page = {"items": project(rows, fields), "next_cursor": next_cursor}
+        if species is not None:
+            page["species"] = species
+        return _sparse_page_adapter(fields, species is not None).dump_json(page)
+    page = {"items": rows, "next_cursor": next_cursor}
+    if species is None:
+        return _page_adapter.dump_json(page)
+    return _bundle_adapter.dump_json({**page, "species": species})
+
+
+def dump_compact(
+    rows: List[dict], next_cursor: Optional[str], species: Optional[Dict[int, dict]] = None, fields: Optional[Fields] = None
+) -> bytes:
+    columns = {name: [row[name] for row in rows] for name in (fields or SightingRow.__annotations__)}
+    page = {"count": len(rows), "next_cursor": next_cursor, "columns": columns}
+    if species is None:
+        return _compact_adapter.dump_json(page)
+    return _compact_bundle_adapter.dump_json({**page, "species": species})
+
+
+def wants_compact(accept: Optional[str]) -> bool:
+    return bool(accept) and COMPACT_MEDIA_TYPE in accept
@@ -0,0 +1,280 @@
+"""
+Hierarchical grid of pre-aggregated sightings used for map clustering.
+
+Every sighting is counted in one web-mercator cell (the slippy-map tile grid) per zoom
+level from ``GRID_MIN_ZOOM`` to ``GRID_MAX_ZOOM``. A cell keeps its count, coordinate sums
+(for the centroid) and per-species counts, so a cluster query reads a bounded number of
+pre-aggregated rows instead of the raw sightings in view.
+
+The coarser levels are not stored: a handful of cells would take every insert (all of
+them the single zoom-0 cell), and on PostgreSQL their row locks would serialize
+concurrent writers. They are summed from the ``GRID_MIN_ZOOM`` cells when read, at most
+``4 ** GRID_MIN_ZOOM`` rows.
+
+Inserts are counted explicitly by the write paths (``add_sighting_to_grid``,
+``add_points_to_grid``). ORM deletes, and ORM updates that move a sighting, are taken
+out of (and put back into) this grid and the hotspot density grid by a ``before_flush``
+hook; bulk ``Query.delete()`` calls bypass it, so callers use ``remove_bulk_delete``.
+Every change, including a privacy flip, bumps the ``version`` of the cells involved,
+which tile ETags and the facet cache are keyed on.
+"""
+import math
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from app.database import upsert_increment
+from app.models import Sighting, SightingGridCell, SightingGridSpecies, Species
+
+GRID_MIN_ZOOM = 5  # coarser levels are summed from this one on read
+GRID_MAX_ZOOM = 16
+CLUSTER_DETAIL = 3  # cluster cells are 2**3 = 8x smaller than a map tile at the requested zoom
+MAX_CLUSTER_CELLS = 4096  # coarsen the grid if a viewport would span more cells than this
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def tile_position(lat: float, lon: float, zoom: int) -> Tuple[float, float]:
+    """Return the fractional (x, y) tile coordinates of a point at ``zoom``."""
+    n = 1 << zoom
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return x, y
+
+
+def tile_for(lat: float, lon: float, zoom: int) -> Tuple[int, int]:
+    """Return the (x, y) slippy-map tile containing the point at ``zoom``."""
+    n = 1 << zoom
+    x, y = tile_position(lat, lon, zoom)
+    return min(max(int(x), 0), n - 1), min(max(int(y), 0), n - 1)
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return (west, south, east, north) of a slippy-map tile."""
+    n = 1 << zoom
+
+    def lat_of(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat_of(y + 1), (x + 1) / n * 360.0 - 180.0, lat_of(y)
+
+
+def tile_range(west: float, south: float, east: float, north: float, zoom: int) -> Tuple[int, int, int, int]:
+    """Return the inclusive (x_min, y_min, x_max, y_max) tile range covering a bbox."""
+    x_min, y_min = tile_for(north, west, zoom)
+    x_max, y_max = tile_for(south, east, zoom)
+    return x_min, y_min, x_max, y_max
+
+
+def add_sighting_to_grid(db: Session, sighting: Sighting, delta: int = 1) -> None:
+    """
+    Count ``sighting`` in every grid level (pass ``delta=-1`` to remove it).
+    Runs inside the caller's transaction so the grid commits with the row.
+    """
+    add_points_to_grid(db, [(sighting.lat, sighting.lon, sighting.species_id)], delta)
+
+
+def add_points_to_grid(db: Session, points: Iterable[Tuple[float, float, int]], delta: int = 1) -> None:
+    """
+    Count many (lat, lon, species_id) sightings in every stored grid level, merged per cell
+    so each cell is upserted once. Runs inside the caller's transaction.
+    """
+    cells: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    species: Dict[tuple, int] = defaultdict(int)
+    for lat, lon, species_id in points:
+        for zoom in range(GRID_MIN_ZOOM, GRID_MAX_ZOOM + 1):
+            x, y = tile_for(lat, lon, zoom)
+            cell = cells[(zoom, x, y)]
+            cell[0] += delta
+            cell[1] += lat * delta
+            cell[2] += lon * delta
+            species[(zoom, x, y, species_id)] += delta
+
+    upsert_increment(db, SightingGridCell.__table__, [
+        {"zoom": z, "x": x, "y": y, "count": c, "lat_sum": la, "lon_sum": lo, "version": 1}
+        for (z, x, y), (c, la, lo) in cells.items()
+    ], ["zoom", "x", "y"], ["count", "lat_sum", "lon_sum", "version"])
+    upsert_increment(db, SightingGridSpecies.__table__, [
+        {"zoom": z, "x": x, "y": y, "species_id": s, "count": c}
+        for (z, x, y, s), c in species.items()
+    ], ["zoom", "x", "y", "species_id"], ["count"])
+
+
+def _remove_points(db: Session, points: List[tuple]) -> None:
+    """Uncount (lat, lon, species_id, taken_at) sightings from the grid and the density grid."""
+    from app.services.hotspots import add_points_to_density
+
+    if points:
+        add_points_to_grid(db, [(lat, lon, species_id) for lat, lon, species_id, _ in points], delta=-1)
+        add_points_to_density(db, [(lat, lon, taken_at) for lat, lon, _, taken_at in points], -1)
+
+
+def remove_bulk_delete(db: Session, query) -> None:
+    """Uncount every sighting matched by ``query`` before it is bulk-deleted, in the same transaction."""
+    _remove_points(db, query.with_entities(
+        Sighting.lat, Sighting.lon, Sighting.species_id, Sighting.taken_at
+    ).all())
+
+
+_TRACKED = ("lat", "lon", "species_id", "taken_at")
+
+
+def _before_flush(session: Session, flush_context, instances) -> None:
+    removed, added, touched = [], [], []
+    for sighting in session.deleted:
+        if isinstance(sighting, Sighting):
+            removed.append(tuple(getattr(sighting, name) for name in _TRACKED))
+    for sighting in session.dirty:
+        if not isinstance(sighting, Sighting):
+            continue
+        attrs = inspect(sighting).attrs
+        histories = [attrs[name].load_history() for name in _TRACKED]
+        if not any(history.has_changes() for history in histories):
+            if attrs.is_private.load_history().has_changes():
+                # Counts stay, but tiles and facets built before the flip are stale
+                touched.append((sighting.lat, sighting.lon, sighting.species_id))
+            continue
+        old = [
+            history.deleted[0] if history.deleted else getattr(sighting, name)
+            for name, history in zip(_TRACKED, histories)
+        ]
+        removed.append(tuple(old))
+        added.append(tuple(getattr(sighting, name) for name in _TRACKED))
+
+    _remove_points(session, removed)
+    if added:
+        from app.services.hotspots import add_points_to_density
+
+        add_points_to_grid(session, [(lat, lon, species_id) for lat, lon, species_id, _ in added])
+        add_points_to_density(session, [(lat, lon, taken_at) for lat, lon, _, taken_at in added])
+    if touched:
+        add_points_to_grid(session, touched, delta=0)  # bumps the cell versions only
+
+
+event.listen(Session, "before_flush", _before_flush)
+
+
+def rebuild_grid(db: Session, batch_size: int = 10000) -> int:
+    """Recompute the whole grid from the sightings table. Returns the number of sightings counted."""
+    cells: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    species: Dict[tuple, int] = defaultdict(int)
+
+    total = 0
+    rows = db.query(Sighting.lat, Sighting.lon, Sighting.species_id).yield_per(batch_size)
+    for lat, lon, species_id in rows:
+        total += 1
+        for zoom in range(GRID_MIN_ZOOM, GRID_MAX_ZOOM + 1):
+            x, y = tile_for(lat, lon, zoom)
+            cell = cells[(zoom, x, y)]
+            cell[0] += 1
+            cell[1] += lat
+            cell[2] += lon
+            species[(zoom, x, y, species_id)] += 1
+
+    # Start versions from the clock so rebuilt cells never reuse an ETag handed out before
+    version = int(time.time())
+
+    db.query(SightingGridSpecies).delete()
+    db.query(SightingGridCell).delete()
+    db.bulk_insert_mappings(SightingGridCell, [
+        {"zoom": z, "x": x, "y": y, "count": c, "lat_sum": la, "lon_sum": lo, "version": version}
+        for (z, x, y), (c, la, lo) in cells.items()
+    ])
+    db.bulk_insert_mappings(SightingGridSpecies, [
+        {"zoom": z, "x": x, "y": y, "species_id": s, "count": c}
+        for (z, x, y, s), c in species.items()
+    ])
+    db.commit()
+    return total
+
+
+def level_query(db: Session, model, level: int, tiles: Tuple[int, int, int, int], keys=(), sums=()):
+    """
+    Query ``model`` (SightingGridCell or SightingGridSpecies) rows of ``level`` inside the
+    inclusive tile range, as (x, y, *keys, *sums). Levels below GRID_MIN_ZOOM are summed
+    from their GRID_MIN_ZOOM cells, grouped by (x, y, *keys); a summed ``version`` still
+    changes whenever a child's does.
+    """
+    x_min, y_min, x_max, y_max = tiles
+    key_columns = [getattr(model, name) for name in keys]
+    if level >= GRID_MIN_ZOOM:
+        return db.query(model.x, model.y, *key_columns, *(getattr(model, name) for name in sums)).filter(
+            model.zoom == level, model.x.between(x_min, x_max), model.y.between(y_min, y_max)
+        )
+    factor = 1 << (GRID_MIN_ZOOM - level)
+    x, y = (model.x // factor).label("x"), (model.y // factor).label("y")
+    return db.query(x, y, *key_columns, *(func.sum(getattr(model, name)).label(name) for name in sums)).filter(
+        model.zoom == GRID_MIN_ZOOM,
+        model.x.between(x_min * factor, (x_max + 1) * factor - 1),
+        model.y.between(y_min * factor, (y_max + 1) * factor - 1),
+    ).group_by(x, y, *key_columns)
+
+
+def cell_version(db: Session, zoom: int, x: int, y: int) -> int:
+    """
+    Change counter of a tile. Tiles deeper than the grid use their ancestor cell, whose
+    version changes whenever anything inside the tile does (and occasionally more often).
+    """
+    if zoom > GRID_MAX_ZOOM:
+        shift = zoom - GRID_MAX_ZOOM
+        zoom, x, y = GRID_MAX_ZOOM, x >> shift, y >> shift
+    row = level_query(db, SightingGridCell, zoom, (x, y, x, y), sums=("version",)).first()
+    return (row.version if row else None) or 0
+
+
+def cluster_level(west: float, south: float, east: float, north: float, zoom: int) -> int:
+    """Pick the grid level for a viewport: finer than the map zoom, but never too many cells."""
+    level = min(zoom + CLUSTER_DETAIL, GRID_MAX_ZOOM)
+    while level > 0:
+        x_min, y_min, x_max, y_max = tile_range(west, south, east, north, level)
+        if (x_max - x_min + 1) * (y_max - y_min + 1) <= MAX_CLUSTER_CELLS:
+            break
+        level -= 1
+    return level
+
+
+def query_clusters(db: Session, west: float, south: float, east: float, north: float, zoom: int):
+    """
+    Return (level, clusters) for a viewport, where each cluster is a dict with the cell's
+    centroid, count and most frequent species.
+    """
+    level = cluster_level(west, south, east, north, zoom)
+    x_min, y_min, x_max, y_max = tile_range(west, south, east, north, level)
+    tiles = (x_min, y_min, x_max, y_max)
+
+    cells = level_query(
+        db, SightingGridCell, level, tiles, sums=("count", "lat_sum", "lon_sum")
+    ).filter(SightingGridCell.count > 0).all()
+    if not cells:
+        return level, []
+
+    # Most frequent species per cell
+    top: Dict[Tuple[int, int], Tuple[int, int]] = {}
+    species_rows = level_query(
+        db, SightingGridSpecies, level, tiles, keys=("species_id",), sums=("count",)
+    ).filter(SightingGridSpecies.count > 0)
+    for x, y, species_id, count in species_rows:
+        best = top.get((x, y))
+        if best is None or count > best[1]:
+            top[(x, y)] = (species_id, count)
+
+    species_ids = {species_id for species_id, _ in top.values()}
+    names = dict(
+        db.query(Species.id, Species.common_name).filter(Species.id.in_(species_ids)).all()
+    ) if species_ids else {}
+
+    clusters = []
+    for cell in cells:
+        species_id, species_count = top.get((cell.x, cell.y), (None, 0))
+        clusters.append({
+            "lat": cell.lat_sum / cell.count,
+            "lon": cell.lon_sum / cell.count,
+            "count": cell.count,
+            "top_species_id": species_id,
+            "top_species_name": names.get(species_id),
+            "top_species_count": species_count,
+        })
+    return level, clusters
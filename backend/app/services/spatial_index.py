@@ -0,0 +1,167 @@
+"""
+Spatial index for the sightings table.
+
+Two backends are supported:
+    - PostgreSQL: a PostGIS ``geom`` column generated from lat/lon, with a GiST index
+    - SQLite: an R*Tree virtual table (``sightings_rtree``), kept in sync with triggers.
+      Its integer keys come from ``sightings_rtree_keys`` (an INTEGER PRIMARY KEY per
+      sighting id) rather than from the sightings rowid, which VACUUM may renumber
+      because ``sightings.id`` is a TEXT primary key
+
+The DDL is attached to the ``sightings`` table so it runs whenever
+``Base.metadata.create_all`` creates the table (app startup, tests, init scripts).
+``ensure_spatial_index`` covers databases whose tables already existed.
+
+PostGIS needs ``CREATE EXTENSION`` rights, which managed databases often do not grant.
+Whether the ``geom`` column and its index actually exist is recorded, and until they do
+``bbox_filter`` uses the plain lat/lon range predicate on PostgreSQL.
+"""
+import logging
+
+from sqlalchemy import DDL, and_, event, func, literal_column, select, table, column, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+RTREE_TABLE = "sightings_rtree"
+RTREE_KEYS_TABLE = "sightings_rtree_keys"
+GIST_INDEX = "ix_sightings_geom"
+
+_KEY_OF = "(SELECT key FROM {keys} WHERE sighting_id = {row}.id)"
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(id, min_lon, max_lon, min_lat, max_lat)",
+    f"CREATE TABLE IF NOT EXISTS {RTREE_KEYS_TABLE} (key INTEGER PRIMARY KEY, sighting_id TEXT NOT NULL UNIQUE)",
+    f"""CREATE TRIGGER IF NOT EXISTS sightings_spatial_insert AFTER INSERT ON sightings BEGIN
+        INSERT INTO {RTREE_KEYS_TABLE} (sighting_id) VALUES (NEW.id);
+        INSERT INTO {RTREE_TABLE} VALUES ({_KEY_OF.format(keys=RTREE_KEYS_TABLE, row="NEW")}, NEW.lon, NEW.lon, NEW.lat, NEW.lat);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS sightings_spatial_update AFTER UPDATE OF lat, lon ON sightings BEGIN
+        UPDATE {RTREE_TABLE} SET min_lon = NEW.lon, max_lon = NEW.lon, min_lat = NEW.lat, max_lat = NEW.lat
+        WHERE id = {_KEY_OF.format(keys=RTREE_KEYS_TABLE, row="NEW")};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS sightings_spatial_delete AFTER DELETE ON sightings BEGIN
+        DELETE FROM {RTREE_TABLE} WHERE id = {_KEY_OF.format(keys=RTREE_KEYS_TABLE, row="OLD")};
+        DELETE FROM {RTREE_KEYS_TABLE} WHERE sighting_id = OLD.id;
+    END""",
+    # Backfill rows that were inserted before the triggers existed
+    f"""INSERT INTO {RTREE_KEYS_TABLE} (sighting_id)
+        SELECT s.id FROM sightings s
+        WHERE NOT EXISTS (SELECT 1 FROM {RTREE_KEYS_TABLE} k WHERE k.sighting_id = s.id)""",
+    f"""INSERT INTO {RTREE_TABLE} (id, min_lon, max_lon, min_lat, max_lat)
+        SELECT k.key, s.lon, s.lon, s.lat, s.lat FROM {RTREE_KEYS_TABLE} k JOIN sightings s ON s.id = k.sighting_id
+        WHERE NOT EXISTS (SELECT 1 FROM {RTREE_TABLE} r WHERE r.id = k.key)""",
+]
+
+# The first version keyed the R*Tree on the sightings rowid; replaced where still present
+SQLITE_LEGACY_DDL = [
+    "DROP TRIGGER IF EXISTS sightings_rtree_insert",
+    "DROP TRIGGER IF EXISTS sightings_rtree_update",
+    "DROP TRIGGER IF EXISTS sightings_rtree_delete",
+    f"DROP TABLE IF EXISTS {RTREE_TABLE}",
+]
+SQLITE_LEGACY_CHECK = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'sightings_rtree_insert'"
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    """ALTER TABLE sightings ADD COLUMN IF NOT EXISTS geom geometry(Point, 4326)
+        GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(lon, lat), 4326)) STORED""",
+    f"CREATE INDEX IF NOT EXISTS {GIST_INDEX} ON sightings USING GIST (geom)",
+]
+# The index is created last, so it existing means the geom column does too
+POSTGRES_CHECK = f"SELECT 1 FROM pg_indexes WHERE tablename = 'sightings' AND indexname = '{GIST_INDEX}'"
+
+# Set once the PostGIS column and index are known to exist
+_postgis_ready = False
+
+_rtree = table(RTREE_TABLE, column("id"), column("min_lon"), column("max_lon"), column("min_lat"), column("max_lat"))
+_rtree_keys = table(RTREE_KEYS_TABLE, column("key"), column("sighting_id"))
+
+
+def register_spatial_index(sightings_table) -> None:
+    """Attach backend-specific spatial index DDL to the sightings table lifecycle."""
+    for statement in SQLITE_DDL:
+        event.listen(sightings_table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    event.listen(sightings_table, "after_create", _after_create)
+    # Triggers go away with the table, the R*Tree and its keys do not
+    for name in (RTREE_TABLE, RTREE_KEYS_TABLE):
+        event.listen(sightings_table, "after_drop", DDL(f"DROP TABLE IF EXISTS {name}").execute_if(dialect="sqlite"))
+
+
+def _after_create(target, connection, **kw) -> None:
+    if connection.dialect.name == "postgresql":
+        create_postgis_index(connection)
+
+
+def create_postgis_index(conn) -> bool:
+    """
+    Add the PostGIS column and index (in a savepoint, so a failure leaves the caller's
+    transaction usable) and record whether they exist; returns that.
+    """
+    global _postgis_ready
+    try:
+        with conn.begin_nested():
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+    except Exception as e:
+        logger.error(f"Could not create PostGIS index, area filters use lat/lon ranges: {e}")
+    try:
+        _postgis_ready = conn.execute(text(POSTGRES_CHECK)).first() is not None
+    except Exception:
+        _postgis_ready = False
+    return _postgis_ready
+
+
+def ensure_spatial_index(engine: Engine) -> None:
+    """Create the spatial index on an existing database (idempotent)."""
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        with engine.begin() as conn:
+            if create_postgis_index(conn):
+                logger.info(f"Spatial index ready ({dialect})")
+        return
+    if dialect != "sqlite":
+        return
+    try:
+        with engine.begin() as conn:
+            if conn.execute(text(SQLITE_LEGACY_CHECK)).first() is not None:
+                for statement in SQLITE_LEGACY_DDL:
+                    conn.execute(text(statement))
+            for statement in SQLITE_DDL:
+                conn.execute(text(statement))
+        logger.info(f"Spatial index ready ({dialect})")
+    except Exception as e:
+        logger.error(f"Could not create spatial index on {dialect}: {e}")
+
+
+def bbox_filter(model, dialect: str, west: float, south: float, east: float, north: float):
+    """
+    Build a WHERE clause selecting rows of ``model`` inside the bounding box.
+
+    The index predicate narrows candidates; the plain range predicates are kept so the
+    result is exact (the R*Tree stores 32-bit floats rounded outwards). They are used on
+    their own where there is no index (PostgreSQL without PostGIS, other databases).
+    """
+    exact = and_(
+        model.lat >= south,
+        model.lat <= north,
+        model.lon >= west,
+        model.lon <= east,
+    )
+
+    if dialect == "sqlite":
+        candidates = select(_rtree_keys.c.sighting_id).select_from(
+            _rtree.join(_rtree_keys, _rtree_keys.c.key == _rtree.c.id)
+        ).where(
+            _rtree.c.min_lon <= east,
+            _rtree.c.max_lon >= west,
+            _rtree.c.min_lat <= north,
+            _rtree.c.max_lat >= south,
+        )
+        return and_(model.id.in_(candidates), exact)
+
+    if dialect == "postgresql" and _postgis_ready:
+        envelope = func.ST_MakeEnvelope(west, south, east, north, 4326)
+        return and_(literal_column(f"{model.__tablename__}.geom").op("&&")(envelope), exact)
+
+    return exact
@@ -0,0 +1,98 @@
+"""
+Species entries for the map bundle, and the Wikipedia enrichment behind them.
+
+Species are enriched from Wikipedia (English name, description, main image) by
+GET /v1/species/{id} and by the species.enrich task that /v1/identify/* queues. The
+result is stored on the species row, so every worker serves it without calling out, and
+is refreshed once it is older than ``settings.species_wiki_cache_hours``. Bundled
+sightings responses include the description and image of every referenced species:
+species that were never enriched are bundled with their database description and no
+image.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Species
+
+
+def _stale_before() -> datetime:
+    return datetime.utcnow() - timedelta(hours=settings.species_wiki_cache_hours)
+
+
+def wiki_details(species: Species) -> Optional[dict]:
+    """The stored enrichment of ``species`` in the shape Wikipedia lookups return, or None."""
+    if species.enriched_at is None:
+        return None
+    return {
+        "english_name": species.english_name,
+        "description": species.wiki_description,
+        "other_sources": species.other_sources or [],
+        "main_image": species.main_image,
+    }
+
+
+def needs_enrichment(species: Species) -> bool:
+    return species.enriched_at is None or species.enriched_at < _stale_before()
+
+
+def save_wiki(species: Species, wiki: dict) -> bool:
+    """
+    Store an enrichment on ``species`` (the caller commits) and fill in its missing
+    details. Failed lookups are not stored, so the stored data is kept or retried.
+    """
+    if not (wiki.get("english_name") or wiki.get("description") or wiki.get("main_image")):
+        return False
+    species.english_name = wiki.get("english_name")
+    species.wiki_description = wiki.get("description")
+    species.main_image = wiki.get("main_image")
+    if wiki.get("other_sources"):
+        species.other_sources = wiki["other_sources"]
+    if species.description is None and wiki.get("description"):
+        species.description = wiki["description"]
+    species.enriched_at = datetime.utcnow()
+    return True
+
+
+def request_enrichment(db: Session, species_id: int) -> bool:
+    """
+    Mark ``species_id`` as having an enrichment queued, in the caller's transaction.
+    True only if it needs one and none was requested within the refresh window, so
+    concurrent callers on any worker queue a single species.enrich task between them.
+    """
+    stale_before = _stale_before()
+    result = db.execute(
+        update(Species)
+        .where(
+            Species.id == species_id,
+            or_(Species.enriched_at.is_(None), Species.enriched_at < stale_before),
+            or_(Species.enrich_requested_at.is_(None), Species.enrich_requested_at < stale_before),
+        )
+        .values(enrich_requested_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def species_bundle(db: Session, species_ids: Iterable[int]) -> Dict[int, dict]:
+    """Entries for the distinct ``species_ids``, keyed by id, in one query."""
+    ids = set(species_ids)
+    if not ids:
+        return {}
+    rows = db.query(
+        Species.id, Species.common_name, Species.scientific_name, Species.description,
+        Species.wiki_description, Species.main_image,
+    ).filter(Species.id.in_(ids)).all()
+    return {
+        species_id: {
+            "id": species_id,
+            "common_name": common_name,
+            "scientific_name": scientific_name,
+            "description": wiki_description or description,
+            "main_image": main_image,
+        }
+        for species_id, common_name, scientific_name, description, wiki_description, main_image in rows
+    }
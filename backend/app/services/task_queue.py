@@ -0,0 +1,249 @@
+"""
+Durable background tasks, queued in the ``tasks`` table of the main database.
+
+Follow-up work (photo variants, species enrichment) is enqueued in the same transaction
+as the change that needs it, so it is neither lost when a worker dies nor run for a
+change that rolled back. Every API worker runs a ``TaskRunner`` that claims due tasks
+and runs them on its event loop; there is no broker, so this works the same on SQLite
+and PostgreSQL.
+
+A claim is one conditional UPDATE that marks due rows ``running`` and moves their
+``run_at`` forward by the visibility timeout. If the runner dies or hangs, the task
+becomes due again once that lapses and any runner picks it up. Each claim has a token,
+so a runner that lost its claim cannot finish a task another one has taken over.
+
+A failed task is retried with exponential backoff up to ``task_max_attempts`` times and
+then kept as ``failed`` with its last error; handlers raise ``PermanentTaskError`` for
+failures a retry cannot fix. Finished tasks are deleted.
+"""
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Task
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 3600
+
+Handler = Callable[[Session, dict], Awaitable[None]]
+
+
+class PermanentTaskError(Exception):
+    """Raised by a handler when retrying cannot help; the task is marked failed at once."""
+
+
+class _Registration:
+    __slots__ = ("handler", "concurrency")
+
+    def __init__(self, handler: Handler, concurrency: Optional[int]):
+        self.handler = handler
+        self.concurrency = concurrency
+
+
+HANDLERS: Dict[str, _Registration] = {}
+
+
+def task_handler(kind: str, concurrency: Optional[int] = None):
+    """
+    Register ``async def handler(db, payload)`` for tasks of ``kind``. ``concurrency``
+    limits how many of them one worker runs at once (within ``task_concurrency``).
+    """
+    def register(handler: Handler) -> Handler:
+        HANDLERS[kind] = _Registration(handler, concurrency)
+        return handler
+    return register
+
+
+def _wake_after_commit(db: Session) -> None:
+    event.listen(db, "after_commit", lambda session: task_runner.wake(), once=True)
+
+
+def enqueue(db: Session, kind: str, payload: dict, delay_seconds: float = 0) -> None:
+    """Queue a task in the caller's transaction; it becomes visible to runners on commit."""
+    enqueue_many(db, kind, [payload], delay_seconds)
+
+
+def enqueue_many(db: Session, kind: str, payloads: List[dict], delay_seconds: float = 0) -> None:
+    """Queue one task per payload with a single INSERT, in the caller's transaction."""
+    if not payloads:
+        return
+    run_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+    db.execute(insert(Task), [
+        {"kind": kind, "payload": payload, "status": "queued", "attempts": 0, "run_at": run_at, "created_at": run_at}
+        for payload in payloads
+    ])
+    _wake_after_commit(db)
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay before the next attempt after ``attempts`` failed ones, with some jitter."""
+    delay = min(settings.task_backoff_seconds * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(1.0, 1.25)
+
+
+class _Claimed:
+    __slots__ = ("id", "kind", "payload", "attempts", "claim")
+
+    def __init__(self, id: int, kind: str, payload: dict, attempts: int, claim: str):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.claim = claim
+
+
+class TaskRunner:
+    """Claims due tasks and runs them, at most ``concurrency`` at a time."""
+
+    def __init__(self, session_factory=None, concurrency: Optional[int] = None):
+        self.session_factory = session_factory
+        self.concurrency = concurrency or settings.task_concurrency
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._running: Dict[int, str] = {}  # task id -> kind
+        self._tasks = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def wake(self) -> None:
+        """Look for due tasks now instead of at the next poll."""
+        if self._wake is not None and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _free_slots(self) -> Dict[str, int]:
+        free = self.concurrency - len(self._running)
+        slots = {}
+        for kind, registration in HANDLERS.items():
+            limit = free
+            if registration.concurrency is not None:
+                running = sum(1 for running_kind in self._running.values() if running_kind == kind)
+                limit = min(limit, registration.concurrency - running)
+            if limit > 0:
+                slots[kind] = limit
+        return slots
+
+    def _claim(self, slots: Dict[str, int]) -> List[_Claimed]:
+        """Claim up to ``slots[kind]`` due tasks of each kind, one UPDATE per kind."""
+        claimed = []
+        db = self.session_factory()
+        try:
+            for kind, limit in slots.items():
+                limit = min(limit, self.concurrency - len(self._running) - len(claimed))
+                if limit <= 0:
+                    break
+                now = datetime.utcnow()
+                claim = f"{self.worker_id}:{uuid.uuid4().hex[:12]}"
+                due_filter = (Task.kind == kind, Task.status.in_(("queued", "running")), Task.run_at <= now)
+                due = select(Task.id).where(*due_filter).order_by(Task.run_at, Task.id).limit(limit)
+                db.execute(
+                    update(Task).where(Task.id.in_(due), *due_filter).values(
+                        status="running",
+                        attempts=Task.attempts + 1,
+                        run_at=now + timedelta(seconds=settings.task_visibility_seconds),
+                        claimed_by=claim,
+                    ).execution_options(synchronize_session=False)
+                )
+                rows = db.query(Task.id, Task.payload, Task.attempts).filter(Task.claimed_by == claim).all()
+                db.commit()
+                claimed.extend(_Claimed(row.id, kind, row.payload, row.attempts, claim) for row in rows)
+        finally:
+            db.close()
+        return claimed
+
+    def _finish(self, task: _Claimed, error: Optional[BaseException]) -> None:
+        """Delete a finished task, or schedule its retry / mark it failed; only while we hold the claim."""
+        db = self.session_factory()
+        try:
+            mine = (Task.id == task.id, Task.claimed_by == task.claim)
+            if error is None:
+                db.execute(delete(Task).where(*mine))
+            elif isinstance(error, PermanentTaskError) or task.attempts >= settings.task_max_attempts:
+                db.execute(update(Task).where(*mine).values(status="failed", claimed_by=None, last_error=str(error)))
+            else:
+                db.execute(update(Task).where(*mine).values(
+                    status="queued",
+                    claimed_by=None,
+                    run_at=datetime.utcnow() + timedelta(seconds=backoff_seconds(task.attempts)),
+                    last_error=str(error),
+                ))
+            db.commit()
+        finally:
+            db.close()
+
+    async def _execute(self, task: _Claimed) -> None:
+        error = None
+        if task.attempts > settings.task_max_attempts:
+            # Its claims kept lapsing (the worker died or the task hung)
+            error = PermanentTaskError(f"Gave up after {settings.task_max_attempts} attempts")
+        else:
+            db = self.session_factory()
+            try:
+                await asyncio.wait_for(
+                    HANDLERS[task.kind].handler(db, task.payload), timeout=settings.task_visibility_seconds
+                )
+            except asyncio.TimeoutError:
+                error = TimeoutError(f"Did not finish within {settings.task_visibility_seconds}s")
+            except Exception as e:
+                error = e
+            finally:
+                db.close()
+        if error is not None:
+            logger.warning(f"Task {task.id} ({task.kind}) attempt {task.attempts} failed: {error}")
+        try:
+            await asyncio.to_thread(self._finish, task, error)
+        except Exception as e:
+            logger.error(f"Could not record the outcome of task {task.id}: {e}")
+        finally:
+            self._running.pop(task.id, None)
+            if self._wake is not None:
+                self._wake.set()
+
+    async def run_once(self) -> int:
+        """Claim what this runner has room for and start it; returns how many tasks started."""
+        slots = self._free_slots()
+        if not slots:
+            return 0
+        claimed = await asyncio.to_thread(self._claim, slots)
+        for task in claimed:
+            self._running[task.id] = task.kind
+            running = asyncio.create_task(self._execute(task))
+            self._tasks.add(running)
+            running.add_done_callback(self._tasks.discard)
+        return len(claimed)
+
+    async def drain(self) -> None:
+        """Run until no task is due or running (tests, scripts)."""
+        while await self.run_once() or self._tasks:
+            if self._tasks:
+                await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+
+    async def run(self, session_factory=None) -> None:
+        """Background task: claim and run due tasks until cancelled."""
+        self.session_factory = session_factory or self.session_factory
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        try:
+            while True:
+                self._wake.clear()
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    logger.error(f"Task runner failed to claim tasks: {e}")
+                try:
+                    await asyncio.wait_for(self._wake.wait(), settings.task_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wake = None
+            for running in list(self._tasks):
+                running.cancel()
+
+
+task_runner = TaskRunner()
@@ -0,0 +1,247 @@
+"""
+Resized display variants of sighting photos.
+
+When a sighting with a photo is saved, ``schedule`` enqueues a ``thumbnails.create``
+task in the same transaction (see task_queue.py), which a task runner picks up once the
+response has been sent. It reads the original from storage, renders every size
+in ``VARIANTS`` with Pillow in a process pool (decoding and resampling are CPU-bound and
+would otherwise hold the GIL and stall the event loop), stores the results next to the
+original (``<name>_thumb.webp`` in the same S3 folder or under uploads/) and fills in
+``media_thumb_url`` / ``media_medium_url``.
+
+Media is content-addressed (see media_upload.py), so a re-posted photo shares its
+original, and its variants, with the first sighting that used it: they are copied over
+instead of being rendered again.
+
+Until then, or if it keeps failing (storage errors are retried with backoff, a file that
+is not an image is not), the columns stay null and clients fall back to ``media_url``.
+``backfill`` runs the same pipeline over existing sightings (see backfill_thumbnails.py).
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models import Sighting
+from app.services.hot_window import hot_window
+from app.services.media_upload import LOCAL_ROOT
+from app.services.s3_service import s3_service
+from app.services.task_queue import PermanentTaskError, enqueue_many, task_handler
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels; each variant fills the media_<name>_url column
+VARIANTS = {"medium": 1024, "thumb": 256}
+# thumbnail_format -> (Pillow format, file extension, content type)
+FORMATS = {"webp": ("WEBP", "webp", "image/webp"), "jpeg": ("JPEG", "jpg", "image/jpeg")}
+QUALITY = 80
+BACKFILL_BATCH = 100
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def render_variants(data: bytes, fmt: str) -> Dict[str, bytes]:
+    """Encode every variant of the image ``data`` as ``fmt``; runs in a pool process."""
+    pil_format = FORMATS[fmt][0]
+    with Image.open(io.BytesIO(data)) as original:
+        # JPEGs are scaled down (up to 8x) while decoding; a no-op for other formats
+        largest = max(VARIANTS.values())
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+        if pil_format == "JPEG" and image.mode == "RGBA":
+            image = image.convert("RGB")
+
+        rendered = {}
+        # Largest first, each smaller variant is resized from the previous one
+        for name, size in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+            image.thumbnail((size, size), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, pil_format, quality=QUALITY)
+            rendered[name] = out.getvalue()
+    return rendered
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API worker runs threads (S3 pool, sweeper) a fork would copy mid-lock
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.thumbnail_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def is_image(media_url: Optional[str]) -> bool:
+    return bool(media_url) and s3_service.get_content_type(media_url).startswith("image/")
+
+
+def _is_local(url: str) -> bool:
+    return url.startswith(f"{LOCAL_ROOT}/")
+
+
+def _variant_path(path: str, name: str, fmt: str) -> str:
+    stem, _ = os.path.splitext(path)
+    return f"{stem}_{name}.{FORMATS[fmt][1]}"
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, data: bytes) -> None:
+    # Unique, as two workers may render the same photo at once (e.g. a task retried
+    # while the first attempt is still running)
+    partial = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    try:
+        with open(partial, "wb") as f:
+            f.write(data)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+
+
+async def _read_original(media_url: str) -> bytes:
+    if _is_local(media_url):
+        return await run_in_threadpool(_read_file, media_url)
+    key = s3_service.key_from_url(media_url)
+    if key is None:
+        raise ValueError(f"Not a stored photo: {media_url}")
+    return await s3_service.download_file(key)
+
+
+async def _store(media_url: str, name: str, data: bytes, fmt: str) -> str:
+    if _is_local(media_url):
+        path = _variant_path(media_url, name, fmt)
+        await run_in_threadpool(_write_file, path, data)
+        return path
+    folder, file_name = _variant_path(s3_service.key_from_url(media_url), name, fmt).rsplit("/", 1)
+    return await s3_service.upload_file(data, file_name, FORMATS[fmt][2], folder=folder)
+
+
+def _existing_variants(bind, media_url: str) -> Optional[Dict[str, str]]:
+    """Variant URLs of another sighting with the same photo, if it has them."""
+    columns = [getattr(Sighting, f"media_{name}_url") for name in VARIANTS]
+    db = Session(bind=bind)
+    try:
+        row = db.query(*columns).filter(Sighting.media_url == media_url, columns[0].isnot(None)).first()
+    finally:
+        db.close()
+    return {column.key: url for column, url in zip(columns, row)} if row else None
+
+
+async def render_and_store(media_url: str) -> Dict[str, str]:
+    """Create the variants of the photo at ``media_url``; returns {column: url}."""
+    fmt = settings.thumbnail_format
+    data = await _read_original(media_url)
+    loop = asyncio.get_running_loop()
+    rendered = await loop.run_in_executor(_executor(), render_variants, data, fmt)
+    urls = await asyncio.gather(*(_store(media_url, name, variant, fmt) for name, variant in rendered.items()))
+    return {f"media_{name}_url": url for name, url in zip(rendered, urls)}
+
+
+async def _create(bind, sighting_id: str, media_url: str) -> bool:
+    """Render (or reuse) the variants of a sighting's photo and record their URLs on the row."""
+    urls = _existing_variants(bind, media_url)
+    if urls is None:
+        urls = await render_and_store(media_url)
+
+    db = Session(bind=bind)
+    try:
+        sighting = db.get(Sighting, sighting_id)
+        if sighting is None or sighting.media_url != media_url:
+            # Deleted, or its photo replaced, while rendering; the variants belong to the
+            # (shared) photo, so they stay
+            return False
+        for column, url in urls.items():
+            setattr(sighting, column, url)
+        db.commit()  # an ORM update, so the change log picks it up for other workers
+        if settings.hot_window_enabled:
+            hot_window.remove(sighting_id)
+            hot_window.append(sighting)
+    finally:
+        db.close()
+    return True
+
+
+async def create_variants(bind, sighting_id: str, media_url: str) -> bool:
+    """``_create``, with failures logged instead of raised."""
+    try:
+        return await _create(bind, sighting_id, media_url)
+    except Exception as e:
+        logger.warning(f"Could not create display variants of {media_url} (sighting {sighting_id}): {e}")
+        return False
+
+
+@task_handler("thumbnails.create", concurrency=settings.thumbnail_workers)
+async def _run_task(db: Session, payload: dict) -> None:
+    try:
+        await _create(db.get_bind(), payload["sighting_id"], payload["media_url"])
+    except (UnidentifiedImageError, ValueError) as e:
+        raise PermanentTaskError(str(e))
+
+
+def schedule(db: Session, sightings: Iterable) -> None:
+    """
+    Enqueue variant creation for new sightings with a photo, in the caller's transaction.
+    Each sighting is an ORM row (flushed, so it has its id) or a dict with its columns.
+    """
+    if not settings.thumbnails_enabled:
+        return
+    payloads = []
+    for sighting in sightings:
+        sighting_id, media_url = (
+            (sighting["id"], sighting["media_url"]) if isinstance(sighting, dict) else (sighting.id, sighting.media_url)
+        )
+        if is_image(media_url):
+            payloads.append({"sighting_id": sighting_id, "media_url": media_url})
+    enqueue_many(db, "thumbnails.create", payloads)
+
+
+async def backfill(db: Session, batch_size: int = BACKFILL_BATCH) -> Tuple[int, int]:
+    """
+    Create variants for every sighting that has a photo but no thumbnail, ``batch_size``
+    rows at a time (walked by id). Returns (created, failed).
+    """
+    created = failed = 0
+    last_id = ""
+    bind = db.get_bind()
+    # Originals are held in memory until rendered, so only a few are fetched ahead of the pool
+    semaphore = asyncio.Semaphore(settings.thumbnail_workers * 2)
+
+    async def one(row) -> bool:
+        async with semaphore:
+            return await create_variants(bind, row.id, row.media_url)
+
+    while True:
+        rows = db.query(Sighting.id, Sighting.media_url).filter(
+            Sighting.id > last_id,
+            Sighting.media_url.isnot(None),
+            Sighting.media_thumb_url.is_(None),
+        ).order_by(Sighting.id).limit(batch_size).all()
+        if not rows:
+            return created, failed
+        last_id = rows[-1].id
+        results = await asyncio.gather(*(one(row) for row in rows if is_image(row.media_url)))
+        created += sum(results)
+        failed += len(results) - sum(results)
@@ -0,0 +1,108 @@
+"""
+Binary sighting tiles for the map.
+
+A tile holds the sightings inside one slippy-map tile (z/x/y) in a packed little-endian
+layout, so the client can decode it with a handful of array reads:
+
+    header   magic b"SGT1" | zoom u8 | flags u8 | reserved u16 | x u32 | y u32 | count u32
+    px       u16[count]  position inside the tile, 0 = west edge, 65535 = east edge
+    py       u16[count]  position inside the tile, 0 = north edge, 65535 = south edge
+    species  u32[count]  species_id
+    taken_at u32[count]  unix seconds (UTC)
+    ids      count x (u8 length, utf-8 bytes)
+
+Flag bit 0 is set when the tile was truncated to ``MAX_TILE_FEATURES`` (most recent
+first); zoom in or use /clusters for dense areas.
+
+Each tile's ETag comes from the change counter of its grid cell (see sighting_grid), and
+encoded tiles are kept in a small in-process LRU keyed by tile and version.
+"""
+import struct
+from datetime import timezone
+
+from sqlalchemy.orm import Session
+
+from app.models import Sighting
+from app.services.sighting_grid import tile_bounds, tile_position
+from app.services.spatial_index import bbox_filter
+from app.services.versioned_cache import VersionedLRU
+
+TILE_MAGIC = b"SGT1"
+TILE_MEDIA_TYPE = "application/vnd.sightings.tile"
+FLAG_TRUNCATED = 0x01
+MAX_TILE_FEATURES = 5000
+TILE_EXTENT = 65535
+
+_HEADER = struct.Struct("<4sBBHIII")
+
+
+def tile_etag(zoom: int, x: int, y: int, version: int) -> str:
+    return f'"{zoom}-{x}-{y}-{version}"'
+
+
+def encode_tile(zoom: int, x: int, y: int, rows, truncated: bool = False) -> bytes:
+    """Pack (id, lat, lon, species_id, taken_at) rows into the tile layout above."""
+    n = len(rows)
+    px, py, species, taken = [], [], [], []
+    ids = bytearray()
+    for sighting_id, lat, lon, species_id, taken_at in rows:
+        fx, fy = tile_position(lat, lon, zoom)
+        px.append(min(max(int((fx - x) * TILE_EXTENT), 0), TILE_EXTENT))
+        py.append(min(max(int((fy - y) * TILE_EXTENT), 0), TILE_EXTENT))
+        species.append(species_id)
+        if taken_at.tzinfo is None:
+            taken_at = taken_at.replace(tzinfo=timezone.utc)
+        taken.append(int(taken_at.timestamp()))
+        encoded = sighting_id.encode("utf-8")[:255]
+        ids.append(len(encoded))
+        ids.extend(encoded)
+
+    flags = FLAG_TRUNCATED if truncated else 0
+    return b"".join([
+        _HEADER.pack(TILE_MAGIC, zoom, flags, 0, x, y, n),
+        struct.pack(f"<{n}H", *px),
+        struct.pack(f"<{n}H", *py),
+        struct.pack(f"<{n}I", *species),
+        struct.pack(f"<{n}I", *taken),
+        bytes(ids),
+    ])
+
+
+def decode_tile(data: bytes) -> dict:
+    """Inverse of ``encode_tile`` (used by tests and tooling; clients do the same)."""
+    magic, zoom, flags, _, x, y, n = _HEADER.unpack_from(data, 0)
+    if magic != TILE_MAGIC:
+        raise ValueError("Not a sightings tile")
+    offset = _HEADER.size
+    arrays = []
+    for code, size in (("H", 2), ("H", 2), ("I", 4), ("I", 4)):
+        arrays.append(struct.unpack_from(f"<{n}{code}", data, offset))
+        offset += n * size
+    ids = []
+    for _ in range(n):
+        length = data[offset]
+        ids.append(data[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+    px, py, species, taken = arrays
+    return {
+        "zoom": zoom, "x": x, "y": y, "truncated": bool(flags & FLAG_TRUNCATED),
+        "px": list(px), "py": list(py), "species_id": list(species), "taken_at": list(taken), "ids": ids,
+    }
+
+
+def build_tile(db: Session, zoom: int, x: int, y: int) -> bytes:
+    """Query the sightings inside a tile through the spatial index and encode them."""
+    west, south, east, north = tile_bounds(zoom, x, y)
+    dialect = db.get_bind().dialect.name
+    rows = db.query(
+        Sighting.id, Sighting.lat, Sighting.lon, Sighting.species_id, Sighting.taken_at
+    ).filter(
+        bbox_filter(Sighting, dialect, west, south, east, north)
+    ).order_by(Sighting.taken_at.desc()).limit(MAX_TILE_FEATURES + 1).all()
+
+    truncated = len(rows) > MAX_TILE_FEATURES
+    return encode_tile(zoom, x, y, rows[:MAX_TILE_FEATURES], truncated)
+
+
+# Encoded tiles keyed by (zoom, x, y)
+tile_cache = VersionedLRU(max_entries=2048)
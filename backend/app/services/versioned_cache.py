@@ -0,0 +1,38 @@
+"""
+Small in-process LRU whose entries are each valid for one version.
+
+Callers pass the current version (a grid cell's change counter, say) with every lookup,
+so an entry is replaced rather than invalidated: a stale one simply misses. Used for
+encoded map tiles (tiles.py) and per-tile facet aggregates (facets.py).
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class VersionedLRU:
+    """Thread-safe LRU of values keyed by tuples, each valid for one version."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, version: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: tuple, version: int, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,90 @@
+"""
+Several map viewports answered in one go, for prefetching around the visible area.
+
+In SQL, each viewport becomes one branch of a single ``UNION ALL`` statement: the branch
+uses the spatial index for its bbox, applies the shared filters and its own LIMIT, and
+tags its rows with the viewport's position. From the hot window, rows for the box
+enclosing all viewports are read in one pass and then assigned to every viewport that
+contains them.
+
+Either way a sighting in several overlapping viewports is returned once; each group
+only lists ids.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import literal, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models import Sighting
+from app.services.serialization import SIGHTING_COLUMNS, rows_to_dicts
+from app.services.spatial_index import bbox_filter
+
+BBox = Tuple[float, float, float, float]
+
+
+def _contains(bbox: BBox, row: dict) -> bool:
+    west, south, east, north = bbox
+    return south <= row["lat"] <= north and west <= row["lon"] <= east
+
+
+def _group(bboxes: List[BBox], tagged_rows, limit: int):
+    """Collect (viewport index, row) pairs into (items, [(ids, truncated), ...])."""
+    items: Dict[str, dict] = {}
+    groups: List[List[str]] = [[] for _ in bboxes]
+    truncated = [False] * len(bboxes)
+    for index, row in tagged_rows:
+        if len(groups[index]) >= limit:
+            truncated[index] = True
+            continue
+        items.setdefault(row["id"], row)
+        groups[index].append(row["id"])
+    return list(items.values()), list(zip(groups, truncated))
+
+
+def query_viewports(
+    db: Session,
+    bboxes: List[BBox],
+    limit: int,
+    species_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    username: Optional[str] = None,
+):
+    """One UNION ALL over the viewports; returns (items, [(ids, truncated), ...])."""
+    dialect = db.get_bind().dialect.name
+    branches = []
+    for index, bbox in enumerate(bboxes):
+        stmt = select(*SIGHTING_COLUMNS, literal(index).label("viewport")).where(
+            bbox_filter(Sighting, dialect, *bbox)
+        )
+        if species_id:
+            stmt = stmt.where(Sighting.species_id == species_id)
+        if start is not None:
+            stmt = stmt.where(Sighting.taken_at >= start)
+        if end is not None:
+            stmt = stmt.where(Sighting.taken_at <= end)
+        if username:
+            stmt = stmt.where(Sighting.username == username)
+        # One extra row per viewport tells us whether it was truncated
+        stmt = stmt.order_by(Sighting.taken_at.desc(), Sighting.id.desc()).limit(limit + 1)
+        branches.append(select(stmt.subquery()))
+
+    union = union_all(*branches).subquery()
+    rows = db.execute(
+        select(union).order_by(union.c.viewport, union.c.taken_at.desc(), union.c.id.desc())
+    ).all()
+    tagged = [(row[-1], item) for row, item in zip(rows, rows_to_dicts(row[:-1] for row in rows))]
+    return _group(bboxes, tagged, limit)
+
+
+def query_viewports_in_memory(store, bboxes: List[BBox], limit: int, species_id=None, start=None, end=None, username=None):
+    """Same as ``query_viewports`` from the hot window, in one pass over the enclosing box."""
+    enclosing = (
+        min(b[0] for b in bboxes), min(b[1] for b in bboxes),
+        max(b[2] for b in bboxes), max(b[3] for b in bboxes),
+    )
+    rows = store.query(enclosing, start, end, species_id, username)  # already most recent first
+    tagged = [(index, row) for row in rows for index, bbox in enumerate(bboxes) if _contains(bbox, row)]
+    tagged.sort(key=lambda pair: pair[0])  # stable, so each group stays most recent first
+    return _group(bboxes, tagged, limit)
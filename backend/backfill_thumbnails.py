@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Create thumb and medium variants for sightings whose photo has none yet
+
+New sightings get them automatically after upload; run this once for rows created
+before that, or to retry photos that failed. Safe to re-run: only rows without
+media_thumb_url are processed.
+
+Usage:
+    python backfill_thumbnails.py
+    python backfill_thumbnails.py --batch-size 500 --workers 4
+"""
+import argparse
+import asyncio
+import sys
+
+from app.config import settings
+from app.database import SessionLocal, engine, ensure_columns
+from app.services import thumbnails
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=thumbnails.BACKFILL_BATCH)
+    parser.add_argument("--workers", type=int, default=settings.thumbnail_workers, help="Rendering processes")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    settings.thumbnail_workers = args.workers
+    ensure_columns(engine)
+    db = SessionLocal()
+    try:
+        created, failed = asyncio.run(thumbnails.backfill(db, args.batch_size))
+        print(f"✅ Created display variants for {created} sightings" + (f" ({failed} failed, see log)" if failed else ""))
+        return 0
+    except Exception as e:
+        print(f"❌ Backfill failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        thumbnails.shutdown()
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark sighting ingest: one POST /v1/sightings/create per row vs POST /v1/sightings/bulk.
+
+Usage:
+    python benchmarks/bench_bulk_ingest.py                  # 500 rows
+    python benchmarks/bench_bulk_ingest.py --rows 2000 --database-url postgresql+psycopg2://...
+
+Every row carries its own small photo, stored locally (in a temporary directory):
+
+    single       one multipart request per row: species lookup, commit and refresh each
+    bulk         one multipart request with the manifest and every photo as parts
+    bulk-nomedia one JSON manifest without media, i.e. the database path alone
+
+Requests go through the app (TestClient), so parsing and validation are included.
+Thumbnails are turned off to time the ingest itself.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, insert
+from sqlalchemy.orm import sessionmaker
+
+from common import make_engine
+from app.config import settings
+from app.database import get_db
+from app.main import app
+from app.models import Sighting, Species, User
+
+
+def manifest_rows(n_rows, offset, with_media):
+    rows = []
+    for i in range(n_rows):
+        row = {"species_id": 1 + i % 20, "lat": 42.25 + (i % 100) / 1000, "lon": -83.80 + (i // 100) / 1000,
+               "username": "bench", "caption": f"survey row {offset + i}"}
+        if with_media:
+            row["photo"] = f"photo{i}"
+        rows.append(row)
+    return rows
+
+
+def photo(i):
+    # Distinct content per row, so deduplication does not skip any writes
+    return f"row {i}".encode() + os.urandom(4096)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    engine = make_engine(args.database_url)
+    with engine.begin() as conn:
+        conn.execute(insert(Species), [{"id": i, "common_name": f"Species {i}"} for i in range(1, 21)])
+        conn.execute(insert(User), [{"username": "bench"}])
+    SessionLocal = sessionmaker(bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    settings.thumbnails_enabled = False
+    settings.bulk_ingest_max_rows = max(settings.bulk_ingest_max_rows, args.rows)
+    os.chdir(tempfile.mkdtemp(prefix="bench_ingest_"))
+    client = TestClient(app)
+    n = args.rows
+    print(f"{engine.dialect.name}: {n} rows per run")
+
+    def single():
+        for i, row in enumerate(manifest_rows(n, 0, False)):
+            response = client.post("/v1/sightings/create", data=row, files={"photo": (f"{i}.jpg", photo(i), "image/jpeg")})
+            assert response.status_code == 200, response.text
+
+    def bulk():
+        files = [("manifest", ("survey.json", json.dumps(manifest_rows(n, n, True)), "application/json"))]
+        files += [(f"photo{i}", (f"{i}.jpg", photo(n + i), "image/jpeg")) for i in range(n)]
+        response = client.post("/v1/sightings/bulk", files=files)
+        assert response.status_code == 200 and response.json()["created"] == n, response.text
+
+    def bulk_nomedia():
+        response = client.post("/v1/sightings/bulk", json=manifest_rows(n, 2 * n, False))
+        assert response.status_code == 200 and response.json()["created"] == n, response.text
+
+    rates = {}
+    for name, run in (("single", single), ("bulk", bulk), ("bulk-nomedia", bulk_nomedia)):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        rates[name] = n / elapsed
+        print(f"  [{name:>12}] {elapsed * 1000:9.1f} ms, {rates[name]:9.1f} rows/s")
+
+    with SessionLocal() as db:
+        assert db.query(func.count(Sighting.id)).scalar() == 3 * n
+    print(f"  bulk speedup: {rates['bulk'] / rates['single']:.1f}x with media, "
+          f"{rates['bulk-nomedia'] / rates['single']:.1f}x without")
+
+    app.dependency_overrides.pop(get_db, None)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
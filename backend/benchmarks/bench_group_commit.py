@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark POST /v1/sightings/create write throughput with and without group commit.
+
+Usage:
+    python benchmarks/bench_group_commit.py                     # SQLite (WAL), 400 creates
+    python benchmarks/bench_group_commit.py --concurrency 1 16 64 --database-url postgresql+psycopg2://...
+
+For each concurrency level, that many clients post creates back to back until the total
+is reached, first with one transaction per request and then in group-commit mode
+(``--window-ms``). Every request carries its own small photo, stored locally in a
+temporary directory; thumbnails are turned off. Requests run in-process through the ASGI
+app on one event loop, like a single API worker.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import func, insert
+from sqlalchemy.orm import sessionmaker
+
+from common import make_engine
+from app.config import settings
+from app.database import get_db
+from app.main import app
+from app.models import Sighting, Species, User
+
+
+async def run_clients(n_requests, concurrency, offset):
+    counter = iter(range(offset, offset + n_requests))
+
+    async def client_loop(client):
+        for i in counter:
+            response = await client.post("/v1/sightings/create", data={
+                "species_id": 1 + i % 20, "lat": 42.25 + (i % 100) / 1000, "lon": -83.80,
+                "username": "bench", "caption": f"create {i}",
+            }, files={"photo": (f"{i}.jpg", f"photo {i}".encode() + os.urandom(2048), "image/jpeg")})
+            assert response.status_code == 200, response.text
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400, help="Creates per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--window-ms", type=float, default=settings.group_commit_window_ms)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    # Every in-flight request holds a connection while its photo is stored
+    engine = make_engine(args.database_url, pool_size=max(args.concurrency) + 5)
+    with engine.begin() as conn:
+        conn.execute(insert(Species), [{"id": i, "common_name": f"Species {i}"} for i in range(1, 21)])
+        conn.execute(insert(User), [{"username": "bench"}])
+    SessionLocal = sessionmaker(bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    settings.thumbnails_enabled = False
+    settings.group_commit_window_ms = args.window_ms
+    os.chdir(tempfile.mkdtemp(prefix="bench_group_commit_"))
+    n = args.requests
+    print(f"{engine.dialect.name}: {n} creates per run, group window {args.window_ms} ms")
+
+    offset = 0
+    for concurrency in args.concurrency:
+        rates = {}
+        for name, grouped in (("per-request", False), ("group", True)):
+            settings.group_commit_enabled = grouped
+            start = time.perf_counter()
+            asyncio.run(run_clients(n, concurrency, offset))
+            elapsed = time.perf_counter() - start
+            offset += n
+            rates[name] = n / elapsed
+            print(f"  [{concurrency:>3} clients, {name:>11}] {elapsed * 1000:9.1f} ms, {rates[name]:8.1f} creates/s")
+        print(f"  [{concurrency:>3} clients] group commit: {rates['group'] / rates['per-request']:.1f}x")
+
+    with SessionLocal() as db:
+        assert db.query(func.count(Sighting.id)).scalar() == offset
+
+    app.dependency_overrides.pop(get_db, None)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Load test for the live sightings feed: fan-out latency with many idle subscribers.
+
+Usage:
+    python benchmarks/bench_live_feed.py                          # 1k and 10k subscribers in-process
+    python benchmarks/bench_live_feed.py --subscribers 5000 --events 500
+    python benchmarks/bench_live_feed.py --url http://127.0.0.1:8000 --subscribers 2000
+
+In-process mode drives the LiveFeed hub on one event loop, with a waiting consumer per
+subscription (what each idle WebSocket handler is doing). For each published sighting it
+reports how long matching took with the tile index vs a linear scan over every
+subscription, and the delivery latency until each matching consumer has the message.
+
+With --url it opens real WebSocket connections to a running server (needs the
+``websockets`` package), creates sightings through the API and measures the time from
+the create request to each delivery. The server needs species 1 to exist.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from common import LAT_RANGE, LON_RANGE, random_bbox
+from app.services.live_feed import LiveFeed
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def report(name, samples_ms):
+    if not samples_ms:
+        print(f"  {name}: no samples")
+        return
+    print(f"  {name}: median {statistics.median(samples_ms):.3f} ms, "
+          f"p95 {percentile(samples_ms, 0.95):.3f} ms, max {max(samples_ms):.3f} ms")
+
+
+def random_subscription(rng):
+    # Mostly map viewports, some zoomed-out regions
+    return random_bbox(rng, span_deg=rng.choice([0.02, 0.05, 0.2, 1.0])), rng.choice([None, None, None, 1, 2])
+
+
+def random_sighting(rng, i):
+    return {
+        "id": f"live-{i}",
+        "lat": rng.uniform(*LAT_RANGE),
+        "lon": rng.uniform(*LON_RANGE),
+        "species_id": rng.randint(1, 5),
+    }
+
+
+async def run_in_process(n_subs, n_events, seed=11):
+    print(f"\n=== {n_subs:,} subscribers, {n_events:,} events (in-process) ===")
+    rng = random.Random(seed)
+    feed = LiveFeed(queue_size=64)
+    subs = [feed.subscribe(*random_subscription(rng)) for _ in range(n_subs)]
+
+    sent_at = {}
+    latencies = []
+    pending = {"count": 0}
+    all_delivered = asyncio.Event()
+
+    async def consume(sub):
+        while True:
+            message = await sub.queue.get()
+            latencies.append((time.perf_counter() - sent_at[message]) * 1000)
+            pending["count"] -= 1
+            if pending["count"] == 0:
+                all_delivered.set()
+
+    consumers = [asyncio.create_task(consume(sub)) for sub in subs]
+    await asyncio.sleep(0)
+
+    index_ms, scan_ms, last_delivery_ms, fanout = [], [], [], []
+    for i in range(n_events):
+        row = random_sighting(rng, i)
+
+        start = time.perf_counter()
+        expected = sum(1 for sub in subs if sub.matches(row["lat"], row["lon"], row["species_id"]))
+        scan_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        matched = sum(1 for _ in feed.matching(row["lat"], row["lon"], row["species_id"]))
+        index_ms.append((time.perf_counter() - start) * 1000)
+        assert matched == expected
+        fanout.append(matched)
+
+        if matched == 0:
+            continue
+        pending["count"] = matched
+        all_delivered.clear()
+        # publish() encodes the row as JSON; key the send time by that message
+        sent_at[json.dumps(row, default=str)] = start = time.perf_counter()
+        feed.publish(row)
+        await all_delivered.wait()
+        last_delivery_ms.append((time.perf_counter() - start) * 1000)
+
+    for task in consumers:
+        task.cancel()
+
+    print(f"  matching subscribers per event: mean {statistics.mean(fanout):.1f}, max {max(fanout)}")
+    report("match, linear scan", scan_ms)
+    report("match, tile index", index_ms)
+    report("delivery to each subscriber", latencies)
+    report("delivery to last subscriber", last_delivery_ms)
+
+
+async def run_remote(url, n_subs, n_events, seed=11):
+    try:
+        import websockets
+    except ImportError:
+        raise SystemExit("--url needs the websockets package (pip install websockets)")
+    import httpx
+
+    print(f"\n=== {n_subs:,} WebSocket subscribers, {n_events:,} events against {url} ===")
+    rng = random.Random(seed)
+    ws_url = url.replace("http", "ws", 1).rstrip("/") + "/v1/sightings/live"
+
+    sent_at = {}
+    latencies = []
+
+    async def listen(conn):
+        async for message in conn:
+            sighting = json.loads(message)
+            start = sent_at.get((sighting["lat"], sighting["lon"]))
+            if start is not None:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    conns = []
+    for _ in range(n_subs):
+        bbox, _ = random_subscription(rng)
+        conns.append(await websockets.connect(f"{ws_url}?area={','.join(map(str, bbox))}"))
+    listeners = [asyncio.create_task(listen(conn)) for conn in conns]
+    print(f"  opened {len(conns):,} connections")
+
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        for i in range(n_events):
+            row = random_sighting(rng, i)
+            sent_at[(row["lat"], row["lon"])] = time.perf_counter()
+            response = await client.post(
+                "/v1/sightings/create",
+                data={"species_id": 1, "lat": row["lat"], "lon": row["lon"], "username": "loadtest"},
+                files={"photo": ("bench.jpg", b"bench", "image/jpeg")},
+            )
+            response.raise_for_status()
+        await asyncio.sleep(1)
+
+    for task in listeners:
+        task.cancel()
+    for conn in conns:
+        await conn.close()
+    report("create -> delivery", latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--events", type=int, default=1_000)
+    parser.add_argument("--url", default=None, help="Base URL of a running server")
+    args = parser.parse_args()
+
+    for n in args.subscribers:
+        if args.url:
+            asyncio.run(run_remote(args.url, n, args.events))
+        else:
+            asyncio.run(run_in_process(n, args.events))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent sighting media uploads: blocking boto3 calls vs the pooled S3Service.
+
+Usage:
+    pip install "moto[server]"
+    python benchmarks/bench_s3_uploads.py                       # against a local moto server
+    python benchmarks/bench_s3_uploads.py --sightings 200 --concurrency 32
+    python benchmarks/bench_s3_uploads.py --endpoint-url http://127.0.0.1:9000 \\
+        --access-key minioadmin --secret-key minioadmin          # against MinIO
+
+Each simulated ``create_sighting`` uploads one photo and one audio clip, with up to
+``--concurrency`` requests in flight on one event loop:
+
+    blocking  what upload_file used to do: put_object called directly in the coroutine,
+              photo then audio, so the event loop stalls for every upload
+    pooled    S3Service.upload_stream on its thread pool, photo and audio concurrently
+
+Besides throughput it reports the worst event-loop stall seen by a 5 ms ticker, i.e.
+how long any other request on the worker would have waited.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from common import LAT_RANGE  # noqa: F401  (puts the backend on sys.path)
+import boto3
+
+from app.config import settings
+from app.services.s3_service import S3Service
+
+BUCKET = "bench-sightings-media"
+
+
+async def watch_loop(stalls, stop, interval=0.005):
+    """Record how late a ticker wakes up: the event loop's responsiveness."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def run(name, create, n_sightings, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await create(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    stalls, stop = [], asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stalls, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_sightings)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await watcher
+
+    latencies.sort()
+    stalls.sort()
+    print(f"  [{name:>8}] {n_sightings / elapsed:7.1f} sightings/s, "
+          f"median {statistics.median(latencies):7.1f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1]:7.1f} ms; "
+          f"loop stall p99 {stalls[int(len(stalls) * 0.99) - 1]:6.1f} ms, worst {stalls[-1]:6.1f} ms")
+
+
+async def chunks(data, size=1024 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def start_moto():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "-m", "moto.server", "-H", "127.0.0.1", "-p", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server, f"http://127.0.0.1:{port}"
+        except OSError:
+            if time.time() > deadline or server.poll() is not None:
+                server.terminate()
+                raise SystemExit('Could not start moto; install it with pip install "moto[server]"')
+            time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint-url", help="S3-compatible server; default: start moto on a free port")
+    parser.add_argument("--access-key", default="testing")
+    parser.add_argument("--secret-key", default="testing")
+    parser.add_argument("--sightings", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--photo-kb", type=int, default=512)
+    parser.add_argument("--audio-kb", type=int, default=2048)
+    args = parser.parse_args()
+
+    server = None
+    endpoint = args.endpoint_url
+    if endpoint is None:
+        # A separate process, so the stand-in does not compete with the event loop for the GIL
+        server, endpoint = start_moto()
+
+    settings.aws_access_key_id = args.access_key
+    settings.aws_secret_access_key = args.secret_key
+    settings.aws_s3_bucket_name = BUCKET
+    settings.aws_region = "us-east-1"
+    settings.aws_s3_endpoint_url = endpoint
+    settings.s3_max_connections = max(settings.s3_max_connections, args.concurrency * 2)
+
+    client = boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1",
+                          aws_access_key_id=args.access_key, aws_secret_access_key=args.secret_key)
+    try:
+        client.create_bucket(Bucket=BUCKET)
+    except client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    photo = os.urandom(args.photo_kb * 1024)
+    audio = os.urandom(args.audio_kb * 1024)
+    service = S3Service()
+    print(f"endpoint {endpoint}: {args.sightings} sightings x ({args.photo_kb} KiB photo + {args.audio_kb} KiB audio), "
+          f"{args.concurrency} in flight")
+
+    async def blocking(i):
+        client.put_object(Bucket=BUCKET, Key=f"blocking/{i}.jpg", Body=photo, ContentType="image/jpeg")
+        client.put_object(Bucket=BUCKET, Key=f"blocking/{i}.wav", Body=audio, ContentType="audio/wav")
+
+    async def pooled(i):
+        await asyncio.gather(
+            service.upload_stream(chunks(photo), f"{i}.jpg", "image/jpeg", folder="pooled/photos"),
+            service.upload_stream(chunks(audio), f"{i}.wav", "audio/wav", folder="pooled/audio"),
+        )
+
+    try:
+        asyncio.run(run("blocking", blocking, args.sightings, args.concurrency))
+        asyncio.run(run("pooled", pooled, args.sightings, args.concurrency))
+    finally:
+        if server is not None:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
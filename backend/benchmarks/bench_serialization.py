@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark POST /v1/sightings/ response serialization: default vs fast path vs compact vs sparse.
+
+Usage:
+    python benchmarks/bench_serialization.py                   # pages of 100, 1k and 10k rows
+    python benchmarks/bench_serialization.py --rows 500 --repeat 50
+
+For each page size it seeds that many sightings into one bounding box and requests them
+as a single page through the app (TestClient, so routing and validation are included):
+
+    default  ORM objects -> schemas.Sighting -> jsonable_encoder -> json
+    fast     column tuples -> TypeAdapter.dump_json   (settings.sightings_fast_serialization)
+    compact  same, as parallel arrays                  (Accept: application/vnd.sightings.compact+json)
+    sparse   fast path selecting only the map fields   ("fields": "id,lat,lon,species_id")
+
+It also times the serialization step alone, without the query and HTTP layers.
+"""
+import argparse
+import json
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from common import make_engine, time_calls
+from app.config import settings
+from app.database import get_db
+from app.main import app
+from app.models import Sighting as SightingModel, Species, User
+from app.schemas import SightingList
+from app.services.serialization import COMPACT_MEDIA_TYPE, SIGHTING_COLUMNS, dump_compact, dump_page, rows_to_dicts
+
+AREA = "-83.80,42.25,-83.70,42.30"
+SPARSE_FIELDS = "id,lat,lon,species_id"
+
+
+def seed(engine, n_rows):
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Species), [{"id": 1, "common_name": "American Robin", "scientific_name": "Turdus migratorius"}])
+        conn.execute(insert(User), [{"username": "bench"}])
+        conn.execute(insert(SightingModel), [{
+            "id": f"bench-{i:06d}", "username": "bench", "species_id": 1,
+            "lat": 42.25 + (i % 500) / 10000, "lon": -83.80 + (i // 500 % 200) / 2000,
+            "taken_at": now - timedelta(seconds=i), "created_at": now - timedelta(seconds=i),
+            "is_private": i % 7 == 0, "caption": f"caption {i}", "media_url": f"uploads/photos/{i}.jpg",
+        } for i in range(n_rows)])
+
+
+def run(n_rows, repeat):
+    print(f"\n=== page of {n_rows:,} rows ===")
+    engine = make_engine(None)
+    seed(engine, n_rows)
+    SessionLocal = sessionmaker(bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    settings.sightings_max_page_size = max(settings.sightings_max_page_size, n_rows)
+    client = TestClient(app)
+    body = {"area": AREA, "limit": n_rows}
+
+    def request(headers=None, extra=None):
+        response = client.post("/v1/sightings/", json={**body, **(extra or {})}, headers=headers or {})
+        assert response.status_code == 200, response.text
+        return response
+
+    results = {}
+    for name, fast, headers, extra in (
+        ("default", False, None, None),
+        ("fast", True, None, None),
+        ("compact", False, {"Accept": COMPACT_MEDIA_TYPE}, None),
+        ("sparse", False, None, {"fields": SPARSE_FIELDS}),
+    ):
+        settings.sightings_fast_serialization = fast
+        size = len(request(headers, extra).content)
+        results[name] = time_calls(lambda: request(headers, extra), repeat)
+        median, p95 = results[name]
+        print(f"  [{name:>7}] request median {median:8.2f} ms, p95 {p95:8.2f} ms, {size / 1024:8.1f} KiB")
+    settings.sightings_fast_serialization = False
+    print(f"  fast path speedup: {results['default'][0] / results['fast'][0]:.1f}x, "
+          f"compact: {results['default'][0] / results['compact'][0]:.1f}x, "
+          f"sparse: {results['default'][0] / results['sparse'][0]:.1f}x")
+
+    # Serialization alone, from already-fetched rows
+    with Session(engine) as db:
+        orm_rows = db.query(SightingModel).order_by(SightingModel.taken_at.desc()).all()
+        tuple_rows = db.query(*SIGHTING_COLUMNS).order_by(SightingModel.taken_at.desc()).all()
+    variants = {
+        # What FastAPI does with a response_model: validate, dump, jsonable_encoder, json.dumps
+        "default": lambda: json.dumps(jsonable_encoder(SightingList(items=orm_rows).model_dump(mode="json"))).encode("utf-8"),
+        "fast": lambda: dump_page(rows_to_dicts(tuple_rows), None),
+        "compact": lambda: dump_compact(rows_to_dicts(tuple_rows), None),
+    }
+    for name, fn in variants.items():
+        median, p95 = time_calls(fn, repeat)
+        print(f"  [{name:>7}] serialize median {median:8.2f} ms, p95 {p95:8.2f} ms")
+
+    app.dependency_overrides.pop(get_db, None)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    for n in args.rows:
+        run(n, args.repeat)
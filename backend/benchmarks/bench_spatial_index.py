@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark the sightings bounding-box filter with and without the spatial index.
+
+Usage:
+    python benchmarks/bench_spatial_index.py                       # 1M and 10M rows on SQLite
+    python benchmarks/bench_spatial_index.py --rows 100000
+    python benchmarks/bench_spatial_index.py --database-url postgresql+psycopg2://...
+
+For each table size it prints the query plan of both variants and the median/p95
+latency over a set of random viewport-sized boxes.
+"""
+import argparse
+import random
+
+from sqlalchemy import and_, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from common import make_engine, random_bbox, seed_sightings, time_calls
+from app.models import Sighting
+from app.services.spatial_index import bbox_filter
+
+
+def range_scan_filter(west, south, east, north):
+    return and_(
+        Sighting.lat >= south,
+        Sighting.lat <= north,
+        Sighting.lon >= west,
+        Sighting.lon <= east,
+    )
+
+
+def build_query(where):
+    return select(Sighting).where(where).order_by(Sighting.taken_at.desc()).limit(100)
+
+
+def print_plan(engine, stmt):
+    dialect = sqlite.dialect() if engine.dialect.name == "sqlite" else postgresql.dialect()
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    explain = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN ANALYZE "
+    with engine.connect() as conn:
+        for row in conn.execute(text(explain + sql)):
+            print("    " + " | ".join(str(part) for part in row))
+
+
+def run(database_url, n_rows, repeat):
+    print(f"\n=== {n_rows:,} rows ===")
+    engine = make_engine(database_url)
+    seed_sightings(engine, n_rows)
+    dialect = engine.dialect.name
+    rng = random.Random(7)
+    boxes = [random_bbox(rng) for _ in range(repeat)]
+
+    variants = {
+        "range scan": lambda box: range_scan_filter(*box),
+        "spatial index": lambda box: bbox_filter(Sighting, dialect, *box),
+    }
+
+    with Session(engine) as db:
+        for name, make_where in variants.items():
+            print(f"  [{name}] plan:")
+            print_plan(engine, build_query(make_where(boxes[0])))
+
+            it = iter(boxes)
+            median, p95 = time_calls(lambda: db.execute(build_query(make_where(next(it)))).all(), repeat)
+            print(f"  [{name}] median {median:.2f} ms, p95 {p95:.2f} ms")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    for n in args.rows:
+        run(args.database_url, n, args.repeat)
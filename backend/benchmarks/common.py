@@ -0,0 +1,103 @@
+"""
+Shared helpers for the backend benchmarks.
+
+Each benchmark seeds its own database (a throwaway SQLite file by default, or any
+URL passed with --database-url) so it never touches the development data.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, text  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models import Sighting, Species, User  # noqa: E402
+
+# Rough bounding box around Michigan, where most of our data lives
+LON_RANGE = (-90.0, -82.0)
+LAT_RANGE = (41.5, 47.5)
+
+BATCH_SIZE = 50_000
+
+
+def make_engine(database_url=None, **engine_options):
+    """Create an engine for the benchmark database and (re)create the schema."""
+    if database_url is None:
+        path = os.path.join(tempfile.gettempdir(), "sightings_bench.db")
+        if os.path.exists(path):
+            os.remove(path)
+        database_url = f"sqlite:///{path}"
+
+    engine = create_engine(database_url, **engine_options)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.execute(text("PRAGMA journal_mode=WAL"))
+            conn.execute(text("PRAGMA synchronous=NORMAL"))
+    return engine
+
+
+def seed_sightings(engine, n_rows, n_species=50, n_users=200, seed=42):
+    """Insert ``n_rows`` random sightings in batches, returning the species ids used."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    with engine.begin() as conn:
+        conn.execute(insert(Species), [
+            {"id": i, "common_name": f"Species {i}", "scientific_name": f"Genus species{i}"}
+            for i in range(1, n_species + 1)
+        ])
+        conn.execute(insert(User), [{"username": f"user{i}"} for i in range(n_users)])
+
+    inserted = 0
+    while inserted < n_rows:
+        batch = min(BATCH_SIZE, n_rows - inserted)
+        rows = []
+        for i in range(inserted, inserted + batch):
+            taken_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            rows.append({
+                "id": f"bench-{i}",
+                "username": f"user{rng.randrange(n_users)}",
+                "species_id": rng.randint(1, n_species),
+                "lat": rng.uniform(*LAT_RANGE),
+                "lon": rng.uniform(*LON_RANGE),
+                "taken_at": taken_at,
+                "created_at": taken_at,
+                "is_private": False,
+            })
+        with engine.begin() as conn:
+            conn.execute(insert(Sighting), rows)
+        inserted += batch
+        print(f"  seeded {inserted:,}/{n_rows:,} rows", end="\r", flush=True)
+    print()
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE sightings"))
+    return list(range(1, n_species + 1))
+
+
+def random_bbox(rng, span_deg=0.05):
+    """A map-viewport sized bounding box (west, south, east, north) inside the seeded area."""
+    west = rng.uniform(LON_RANGE[0], LON_RANGE[1] - span_deg)
+    south = rng.uniform(LAT_RANGE[0], LAT_RANGE[1] - span_deg)
+    return west, south, west + span_deg, south + span_deg
+
+
+def time_calls(fn, repeat=50):
+    """Call ``fn`` ``repeat`` times and return (median_ms, p95_ms)."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
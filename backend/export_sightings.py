@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Export sightings joined to species as NDJSON, CSV or Parquet
+
+Rows are streamed from a server-side cursor and written batch by batch, so memory
+use stays flat however large the table is.
+
+Usage:
+    python export_sightings.py --format csv --output sightings.csv
+    python export_sightings.py --area=-84,42,-83,43 --start-time 2025-01-01 > recent.ndjson
+    python export_sightings.py --format parquet --species-id 3 --output robins.parquet
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from app.database import SessionLocal
+from app.services.export import EXPORT_FORMATS, ExportUnavailable, export_statement, export_stream
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--output", help="File to write (default: stdout)")
+    parser.add_argument("--area", help="Bounding box: west,south,east,north")
+    parser.add_argument("--species-id", type=int)
+    parser.add_argument("--start-time", help="ISO 8601 timestamp")
+    parser.add_argument("--end-time", help="ISO 8601 timestamp")
+    parser.add_argument("--username")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    try:
+        bbox = tuple(map(float, args.area.split(','))) if args.area else None
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError("expected west,south,east,north")
+        start = datetime.fromisoformat(args.start_time.replace('Z', '+00:00')) if args.start_time else None
+        end = datetime.fromisoformat(args.end_time.replace('Z', '+00:00')) if args.end_time else None
+    except ValueError as e:
+        print(f"❌ Invalid filter: {e}", file=sys.stderr)
+        return 1
+
+    db = SessionLocal()
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        stmt = export_statement(
+            db.get_bind().dialect.name, bbox=bbox, species_id=args.species_id,
+            start=start, end=end, username=args.username,
+        )
+        written = 0
+        for chunk in export_stream(db, stmt, args.format, args.batch_size):
+            out.write(chunk)
+            written += len(chunk)
+        out.flush()
+        print(f"✅ Exported {written:,} bytes of {args.format}" + (f" to {args.output}" if args.output else ""), file=sys.stderr)
+        return 0
+    except ExportUnavailable as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"❌ Export failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.output:
+            out.close()
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
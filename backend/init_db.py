@@ -7,6 +7,8 @@ from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import sessionmaker
 from app.database import engine, Base
 from app.models import Species, Sighting
+from app.services.sighting_grid import rebuild_grid
+from app.services.hotspots import rebuild_density
 import uuid
 def init_database():
     # Create all tables
@@ -92,6 +94,8 @@ def init_database():
             ))
         
         db.commit()
+        rebuild_grid(db)
+        rebuild_density(db)
         print("Database initialized with sample species and sightings")
         
     except Exception as e:
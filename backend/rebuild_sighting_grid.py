@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Rebuild the pre-aggregated sighting grids used by /v1/sightings/clusters and
+/v1/sightings/hotspots
+
+Run this after importing sightings outside the API (e.g. init_db.py or SQL scripts).
+"""
+from app.database import SessionLocal, engine, Base
+from app.services.sighting_grid import rebuild_grid
+from app.services.hotspots import rebuild_density
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        total = rebuild_grid(db)
+        print(f"✅ Rebuilt sighting grid from {total} sightings")
+        recent = rebuild_density(db)
+        print(f"✅ Rebuilt hotspot density grid from {recent} recent sightings")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Failed to rebuild sighting grids: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
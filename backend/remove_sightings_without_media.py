@@ -8,6 +8,8 @@ from app.database import SessionLocal
 from app.models import Sighting
 from sqlalchemy import and_
 from app.config import settings
+from app.services.change_log import log_bulk_delete
+from app.services.sighting_grid import remove_bulk_delete
 
 def remove_sightings_without_media(auto_confirm=False):
     """Remove sightings where both media_url and audio_url are null"""
@@ -78,7 +80,10 @@ def remove_sightings_without_media(auto_confirm=False):
         print()
         print("🗑️  Deleting sightings...")
         
-        # Delete the sightings
+        # Delete the sightings (logging the deletes so syncing clients drop them too, and
+        # taking them out of the cluster and hotspot grids)
+        log_bulk_delete(db, count_query)
+        remove_bulk_delete(db, count_query)
         deleted_count = count_query.delete(synchronize_session=False)
         db.commit()
         
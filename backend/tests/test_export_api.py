@@ -0,0 +1,114 @@
+import pytest
+import csv
+import io
+import json
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app
+from app.database import get_db, Base
+from app.models import Sighting, Species
+from app.services.export import export_statement, export_stream
+from datetime import datetime, timedelta
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_export.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+# Clear any existing overrides and set our own
+app.dependency_overrides.clear()
+app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(app)
+
+@pytest.fixture(scope="function")
+def setup_database():
+    """Set up test database with two species and a few sightings"""
+    Base.metadata.create_all(bind=engine)
+
+    db = TestingSessionLocal()
+    db.add(Species(id=1, common_name="American Robin", scientific_name="Turdus migratorius"))
+    db.add(Species(id=2, common_name="Blue Jay", scientific_name="Cyanocitta cristata"))
+    now = datetime.utcnow()
+    db.add(Sighting(id="s1", species_id=1, lat=42.28, lon=-83.74, taken_at=now, username="a", caption="in the, garden"))
+    db.add(Sighting(id="s2", species_id=2, lat=42.29, lon=-83.75, taken_at=now - timedelta(days=2), username="b"))
+    db.add(Sighting(id="s3", species_id=1, lat=40.71, lon=-74.00, taken_at=now - timedelta(days=5), username="a", is_private=True))
+    db.commit()
+    db.close()
+
+    yield
+
+    # Cleanup
+    Base.metadata.drop_all(bind=engine)
+
+class TestExportAPI:
+    """Test cases for GET /v1/sightings/export"""
+
+    def test_ndjson_export(self, setup_database):
+        response = client.get("/v1/sightings/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert "attachment" in response.headers["content-disposition"]
+
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == ["s1", "s2", "s3"]
+        assert rows[1]["species_common_name"] == "Blue Jay"
+        assert rows[2]["is_private"] is True
+
+    def test_filters_match_sighting_filter(self, setup_database):
+        """area, species_id, time range and username filter like POST /v1/sightings/"""
+        response = client.get("/v1/sightings/export", params={"area": "-83.80,42.25,-83.70,42.30", "species_id": 1})
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == ["s1"]
+
+        start = (datetime.utcnow() - timedelta(days=3)).isoformat()
+        response = client.get("/v1/sightings/export", params={"start_time": start, "username": "b"})
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == ["s2"]
+
+    def test_csv_export(self, setup_database):
+        response = client.get("/v1/sightings/export", params={"format": "csv"})
+        assert response.status_code == 200
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["id"] for row in rows] == ["s1", "s2", "s3"]
+        assert rows[0]["caption"] == "in the, garden"
+        assert rows[0]["species_scientific_name"] == "Turdus migratorius"
+
+    def test_csv_export_with_no_rows_has_header(self, setup_database):
+        response = client.get("/v1/sightings/export", params={"format": "csv", "username": "nobody"})
+        assert response.text.strip().startswith("id,username,species_id")
+
+    def test_parquet_export(self, setup_database):
+        pq = pytest.importorskip("pyarrow.parquet")
+        response = client.get("/v1/sightings/export", params={"format": "parquet"})
+        assert response.status_code == 200
+        table = pq.read_table(io.BytesIO(response.content))
+        assert table.column("id").to_pylist() == ["s1", "s2", "s3"]
+        assert table.column("species_id").to_pylist() == [1, 2, 1]
+
+    def test_streams_in_batches(self, setup_database):
+        """Each fetched batch becomes its own chunk instead of buffering the whole result"""
+        db = TestingSessionLocal()
+        try:
+            stmt = export_statement(db.get_bind().dialect.name)
+            chunks = list(export_stream(db, stmt, "ndjson", batch_size=2))
+        finally:
+            db.close()
+        assert [chunk.count(b"\n") for chunk in chunks] == [2, 1]
+
+    def test_invalid_format(self, setup_database):
+        response = client.get("/v1/sightings/export", params={"format": "xml"})
+        assert response.status_code == 400
+
+if __name__ == "__main__":
+    pytest.main([__file__])
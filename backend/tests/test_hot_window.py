@@ -0,0 +1,251 @@
+import pytest
+import random
+import threading
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app
+from app.config import settings
+from app.database import get_db, Base
+from app.models import Sighting, Species
+from app.services.hot_window import HotWindowStore, hot_window
+from datetime import datetime, timedelta, timezone
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_hot_window.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+# Clear any existing overrides and set our own
+app.dependency_overrides.clear()
+app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(app)
+
+def make_row(i, lat, lon, taken_at, species_id=1, username="hot"):
+    return {
+        "id": f"hot-{i}", "username": username, "species_id": species_id, "lat": lat, "lon": lon,
+        "taken_at": taken_at, "is_private": False, "media_thumb_url": None, "media_medium_url": None, "media_url": None,
+        "caption": None, "created_at": taken_at,
+    }
+
+@pytest.fixture(scope="function")
+def setup_database(monkeypatch):
+    """Set up a test database with recent and old sightings and enable the hot window"""
+    Base.metadata.create_all(bind=engine)
+
+    db = TestingSessionLocal()
+    db.add(Species(id=1, common_name="American Robin", scientific_name="Turdus migratorius"))
+    now = datetime.utcnow()
+    db.add(Sighting(id="recent-1", species_id=1, lat=42.28, lon=-83.74, taken_at=now - timedelta(hours=1), username="a"))
+    db.add(Sighting(id="recent-2", species_id=1, lat=42.29, lon=-83.75, taken_at=now - timedelta(hours=2), username="b"))
+    db.add(Sighting(id="old-1", species_id=1, lat=42.28, lon=-83.74, taken_at=now - timedelta(days=3), username="a"))
+    db.commit()
+
+    monkeypatch.setattr(settings, "hot_window_enabled", True)
+    hot_window.load(db)
+    db.close()
+
+    yield
+
+    # Cleanup
+    Base.metadata.drop_all(bind=engine)
+    hot_window.loaded = False
+
+class TestHotWindowStore:
+    """Test cases for the columnar store itself"""
+
+    def test_query_matches_brute_force(self):
+        """Vectorized grid lookups return exactly what a linear scan would"""
+        rng = random.Random(3)
+        store = HotWindowStore(timedelta(hours=24))
+        now = datetime.utcnow()
+        rows = [
+            make_row(i, rng.uniform(42.0, 42.6), rng.uniform(-84.0, -83.4),
+                     now - timedelta(minutes=rng.randint(0, 23 * 60)), species_id=rng.randint(1, 3))
+            for i in range(3000)
+        ]
+        for row in rows:
+            store.append(row)
+        store.loaded = True
+
+        bbox = (-83.8, 42.2, -83.6, 42.4)
+        start = now - timedelta(hours=6)
+        got = [row["id"] for row in store.query(bbox, start=start, species_id=2)]
+        expected = sorted(
+            (r for r in rows
+             if bbox[1] <= r["lat"] <= bbox[3] and bbox[0] <= r["lon"] <= bbox[2]
+             and r["taken_at"] >= start and r["species_id"] == 2),
+            key=lambda r: (r["taken_at"], r["id"]), reverse=True,
+        )
+        assert got == [r["id"] for r in expected]
+        assert store.stats()["rows"] == 3000
+        assert store.stats()["bytes_per_row"] > 0
+
+    def test_expired_rows_are_evicted(self):
+        """Rows that fall out of the window are dropped on sweep"""
+        store = HotWindowStore(timedelta(hours=1))
+        now = datetime.utcnow()
+        store.append(make_row(1, 42.28, -83.74, now - timedelta(minutes=59, seconds=59)))
+        store.append(make_row(2, 42.28, -83.74, now))
+        assert len(store) == 2
+
+        store.window = timedelta(minutes=30)
+        store._compact(evict=True)
+        assert len(store) == 1
+        assert [row["id"] for row in store.query()] == ["hot-2"]
+
+    def test_writes_during_merge_are_kept(self, monkeypatch):
+        """Merges sort outside the lock; rows appended or removed meanwhile survive the swap"""
+        store = HotWindowStore(timedelta(hours=1))
+        now = datetime.utcnow()
+        for i in range(5):
+            store.append(make_row(i, 42.28, -83.74, now - timedelta(minutes=i)))
+        store.append(make_row(9, 42.28, -83.74, now - timedelta(hours=2)))  # kept out of the window
+        store.append(make_row(8, 42.28, -83.74, now - timedelta(minutes=50)))
+        store.remove("hot-0")
+        store.window = timedelta(minutes=30)
+        store.loaded = True
+
+        blocked = []
+        argsort = np.argsort
+
+        def write_from_another_thread(*args, **kwargs):
+            def write():
+                store.remove("hot-1")
+                store.append(make_row(5, 42.28, -83.74, now))
+                store.append(make_row(6, 42.28, -83.74, now))
+                store.remove("hot-6")
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join(timeout=1)
+            blocked.append(writer.is_alive())
+            return argsort(*args, **kwargs)
+
+        monkeypatch.setattr(np, "argsort", write_from_another_thread)
+        store._compact(evict=True)
+        monkeypatch.setattr(np, "argsort", argsort)
+
+        assert blocked == [False]
+        assert len(store) == 4
+        assert [row["id"] for row in store.query()] == ["hot-5", "hot-2", "hot-3", "hot-4"]
+        store.append(make_row(1, 42.28, -83.74, now))
+        store._compact(evict=True)
+        assert [row["id"] for row in store.query()] == ["hot-5", "hot-1", "hot-2", "hot-3", "hot-4"]
+        assert len(store._rows) == 5
+
+class TestHotWindowAPI:
+    """Test cases for serving POST /v1/sightings/ from the hot window"""
+
+    def test_recent_window_served_from_memory(self, setup_database):
+        """A recent-window query is answered without the database"""
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            start = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
+            response = client.post("/v1/sightings/", json={"area": "-83.80,42.25,-83.70,42.30", "start_time": start})
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert response.status_code == 200
+        assert statements == []
+        assert [item["id"] for item in response.json()["items"]] == ["recent-1", "recent-2"]
+
+    def test_create_appends_to_hot_window(self, setup_database):
+        """New sightings are visible to hot-window queries right away"""
+        files = {"photo": ("bird.jpg", b"fake image content", "image/jpeg")}
+        response = client.post("/v1/sightings/create", data={"species_id": 1, "lat": 42.281, "lon": -83.741, "username": "c"}, files=files)
+        assert response.status_code == 200
+        new_id = response.json()["id"]
+
+        start = (datetime.now(timezone.utc) - timedelta(hours=1, minutes=30)).isoformat()
+        response = client.post("/v1/sightings/", json={"start_time": start, "limit": 1})
+        data = response.json()
+        assert [item["id"] for item in data["items"]] == [new_id]
+
+        response = client.post("/v1/sightings/", json={"start_time": start, "cursor": data["next_cursor"]})
+        assert [item["id"] for item in response.json()["items"]] == ["recent-1"]
+
+    def test_old_window_falls_back_to_sql(self, setup_database):
+        """Queries reaching past the window still see older rows"""
+        start = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+        response = client.post("/v1/sightings/", json={"start_time": start, "username": "a"})
+        assert [item["id"] for item in response.json()["items"]] == ["recent-1", "old-1"]
+
+    def test_viewports_served_from_memory(self, setup_database):
+        """Multi-viewport queries on the recent window are one pass over the store"""
+        start = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.post("/v1/sightings/viewports", json={
+                "areas": ["-83.745,42.275,-83.735,42.285", "-83.80,42.25,-83.70,42.30"], "start_time": start,
+            })
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert response.status_code == 200
+        assert statements == []
+        data = response.json()
+        assert [group["ids"] for group in data["groups"]] == [["recent-1"], ["recent-1", "recent-2"]]
+        assert len(data["items"]) == 2
+
+    def test_sweep_applies_change_log(self, setup_database):
+        """Edits and deletes made elsewhere reach the store on the next sweep"""
+        db = TestingSessionLocal()
+        db.query(Sighting).filter(Sighting.id == "recent-1").one().is_private = True
+        db.delete(db.query(Sighting).filter(Sighting.id == "recent-2").one())
+        db.commit()
+
+        hot_window.sweep(db)
+        db.close()
+
+        rows = hot_window.query()
+        assert [row["id"] for row in rows] == ["recent-1"]
+        assert rows[0]["is_private"] is True
+        assert hot_window.stats()["rows"] == 1
+
+    def test_load_does_not_block_queries(self, setup_database):
+        """Reads are answered from the current rows while a reload is waiting on the database"""
+        answered, blocked = [], []
+
+        def query_from_another_thread(*args):
+            reader = threading.Thread(target=lambda: answered.append(len(hot_window.query())))
+            reader.start()
+            reader.join(timeout=1)
+            blocked.append(reader.is_alive())
+
+        event.listen(engine, "before_cursor_execute", query_from_another_thread)
+        try:
+            db = TestingSessionLocal()
+            hot_window.load(db)
+            db.close()
+        finally:
+            event.remove(engine, "before_cursor_execute", query_from_another_thread)
+        assert blocked and not any(blocked)
+        assert set(answered) == {2}
+        assert len(hot_window.query()) == 2
+
+    def test_stats_endpoint(self, setup_database):
+        """Memory cost per row is reported"""
+        response = client.get("/v1/sightings/hot-window")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["enabled"] is True
+        assert data["rows"] == 2
+        assert data["bytes_per_row"] > 0
+
+if __name__ == "__main__":
+    pytest.main([__file__])
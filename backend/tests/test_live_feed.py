@@ -0,0 +1,161 @@
+import pytest
+import asyncio
+import json
+import random
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app
+from app.database import get_db, Base
+from app.models import Species
+from app.services.live_feed import LiveFeed, event_stream
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_live_feed.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+# Clear any existing overrides and set our own
+app.dependency_overrides.clear()
+app.dependency_overrides[get_db] = override_get_db
+
+ANN_ARBOR = "-83.80,42.25,-83.70,42.30"
+
+@pytest.fixture(scope="function")
+def setup_database():
+    """Set up test database with two species and no sightings"""
+    Base.metadata.create_all(bind=engine)
+
+    db = TestingSessionLocal()
+    db.add(Species(id=1, common_name="American Robin", scientific_name="Turdus migratorius"))
+    db.add(Species(id=2, common_name="Blue Jay", scientific_name="Cyanocitta cristata"))
+    db.commit()
+    db.close()
+
+    yield
+
+    # Cleanup
+    Base.metadata.drop_all(bind=engine)
+
+def post_sighting(client, species_id, lat, lon):
+    form_data = {"species_id": species_id, "lat": lat, "lon": lon, "username": "live"}
+    files = {"photo": ("bird.jpg", b"fake image content", "image/jpeg")}
+    response = client.post("/v1/sightings/create", data=form_data, files=files)
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def row(i, lat, lon, species_id=1):
+    return {"id": f"live-{i}", "lat": lat, "lon": lon, "species_id": species_id}
+
+class TestLiveFeedHub:
+    """Test cases for subscription matching and queues"""
+
+    def test_index_matches_brute_force(self):
+        """Tile index lookups find exactly the subscriptions a linear scan would"""
+        rng = random.Random(5)
+        feed = LiveFeed(queue_size=8)
+        subs = []
+        for _ in range(2000):
+            west, south = rng.uniform(-90, -82), rng.uniform(41.5, 47.5)
+            size = rng.choice([0.01, 0.1, 1.0, 5.0])
+            subs.append(feed.subscribe((west, south, west + size, south + size), rng.choice([None, 1, 2])))
+        subs.append(feed.subscribe(None, None))
+
+        for _ in range(200):
+            lat, lon, species_id = rng.uniform(41.5, 47.5), rng.uniform(-90, -82), rng.randint(1, 2)
+            got = {sub.id for sub in feed.matching(lat, lon, species_id)}
+            expected = {sub.id for sub in subs if sub.matches(lat, lon, species_id)}
+            assert got == expected
+
+    def test_update_and_unsubscribe(self):
+        """Moving or dropping a subscription leaves nothing behind in the index"""
+        feed = LiveFeed(queue_size=8)
+        sub = feed.subscribe((-83.80, 42.25, -83.70, 42.30))
+        assert feed.publish(row(1, 42.28, -83.74)) == 1
+
+        feed.update(sub, (-74.1, 40.6, -73.9, 40.8), None)
+        assert feed.publish(row(2, 42.28, -83.74)) == 0
+        assert feed.publish(row(3, 40.71, -74.00)) == 1
+
+        feed.unsubscribe(sub)
+        assert feed.stats() == {"subscriptions": 0, "index_cells": 0, "dropped": 0}
+
+    def test_slow_client_drops_oldest(self):
+        """A full queue drops its oldest message instead of blocking the publisher"""
+        feed = LiveFeed(queue_size=2)
+        sub = feed.subscribe(None)
+        for i in range(3):
+            feed.publish(row(i, 42.28, -83.74))
+        assert sub.dropped == 1
+        assert [json.loads(sub.queue.get_nowait())["id"] for _ in range(2)] == ["live-1", "live-2"]
+
+    def test_event_stream_frames(self):
+        """SSE frames carry one sighting each; idle periods send keepalive comments"""
+        feed = LiveFeed(queue_size=8)
+
+        async def read():
+            stream = event_stream(feed, None, None, keepalive_s=0.01)
+            first = await stream.__anext__()
+            feed.publish(row(1, 42.28, -83.74))
+            second = await stream.__anext__()
+            await stream.aclose()
+            return first, second
+
+        first, second = asyncio.run(read())
+        assert first == ": keepalive\n\n"
+        assert second.startswith("event: sighting\ndata: ")
+        assert json.loads(second.split("data: ", 1)[1])["id"] == "live-1"
+        assert len(feed) == 0
+
+    def test_unstarted_stream_holds_no_subscription(self):
+        """A stream dropped before its first frame (client gone early) never subscribes"""
+        feed = LiveFeed(queue_size=8)
+        stream = event_stream(feed, None, None, keepalive_s=0.01)
+        assert len(feed) == 0
+        asyncio.run(stream.aclose())
+        assert len(feed) == 0
+
+class TestLiveFeedAPI:
+    """Test cases for the /v1/sightings/live WebSocket"""
+
+    def test_new_sightings_pushed_to_matching_subscribers(self, setup_database):
+        with TestClient(app) as client:
+            with client.websocket_connect(f"/v1/sightings/live?area={ANN_ARBOR}&species_id=1") as ws:
+                post_sighting(client, 1, 40.71, -74.00)  # outside the bbox
+                post_sighting(client, 2, 42.28, -83.74)  # other species
+                expected = post_sighting(client, 1, 42.28, -83.74)
+
+                message = ws.receive_json()
+                assert message["id"] == expected
+                assert message["species_id"] == 1
+
+    def test_subscription_can_move(self, setup_database):
+        with TestClient(app) as client:
+            with client.websocket_connect(f"/v1/sightings/live?area={ANN_ARBOR}") as ws:
+                ws.send_text("not json")
+                assert "error" in ws.receive_json()
+
+                ws.send_json({"area": "-74.10,40.60,-73.90,40.80"})
+                post_sighting(client, 1, 42.28, -83.74)
+                expected = post_sighting(client, 1, 40.71, -74.00)
+                assert ws.receive_json()["id"] == expected
+
+    def test_invalid_area_rejected(self, setup_database):
+        with TestClient(app) as client:
+            with pytest.raises(Exception):
+                with client.websocket_connect("/v1/sightings/live?area=nope") as ws:
+                    ws.receive_json()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
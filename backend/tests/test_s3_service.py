@@ -0,0 +1,132 @@
+import pytest
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+moto = pytest.importorskip("moto", reason="moto is needed to stand in for S3")
+import boto3
+import requests
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import ClientDisconnect
+
+from app.config import settings
+from app.database import Base
+from app.models import ResumableUpload
+from app.services import resumable_upload
+from app.services import s3_service as s3_module
+from app.services.s3_service import S3Service
+
+BUCKET = "test-sightings-media"
+
+async def one_chunk_at_a_time(data, size=1024 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+@pytest.fixture(scope="function")
+def s3(monkeypatch):
+    """A moto-backed bucket and an S3Service configured for it"""
+    monkeypatch.setattr(settings, "aws_access_key_id", "testing")
+    monkeypatch.setattr(settings, "aws_secret_access_key", "testing")
+    monkeypatch.setattr(settings, "aws_s3_bucket_name", BUCKET)
+    monkeypatch.setattr(settings, "aws_region", "us-east-1")
+    with moto.mock_s3():
+        client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="testing", aws_secret_access_key="testing")
+        client.create_bucket(Bucket=BUCKET)
+        yield client, S3Service()
+
+def get_body(client, url):
+    key = url.split(".amazonaws.com/")[1]
+    return client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+
+class TestS3Service:
+    """Test cases for the pooled, non-blocking S3 client"""
+
+    def test_upload_and_delete(self, s3):
+        """A small file is stored with one put and can be deleted by URL"""
+        client, service = s3
+        url = asyncio.run(service.upload_file(b"chirp", "bird.jpg", "image/jpeg", folder="sightings/photos"))
+        assert url == f"https://{BUCKET}.s3.us-east-1.amazonaws.com/sightings/photos/bird.jpg"
+        assert get_body(client, url) == b"chirp"
+
+        assert asyncio.run(service.delete_file(url)) is True
+        assert client.list_objects_v2(Bucket=BUCKET)["KeyCount"] == 0
+
+    def test_upload_stream_multipart(self, s3, monkeypatch):
+        """A file larger than one part goes up as a multipart upload, intact"""
+        client, service = s3
+        monkeypatch.setattr(s3_module, "MULTIPART_PART_SIZE", 5 * 1024 * 1024)
+        data = os.urandom(11 * 1024 * 1024 + 7)
+        url = asyncio.run(service.upload_stream(one_chunk_at_a_time(data), "call.wav", "audio/wav", folder="sightings/audio"))
+        assert get_body(client, url) == data
+        assert client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+
+    def test_acl_probe_is_cached(self, s3, monkeypatch):
+        """A bucket with ACLs disabled is probed once, and uploads skip the ACL"""
+        client, service = s3
+        client.put_bucket_ownership_controls(
+            Bucket=BUCKET, OwnershipControls={"Rules": [{"ObjectOwnership": "BucketOwnerEnforced"}]}
+        )
+        calls = []
+        original = service._call
+        async def record(method, **kwargs):
+            calls.append((method, "ACL" in kwargs))
+            return await original(method, **kwargs)
+        monkeypatch.setattr(service, "_call", record)
+
+        async def upload_many():
+            return await asyncio.gather(*(
+                service.upload_file(b"x", f"bird-{i}.jpg", "image/jpeg") for i in range(8)
+            ))
+        urls = asyncio.run(upload_many())
+
+        assert len(set(urls)) == 8
+        assert service._acl_supported is False
+        assert calls == [("put_object", False)] * 8
+
+    def test_presigned_put(self, s3):
+        """A presigned URL accepts the upload and the object is then visible"""
+        client, service = s3
+        key = "sightings/photos/direct.jpg"
+        assert asyncio.run(service.object_size(key)) is None
+
+        url, headers = asyncio.run(service.presigned_put(key, "image/jpeg", 600))
+        assert "Signature" in url or "X-Amz-Signature" in url
+        response = requests.put(url, data=b"direct bytes", headers=headers)
+        assert response.status_code == 200
+        assert asyncio.run(service.object_size(key)) == len(b"direct bytes")
+
+    def test_resumable_upload_parts(self, s3, monkeypatch):
+        """A resumable upload goes into S3 parts; bytes short of a part survive a dropped request"""
+        client, service = s3
+        monkeypatch.setattr(resumable_upload, "s3_service", service)
+        monkeypatch.setattr(resumable_upload, "MULTIPART_PART_SIZE", 5 * 1024 * 1024)
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        data = os.urandom(12 * 1024 * 1024 + 3)
+
+        async def dropped(chunk):
+            yield chunk
+            raise ClientDisconnect()
+
+        async def upload_all():
+            upload = await resumable_upload.create_upload(db, len(data), {"filename": "night.wav"})
+            # 7 MiB: one part plus a 2 MiB tail object, kept although the request broke off
+            upload = await resumable_upload.append(db, upload.id, 0, dropped(data[:7 * 1024 * 1024]))
+            assert (upload.offset, len(upload.parts)) == (7 * 1024 * 1024, 1)
+            upload = await resumable_upload.append(db, upload.id, upload.offset, one_chunk_at_a_time(data[upload.offset:]))
+            return await resumable_upload.finalize_uploads(db, {"audio": upload.id})
+
+        urls = asyncio.run(upload_all())
+        db.commit()
+        assert get_body(client, urls["audio_url"]) == data
+        assert db.query(ResumableUpload).count() == 0
+        assert client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+        assert [obj["Key"] for obj in client.list_objects_v2(Bucket=BUCKET)["Contents"]] == [urls["audio_url"].split(".amazonaws.com/")[1]]
+        db.close()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
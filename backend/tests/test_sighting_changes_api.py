@@ -0,0 +1,162 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app
+from app.database import get_db, Base
+from app.models import Sighting, Species
+from app.services import change_log
+from app.services.change_log import log_bulk_delete
+from datetime import datetime
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_sighting_changes.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+# Clear any existing overrides and set our own
+app.dependency_overrides.clear()
+app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(app)
+
+ANN_ARBOR = "-83.80,42.25,-83.70,42.30"
+
+@pytest.fixture(scope="function")
+def setup_database():
+    """Set up test database with one species and no sightings"""
+    Base.metadata.create_all(bind=engine)
+
+    db = TestingSessionLocal()
+    db.add(Species(id=1, common_name="American Robin", scientific_name="Turdus migratorius"))
+    db.commit()
+    db.close()
+
+    yield
+
+    # Cleanup
+    Base.metadata.drop_all(bind=engine)
+
+def post_sighting(lat, lon, username="syncer"):
+    form_data = {"species_id": 1, "lat": lat, "lon": lon, "username": username}
+    files = {"photo": ("bird.jpg", b"fake image content", "image/jpeg")}
+    response = client.post("/v1/sightings/create", data=form_data, files=files)
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def get_changes(since, **params):
+    response = client.get("/v1/sightings/changes", params={"since": since, **params})
+    assert response.status_code == 200
+    return response.json()
+
+class TestSightingChangesAPI:
+    """Test cases for GET /v1/sightings/changes"""
+
+    def test_full_sync_returns_inserts(self, setup_database):
+        """since=0 returns every sighting as an insert"""
+        first = post_sighting(42.28, -83.74)
+        second = post_sighting(42.29, -83.75)
+
+        data = get_changes(0)
+        assert [(item["op"], item["id"]) for item in data["items"]] == [("insert", first), ("insert", second)]
+        assert data["items"][0]["sighting"]["lat"] == 42.28
+        assert data["high_water_mark"] == data["items"][-1]["seq"]
+        assert data["has_more"] is False
+
+        # Nothing new since the mark
+        again = get_changes(data["high_water_mark"])
+        assert again["items"] == []
+        assert again["high_water_mark"] == data["high_water_mark"]
+
+    def test_privacy_flip_and_delete(self, setup_database):
+        """Updates carry the current row and deletes carry only the id"""
+        flipped = post_sighting(42.28, -83.74)
+        removed = post_sighting(42.29, -83.75)
+        mark = get_changes(0)["high_water_mark"]
+
+        db = TestingSessionLocal()
+        db.query(Sighting).filter(Sighting.id == flipped).one().is_private = True
+        db.delete(db.query(Sighting).filter(Sighting.id == removed).one())
+        db.commit()
+        db.close()
+
+        items = get_changes(mark)["items"]
+        assert [(item["op"], item["id"]) for item in items] == [("update", flipped), ("delete", removed)]
+        assert items[0]["sighting"]["is_private"] is True
+        assert items[1]["sighting"] is None
+
+    def test_only_latest_change_per_sighting(self, setup_database):
+        """A sighting inserted and then deleted after the mark shows up once, as a delete"""
+        sighting_id = post_sighting(42.28, -83.74)
+
+        db = TestingSessionLocal()
+        db.delete(db.query(Sighting).filter(Sighting.id == sighting_id).one())
+        db.commit()
+        db.close()
+
+        items = get_changes(0)["items"]
+        assert [(item["op"], item["id"]) for item in items] == [("delete", sighting_id)]
+
+    def test_bulk_delete_is_logged(self, setup_database):
+        """Bulk deletes are logged explicitly since they skip ORM events"""
+        sighting_id = post_sighting(42.28, -83.74)
+        mark = get_changes(0)["high_water_mark"]
+
+        db = TestingSessionLocal()
+        query = db.query(Sighting).filter(Sighting.media_url.is_(None) | (Sighting.id == sighting_id))
+        log_bulk_delete(db, query)
+        query.delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+        items = get_changes(mark)["items"]
+        assert [(item["op"], item["id"]) for item in items] == [("delete", sighting_id)]
+
+    def test_area_filter_and_paging(self, setup_database):
+        """Only changes inside the area are returned; the mark still advances past the rest"""
+        inside = [post_sighting(42.28, -83.74), post_sighting(42.27, -83.73)]
+        post_sighting(40.71, -74.00)  # New York
+
+        page = get_changes(0, area=ANN_ARBOR, limit=1)
+        assert [item["id"] for item in page["items"]] == [inside[0]]
+        assert page["has_more"] is True
+
+        page = get_changes(page["high_water_mark"], area=ANN_ARBOR, limit=1)
+        assert [item["id"] for item in page["items"]] == [inside[1]]
+
+        page = get_changes(page["high_water_mark"], area=ANN_ARBOR, limit=1)
+        assert page["items"] == []
+        assert page["has_more"] is False
+        assert page["high_water_mark"] == get_changes(0)["high_water_mark"]
+
+    def test_changes_after_write_horizon_are_held_back(self, setup_database, monkeypatch):
+        """Changes logged after an unfinished writer started are not returned, nor passed by the high-water mark"""
+        first = post_sighting(42.28, -83.74)
+        horizon = datetime.utcnow()  # as if a long bulk ingest started here and still runs
+        post_sighting(42.29, -83.75)
+        monkeypatch.setattr(change_log, "write_horizon", lambda db: horizon)
+
+        data = get_changes(0)
+        assert [item["id"] for item in data["items"]] == [first]
+        assert data["high_water_mark"] == data["items"][0]["seq"]
+
+        monkeypatch.undo()
+        assert len(get_changes(data["high_water_mark"])["items"]) == 1
+
+    def test_invalid_area(self, setup_database):
+        response = client.get("/v1/sightings/changes", params={"since": 0, "area": "nope"})
+        assert response.status_code == 400
+
+if __name__ == "__main__":
+    pytest.main([__file__])
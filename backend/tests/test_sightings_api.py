@@ -1,7 +1,13 @@
 import pytest
 import asyncio
+import base64
+import hashlib
+import io
+import json
+import httpx
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import sessionmaker
 import sys
 import os
@@ -9,7 +15,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.main import app
 from app.database import get_db, Base
-from app.models import Sighting, Species
+from app.config import settings
+from app.models import Media, ResumableUpload, Sighting, SightingChange, SightingGridCell, Species, Task
+from app.services import media_upload, resumable_upload, spatial_index, thumbnails
+from app.services.sighting_grid import GRID_MIN_ZOOM
+from app.services.species_info import save_wiki
+from app.services.task_queue import TaskRunner
+from PIL import Image
+from starlette.requests import ClientDisconnect
 from datetime import datetime, timedelta, timezone
 import os
 
@@ -31,6 +44,10 @@ app.dependency_overrides[get_db] = override_get_db
 
 client = TestClient(app)
 
+def run_tasks():
+    """Run the follow-up tasks the requests queued (the lifespan runner is not started here)"""
+    asyncio.run(TaskRunner(TestingSessionLocal).drain())
+
 @pytest.fixture(scope="function")
 def setup_database():
     """Set up test database with sample data"""
@@ -165,6 +182,56 @@ class TestSightingsAPI:
         data = response.json()
         assert len(data["items"]) == 2  # Both test sightings should be included
     
+    def test_get_sightings_area_uses_spatial_index(self, setup_database):
+        """Test that the R*Tree is kept in sync and the bbox filter stays exact"""
+        db = TestingSessionLocal()
+        species = db.query(Species).filter(Species.scientific_name == "Turdus migratorius").first()
+        db.add(Sighting(
+            id="test-sighting-outside",
+            species_id=species.id,
+            lat=42.3700001,  # just north of the box below
+            lon=-71.06,
+            taken_at=datetime.now(timezone.utc),
+            username="testuser1"
+        ))
+        db.commit()
+        indexed = db.execute(text("SELECT COUNT(*) FROM sightings_rtree")).scalar()
+        db.close()
+        assert indexed == 3
+
+        response = client.post("/v1/sightings/", json={"area": "-71.07,42.35,-71.05,42.37"})
+        assert response.status_code == 200
+        ids = {item["id"] for item in response.json()["items"]}
+        assert ids == {"test-sighting-1", "test-sighting-2"}
+
+    def test_spatial_index_survives_rowid_renumbering(self, setup_database):
+        """Test that the R*Tree does not depend on sightings rowids, which VACUUM may renumber"""
+        with engine.begin() as conn:
+            # Same effect as a VACUUM compacting the rowids of a table with a TEXT primary key
+            conn.execute(text("UPDATE sightings SET rowid = rowid + 1000"))
+        with engine.connect() as conn:
+            conn.execute(text("VACUUM"))
+
+        response = client.post("/v1/sightings/", json={"area": "-71.07,42.35,-71.05,42.37"})
+        assert response.status_code == 200
+        ids = {item["id"] for item in response.json()["items"]}
+        assert ids == {"test-sighting-1", "test-sighting-2"}
+
+    def test_bbox_filter_without_postgis(self, setup_database, monkeypatch):
+        """Test that PostgreSQL falls back to lat/lon ranges when the PostGIS index could not be created"""
+        monkeypatch.setattr(spatial_index, "_postgis_ready", True)
+        with engine.connect() as conn:
+            # CREATE EXTENSION fails here just as it does without the rights to run it
+            assert spatial_index.create_postgis_index(conn) is False
+
+        where = spatial_index.bbox_filter(Sighting, "postgresql", -71.07, 42.35, -71.05, 42.37)
+        sql = str(where.compile(dialect=postgresql.dialect()))
+        assert "geom" not in sql and "sightings.lat >=" in sql
+
+        monkeypatch.setattr(spatial_index, "_postgis_ready", True)
+        where = spatial_index.bbox_filter(Sighting, "postgresql", -71.07, 42.35, -71.05, 42.37)
+        assert "sightings.geom &&" in str(where.compile(dialect=postgresql.dialect()))
+
     def test_get_sightings_species_filter(self, setup_database):
         """Test sightings query with species filter"""
         # Get the species ID from the database
@@ -187,6 +254,121 @@ class TestSightingsAPI:
         for sighting in data["items"]:
             assert sighting["species_id"] == species_id
     
+    def test_get_sightings_cursor_pagination(self, setup_database):
+        """Test paging through results with next_cursor"""
+        db = TestingSessionLocal()
+        species = db.query(Species).filter(Species.scientific_name == "Turdus migratorius").first()
+        same_time = datetime.now(timezone.utc) - timedelta(minutes=30)
+        for i in range(5):
+            db.add(Sighting(
+                id=f"test-page-{i}",
+                species_id=species.id,
+                lat=42.36,
+                lon=-71.06,
+                taken_at=same_time,  # identical timestamps exercise the id tie-breaker
+                username="pager"
+            ))
+        db.commit()
+        db.close()
+
+        seen = []
+        filter_data = {"area": "-71.07,42.35,-71.05,42.37", "limit": 3}
+        for _ in range(5):
+            response = client.post("/v1/sightings/", json=filter_data)
+            assert response.status_code == 200
+            data = response.json()
+            assert len(data["items"]) <= 3
+            seen.extend(item["id"] for item in data["items"])
+            if not data["next_cursor"]:
+                break
+            filter_data["cursor"] = data["next_cursor"]
+
+        assert len(seen) == 7
+        assert len(set(seen)) == 7
+        assert seen[0] == "test-sighting-1"
+
+    def test_get_sightings_invalid_cursor(self, setup_database):
+        """Test that an unknown cursor or page size is rejected"""
+        response = client.post("/v1/sightings/", json={"username": "testuser1", "cursor": "not-a-cursor"})
+        assert response.status_code == 400
+        assert "Invalid cursor" in response.json()["detail"]
+
+        response = client.post("/v1/sightings/", json={"username": "testuser1", "limit": 0})
+        assert response.status_code == 400
+
+    def test_get_sightings_fast_serialization(self, setup_database, monkeypatch):
+        """The column-tuple fast path returns the same JSON as the default path"""
+        filter_data = {"area": "-71.07,42.35,-71.05,42.37", "limit": 1}
+        expected = client.post("/v1/sightings/", json=filter_data).json()
+
+        monkeypatch.setattr(settings, "sightings_fast_serialization", True)
+        response = client.post("/v1/sightings/", json=filter_data)
+        assert response.status_code == 200
+        assert response.json() == expected
+
+    def test_get_sightings_compact_shape(self, setup_database):
+        """Clients that accept the compact type get parallel arrays per column"""
+        filter_data = {"area": "-71.07,42.35,-71.05,42.37"}
+        expected = client.post("/v1/sightings/", json=filter_data).json()
+
+        response = client.post("/v1/sightings/", json=filter_data, headers={"Accept": "application/vnd.sightings.compact+json"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/vnd.sightings.compact+json"
+        data = response.json()
+        assert data["count"] == 2
+        assert data["next_cursor"] is None
+        assert data["columns"]["id"] == [item["id"] for item in expected["items"]]
+        assert data["columns"]["taken_at"] == [item["taken_at"] for item in expected["items"]]
+        assert data["columns"]["is_private"] == [False, True]
+
+    def test_get_sightings_sparse_fields(self, setup_database):
+        """A sparse fieldset is selected in SQL and returned as is"""
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.post("/v1/sightings/", json={"area": "-71.07,42.35,-71.05,42.37", "fields": "id,lat,lon,species_id", "limit": 1})
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data["items"][0]) == {"id", "lat", "lon", "species_id"}
+        assert data["items"][0]["id"] == "test-sighting-1"
+        assert data["next_cursor"] is not None
+        assert "caption" not in statements[0] and "media_url" not in statements[0]
+
+        response = client.post("/v1/sightings/", json={"area": "-71.07,42.35,-71.05,42.37", "fields": "id,lat"},
+                               headers={"Accept": "application/vnd.sightings.compact+json"})
+        assert set(response.json()["columns"]) == {"id", "lat"}
+
+        response = client.post("/v1/sightings/", json={"area": "-71.07,42.35,-71.05,42.37", "fields": "id,color"})
+        assert response.status_code == 400
+
+    def test_get_sightings_bundle(self, setup_database):
+        """Bundle mode adds each referenced species once, with its stored Wikipedia data"""
+        filter_data = {"area": "-71.07,42.35,-71.05,42.37", "bundle": True}
+        response = client.post("/v1/sightings/", json=filter_data)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) == 2
+        species_id = data["items"][0]["species_id"]
+        assert list(data["species"]) == [str(species_id)]
+        assert data["species"][str(species_id)]["common_name"] == "American Robin"
+        assert data["species"][str(species_id)]["description"] == "A common North American songbird"
+        assert data["species"][str(species_id)]["main_image"] is None
+
+        db = TestingSessionLocal()
+        species = db.get(Species, species_id)
+        save_wiki(species, {"english_name": "American robin", "description": "From Wikipedia", "main_image": "https://example.org/robin.jpg"})
+        db.commit()
+        db.close()
+        response = client.post("/v1/sightings/", json=filter_data, headers={"Accept": "application/vnd.sightings.compact+json"})
+        data = response.json()
+        assert data["count"] == 2
+        assert data["species"][str(species_id)]["description"] == "From Wikipedia"
+        assert data["species"][str(species_id)]["main_image"] == "https://example.org/robin.jpg"
+
     def test_get_sighting_by_id_success(self, setup_database):
         """Test successful retrieval of a specific sighting by ID"""
         response = client.get("/v1/sightings/test-sighting-1")
@@ -224,6 +406,129 @@ class TestSightingsAPI:
         # This should return 405 Method Not Allowed since we're using GET instead of POST
         assert response.status_code == 405
 
+class TestSightingsBatchAPI:
+    """Test cases for POST /v1/sightings/batch"""
+
+    def test_batch_in_request_order_with_misses(self, setup_database):
+        """Sightings come back in request order, unknown ids as null"""
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.post("/v1/sightings/batch", json={
+                "ids": ["test-sighting-2", "unknown", "test-sighting-1", "test-sighting-2"]
+            })
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [item and item["id"] for item in data["items"]] == ["test-sighting-2", None, "test-sighting-1", "test-sighting-2"]
+        assert data["missing"] == ["unknown"]
+        assert data["items"][0]["species"]["scientific_name"] == "Turdus migratorius"
+        # Sightings and their species in a single statement
+        assert len(statements) == 1
+
+    def test_batch_empty_and_too_many(self, setup_database):
+        """No ids is an empty result; too many ids is rejected"""
+        response = client.post("/v1/sightings/batch", json={"ids": []})
+        assert response.status_code == 200
+        assert response.json() == {"items": [], "missing": []}
+
+        response = client.post("/v1/sightings/batch", json={"ids": [f"id-{i}" for i in range(501)]})
+        assert response.status_code == 400
+
+class TestSightingsBulkAPI:
+    """Test cases for the bulk ingest endpoint"""
+
+    def test_bulk_json_per_row_results(self, setup_database):
+        """Valid rows go in with one INSERT; bad rows are reported without stopping them"""
+        manifest = [
+            {"species_id": 1, "lat": 42.30, "lon": -83.70, "username": "surveyor", "taken_at": "2025-05-01T12:00:00Z"},
+            {"species_id": 999, "lat": 42.30, "lon": -83.70, "username": "surveyor"},
+            {"species_id": 1, "lat": 142.0, "lon": -83.70, "username": "surveyor"},
+            {"species_id": 1, "lat": 42.31, "lon": -83.71},
+            {"species_id": 1, "lat": 42.32, "lon": -83.72, "username": "surveyor", "caption": "pair"},
+        ]
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.post("/v1/sightings/bulk", json=manifest)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["created"], data["failed"]) == (2, 3)
+        assert [result["status"] for result in data["results"]] == ["created", "error", "error", "error", "created"]
+        assert data["results"][1]["detail"] == "Species not found"
+        assert "lat must be within" in data["results"][2]["detail"]
+        assert data["results"][3]["detail"].startswith("username:")
+
+        assert len([sql for sql in statements if sql.startswith("INSERT INTO sightings ")]) == 1
+        assert len([sql for sql in statements if "FROM species" in sql]) == 1
+
+        db = TestingSessionLocal()
+        first = db.get(Sighting, data["results"][0]["id"])
+        assert first.taken_at == datetime(2025, 5, 1, 12, 0) and first.username == "surveyor"
+        assert db.get(Sighting, data["results"][4]["id"]).caption == "pair"
+        created = [data["results"][0]["id"], data["results"][4]["id"]]
+        assert db.query(SightingChange).filter(SightingChange.sighting_id.in_(created), SightingChange.op == "insert").count() == 2
+        assert sum(cell.count for cell in db.query(SightingGridCell).filter(SightingGridCell.zoom == GRID_MIN_ZOOM)) == 2
+        db.close()
+
+    def test_bulk_ndjson(self, setup_database):
+        """An NDJSON manifest is read line by line; a broken line fails only its row"""
+        lines = [
+            json.dumps({"species_id": 1, "lat": 42.30, "lon": -83.70, "username": "surveyor"}),
+            '{"species_id": 1, "lat": ',
+            json.dumps({"species_id": 1, "lat": 42.31, "lon": -83.71, "username": "surveyor"}),
+        ]
+        response = client.post("/v1/sightings/bulk", content="\n".join(lines) + "\n",
+                               headers={"Content-Type": "application/x-ndjson"})
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["created"], data["failed"]) == (2, 1)
+        assert data["results"][1]["detail"].startswith("Line 2 is not valid JSON")
+
+    def test_bulk_multipart_media(self, setup_database):
+        """Rows name media parts; a part shared by rows is stored once and counted per row"""
+        photo = make_photo(32, 32, color=tuple(os.urandom(3)))
+        manifest = [
+            {"species_id": 1, "lat": 42.30, "lon": -83.70, "username": "surveyor", "photo": "p1", "audio": "a1"},
+            {"species_id": 1, "lat": 42.31, "lon": -83.71, "username": "surveyor", "photo": "p1"},
+            {"species_id": 1, "lat": 42.32, "lon": -83.72, "username": "surveyor", "photo": "missing"},
+        ]
+        files = [
+            ("manifest", ("survey.json", json.dumps(manifest), "application/json")),
+            ("p1", ("robin.jpg", photo, "image/jpeg")),
+            ("a1", ("robin.wav", b"RIFF" + os.urandom(2048), "audio/wav")),
+        ]
+        response = client.post("/v1/sightings/bulk", files=files)
+        assert response.status_code == 200
+        run_tasks()
+        data = response.json()
+        assert [result["status"] for result in data["results"]] == ["created", "created", "error"]
+        assert data["results"][2]["detail"] == "No file part named 'missing' for photo"
+
+        db = TestingSessionLocal()
+        one, two = (db.get(Sighting, result["id"]) for result in data["results"][:2])
+        assert one.media_url == two.media_url and os.path.exists(one.media_url)
+        assert one.audio_url and two.audio_url is None
+        assert db.query(Media).filter(Media.url == one.media_url).one().refcount == 2
+        assert two.media_thumb_url is not None
+        db.close()
+
+    def test_bulk_rejects_bad_manifests(self, setup_database, monkeypatch):
+        """Unreadable or oversized manifests are refused as a whole"""
+        assert client.post("/v1/sightings/bulk", content=b"", headers={"Content-Type": "application/json"}).status_code == 400
+        assert client.post("/v1/sightings/bulk", content=b"[{", headers={"Content-Type": "application/json"}).status_code == 400
+        assert client.post("/v1/sightings/bulk", files=[("p1", ("a.jpg", b"x", "image/jpeg"))]).status_code == 400
+        monkeypatch.setattr(settings, "bulk_ingest_max_rows", 2)
+        rows = [{"species_id": 1, "lat": 42.3, "lon": -83.7, "username": "surveyor"}] * 3
+        assert client.post("/v1/sightings/bulk", json=rows).status_code == 413
+
 class TestSightingsCreateAPI:
     """Test cases for the sighting creation endpoint"""
     
@@ -321,5 +626,472 @@ class TestSightingsCreateAPI:
             if os.path.exists(test_image_path):
                 os.remove(test_image_path)
 
+    def test_create_sighting_streams_media(self, setup_database):
+        """Files larger than one chunk are stored intact"""
+        photo = os.urandom(2 * 1024 * 1024 + 123)
+        audio = b"RIFF" + os.urandom(300 * 1024)
+        form_data = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser"}
+        files = {"photo": ("big.jpg", photo, "image/jpeg"), "audio": ("call.wav", audio, "audio/wav")}
+        response = client.post("/v1/sightings/create", data=form_data, files=files)
+        
+        assert response.status_code == 200
+        data = response.json()
+        with open(data["media_url"], "rb") as f:
+            assert f.read() == photo
+        db = TestingSessionLocal()
+        audio_url = db.query(Sighting).filter(Sighting.id == data["id"]).one().audio_url
+        db.close()
+        with open(audio_url, "rb") as f:
+            assert f.read() == audio
+        assert not os.path.exists(data["media_url"] + ".part")
+    
+    def test_create_sighting_file_too_large(self, setup_database, monkeypatch):
+        """A file over its limit is rejected and nothing from the request is kept"""
+        monkeypatch.setattr(settings, "media_max_audio_bytes", 1024)
+        photos_before = set(os.listdir("uploads/photos")) if os.path.isdir("uploads/photos") else set()
+        form_data = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser"}
+        files = {"photo": ("bird.jpg", b"fake image content", "image/jpeg"), "audio": ("call.wav", b"x" * 4096, "audio/wav")}
+        response = client.post("/v1/sightings/create", data=form_data, files=files)
+        
+        assert response.status_code == 413
+        assert set(os.listdir("uploads/photos")) == photos_before
+        assert not any(name.endswith(".part") for name in os.listdir("uploads/audio"))
+    
+    def test_create_sighting_request_too_large(self, setup_database, monkeypatch):
+        """A request declaring more bytes than both limits allow is rejected before parsing"""
+        monkeypatch.setattr(settings, "media_max_photo_bytes", 1024)
+        monkeypatch.setattr(settings, "media_max_audio_bytes", 1024)
+        form_data = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser"}
+        files = {"photo": ("big.jpg", b"x" * (128 * 1024), "image/jpeg")}
+        response = client.post("/v1/sightings/create", data=form_data, files=files)
+        
+        assert response.status_code == 413
+        assert response.json()["detail"] == "Upload too large"
+
+def make_photo(width, height, fmt="JPEG", color=(90, 140, 60)):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(out, fmt)
+    return out.getvalue()
+
+class TestSightingsGroupCommit:
+    """Test cases for creating sightings in group-commit mode"""
+
+    def test_concurrent_creates_share_one_insert(self, setup_database, monkeypatch):
+        """Concurrent creates go in with one INSERT ... RETURNING; each caller gets its own row"""
+        monkeypatch.setattr(settings, "group_commit_enabled", True)
+        monkeypatch.setattr(settings, "group_commit_window_ms", 50)
+        photo = make_photo(16, 16, color=tuple(os.urandom(3)))
+
+        async def create_all():
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                return await asyncio.gather(*(
+                    async_client.post("/v1/sightings/create", data={
+                        "species_id": 999 if i == 3 else 1, "lat": 42.30 + i / 100, "lon": -83.70,
+                        "username": "testuser1", "caption": f"row {i}",
+                    }, files={"photo": ("robin.jpg", photo, "image/jpeg")})
+                    for i in range(5)
+                ))
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            responses = asyncio.run(create_all())
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+        assert [response.status_code for response in responses] == [200, 200, 200, 404, 200]
+        created = [response.json() for i, response in enumerate(responses) if i != 3]
+        assert [item["caption"] for item in created] == ["row 0", "row 1", "row 2", "row 4"]
+        assert len({item["id"] for item in created}) == 4
+        assert created[0]["media_url"] == created[1]["media_url"]
+
+        inserts = [sql for sql in statements if sql.startswith("INSERT INTO sightings ")]
+        assert len(inserts) == 1 and "RETURNING" in inserts[0]
+
+        db = TestingSessionLocal()
+        ids = [item["id"] for item in created]
+        assert db.query(Sighting).filter(Sighting.id.in_(ids)).count() == 4
+        assert db.query(SightingChange).filter(SightingChange.sighting_id.in_(ids)).count() == 4
+        assert db.query(Media).filter(Media.url == created[0]["media_url"]).one().refcount == 4
+        assert db.query(Task).filter(Task.kind == "thumbnails.create").count() == 4
+        db.close()
+
+class TestSightingThumbnails:
+    """Test cases for the thumb/medium variants made after a photo is stored"""
+
+    def test_create_sighting_makes_variants(self, setup_database):
+        """Variants are stored next to the photo and their URLs recorded by the queued task"""
+        form_data = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser"}
+        files = {"photo": ("wide.jpg", make_photo(2000, 1500), "image/jpeg")}
+        response = client.post("/v1/sightings/create", data=form_data, files=files)
+        assert response.status_code == 200
+        assert response.json()["media_medium_url"] is None
+
+        db = TestingSessionLocal()
+        task = db.query(Task).one()
+        assert (task.kind, task.payload["sighting_id"]) == ("thumbnails.create", response.json()["id"])
+        db.close()
+        run_tasks()
+
+        db = TestingSessionLocal()
+        assert db.query(Task).count() == 0
+        sighting = db.query(Sighting).filter(Sighting.id == response.json()["id"]).one()
+        db.close()
+        stem = os.path.splitext(sighting.media_url)[0]
+        assert sighting.media_thumb_url == f"{stem}_thumb.webp"
+        assert sighting.media_medium_url == f"{stem}_medium.webp"
+        with Image.open(sighting.media_thumb_url) as thumb:
+            assert thumb.format == "WEBP" and thumb.size == (256, 192)
+        with Image.open(sighting.media_medium_url) as medium:
+            assert medium.size == (1024, 768)
+
+    def test_unreadable_photo_keeps_sighting(self, setup_database):
+        """A photo Pillow cannot read leaves the variants null and fails its task without retries"""
+        form_data = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser"}
+        files = {"photo": ("bird.jpg", b"fake image content", "image/jpeg")}
+        response = client.post("/v1/sightings/create", data=form_data, files=files)
+        assert response.status_code == 200
+        run_tasks()
+
+        db = TestingSessionLocal()
+        sighting = db.query(Sighting).filter(Sighting.id == response.json()["id"]).one()
+        task = db.query(Task).one()
+        db.close()
+        assert sighting.media_thumb_url is None and sighting.media_medium_url is None
+        assert (task.status, task.attempts) == ("failed", 1)
+
+    def test_backfill(self, setup_database, monkeypatch):
+        """The backfill covers stored photos without variants and reports unreadable ones"""
+        monkeypatch.setattr(settings, "thumbnail_format", "jpeg")
+        os.makedirs("uploads/photos", exist_ok=True)
+        with open("uploads/photos/old.png", "wb") as f:
+            f.write(make_photo(300, 600, "PNG"))
+        db = TestingSessionLocal()
+        db.add(Sighting(id="old-sighting", species_id=1, lat=42.0, lon=-83.0, username="testuser1",
+                        taken_at=datetime.utcnow(), media_url="uploads/photos/old.png"))
+        db.commit()
+
+        # The two fixture sightings point at photos that were never stored
+        assert asyncio.run(thumbnails.backfill(db, batch_size=2)) == (1, 2)
+        db.expire_all()
+        old = db.get(Sighting, "old-sighting")
+        assert old.media_thumb_url == "uploads/photos/old_thumb.jpg"
+        with Image.open(old.media_thumb_url) as thumb:
+            assert thumb.format == "JPEG" and thumb.size == (128, 256)
+        assert asyncio.run(thumbnails.backfill(db)) == (0, 2)
+        db.close()
+
+    def test_concurrent_variant_writes(self, setup_database):
+        """Two renders of the same photo at once each write their own partial file"""
+        os.makedirs("uploads/photos/concurrent", exist_ok=True)
+        path = "uploads/photos/concurrent/same_thumb.jpg"
+        data = os.urandom(1 << 20)
+
+        async def write_twice():
+            await asyncio.gather(*[asyncio.to_thread(thumbnails._write_file, path, data) for _ in range(8)])
+
+        asyncio.run(write_twice())
+        with open(path, "rb") as f:
+            assert f.read() == data
+        assert os.listdir("uploads/photos/concurrent") == ["same_thumb.jpg"]
+
+class TestSightingMediaDedup:
+    """Test cases for content-addressed media shared between sightings"""
+
+    def test_repost_skips_storage_write(self, setup_database, monkeypatch):
+        """The same photo posted twice is written once, counted twice and keeps its variants"""
+        writes = []
+        write_local = media_upload._write_local
+        async def record_write(chunks, path):
+            writes.append(path)
+            await write_local(chunks, path)
+        monkeypatch.setattr(media_upload, "_write_local", record_write)
+
+        photo = make_photo(640, 480, color=tuple(os.urandom(3)))  # not stored by an earlier run
+        form_data = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser"}
+        first = client.post("/v1/sightings/create", data=form_data, files={"photo": ("a.jpg", photo, "image/jpeg")}).json()
+        run_tasks()
+        second = client.post("/v1/sightings/create", data=form_data, files={"photo": ("retry.JPG", photo, "image/jpeg")}).json()
+        run_tasks()
+
+        assert first["id"] != second["id"]
+        assert second["media_url"] == first["media_url"] == writes[0]
+        assert os.path.basename(writes[0]) == hashlib.sha256(photo).hexdigest() + ".jpg"
+        assert len(writes) == 1
+
+        db = TestingSessionLocal()
+        media = db.query(Media).one()
+        assert (media.url, media.size, media.refcount) == (first["media_url"], len(photo), 2)
+        one, two = (db.get(Sighting, item["id"]) for item in (first, second))
+        assert two.media_thumb_url == one.media_thumb_url is not None
+        db.close()
+
+    def test_failed_create_keeps_shared_media(self, setup_database, monkeypatch):
+        """A failed request leaves stored content that other sightings use alone"""
+        photo = make_photo(64, 64)
+        form_data = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser"}
+        first = client.post("/v1/sightings/create", data=form_data, files={"photo": ("a.jpg", photo, "image/jpeg")}).json()
+
+        monkeypatch.setattr(settings, "media_max_audio_bytes", 1024)
+        files = {"photo": ("a.jpg", photo, "image/jpeg"), "audio": ("call.wav", os.urandom(4096), "audio/wav")}
+        assert client.post("/v1/sightings/create", data=form_data, files=files).status_code == 413
+
+        assert os.path.exists(first["media_url"])
+        db = TestingSessionLocal()
+        assert db.query(Media.refcount).one().refcount == 1
+        db.close()
+
+    def test_failed_create_leaves_media_to_collection(self, setup_database, monkeypatch):
+        """A failed request never deletes what it stored: a concurrent one may use it; unused media is collected later"""
+        photo = make_photo(48, 48, color=tuple(os.urandom(3)))
+        form_data = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser"}
+        monkeypatch.setattr(settings, "media_max_audio_bytes", 1024)
+        files = {"photo": ("a.jpg", photo, "image/jpeg"), "audio": ("call.wav", os.urandom(4096), "audio/wav")}
+        assert client.post("/v1/sightings/create", data=form_data, files=files).status_code == 413
+
+        db = TestingSessionLocal()
+        media = db.query(Media).filter(Media.sha256 == hashlib.sha256(photo).hexdigest()).one()
+        assert media.refcount == 0 and os.path.exists(media.url)
+
+        # Another request with the same content reuses it; collection then keeps it
+        second = client.post("/v1/sightings/create", data=form_data, files={"photo": ("b.jpg", photo, "image/jpeg")}).json()
+        assert second["media_url"] == media.url
+        monkeypatch.setattr(settings, "media_orphan_grace_seconds", -60)
+        assert asyncio.run(media_upload.collect_orphans(engine)) == 0
+        assert os.path.exists(media.url)
+
+        # Unused content is removed once its reservation is older than the grace period
+        orphan = make_photo(40, 40, color=tuple(os.urandom(3)))
+        assert client.post("/v1/sightings/create", data=form_data, files={"photo": ("c.jpg", orphan, "image/jpeg"), "audio": ("call.wav", os.urandom(4096), "audio/wav")}).status_code == 413
+        path = db.query(Media.url).filter(Media.sha256 == hashlib.sha256(orphan).hexdigest()).scalar()
+        assert os.path.exists(path)
+        monkeypatch.setattr(settings, "media_orphan_grace_seconds", 3600)
+        assert asyncio.run(media_upload.collect_orphans(engine)) == 0
+        # ... by the periodic media.collect task, which queues its next run
+        monkeypatch.setattr(settings, "media_orphan_grace_seconds", -60)
+        media_upload.schedule_collection(db)
+        media_upload.schedule_collection(db)
+        run_tasks()
+        assert not os.path.exists(path)
+        assert db.query(Media).filter(Media.url == path).count() == 0
+        queued = db.query(Task).filter(Task.kind == "media.collect").one()
+        assert queued.run_at > datetime.utcnow() + timedelta(seconds=settings.media_collect_interval_seconds - 60)
+        db.close()
+
+    def test_reservation_waits_for_collection(self, setup_database, monkeypatch):
+        """Content marked for collection is neither reused nor re-reserved until its row is gone"""
+        sha256 = "c" * 64
+        url = f"uploads/photos/{sha256}.jpg"
+        assert media_upload._reserve(engine, sha256, url, 3, "image/jpeg")
+        media_upload._mark_stored(engine, sha256)
+        assert media_upload._reserve_existing(engine, sha256) == url
+
+        monkeypatch.setattr(settings, "media_orphan_grace_seconds", -60)
+        [(marked, _, mark)] = media_upload._mark_orphans(engine)
+        assert marked == sha256
+        assert media_upload._reserve_existing(engine, sha256) is None
+        assert not media_upload._reserve(engine, sha256, url, 3, "image/jpeg")
+
+        media_upload._finish_collecting(engine, sha256, mark, removed=True)
+        assert media_upload._reserve(engine, sha256, url, 3, "image/jpeg")
+        assert media_upload._reserve_existing(engine, sha256) is None  # until it is written again
+
+class TestSightingDraftsAPI:
+    """Test cases for the direct upload flow (local storage)"""
+    
+    def upload(self, upload, body):
+        url = upload["url"].replace("http://testserver", "")
+        return client.put(url, content=body, headers=upload["headers"])
+    
+    def test_draft_upload_and_finalize(self, setup_database):
+        """Upload to the signed URLs, then finalize into a sighting"""
+        response = client.post("/v1/sightings/drafts", json={"photo": {"filename": "bird.jpg", "size": 11}, "audio": {"filename": "call.wav"}})
+        assert response.status_code == 200
+        draft = response.json()
+        assert set(draft["uploads"]) == {"photo", "audio"}
+        assert draft["uploads"]["photo"]["method"] == "PUT"
+        
+        details = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser", "caption": "Direct"}
+        response = client.post(f"/v1/sightings/drafts/{draft['draft_id']}/finalize", json=details)
+        assert response.status_code == 409  # nothing uploaded yet
+        
+        assert self.upload(draft["uploads"]["photo"], b"photo bytes").status_code == 200
+        assert self.upload(draft["uploads"]["audio"], b"audio bytes").status_code == 200
+        response = client.post(f"/v1/sightings/drafts/{draft['draft_id']}/finalize", json=details)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["caption"] == "Direct"
+        with open(data["media_url"], "rb") as f:
+            assert f.read() == b"photo bytes"
+        
+        # A draft is consumed by finalize
+        response = client.post(f"/v1/sightings/drafts/{draft['draft_id']}/finalize", json=details)
+        assert response.status_code == 404
+    
+    def test_draft_rejects_bad_signature_and_oversize(self, setup_database, monkeypatch):
+        """Tampered URLs are refused and size limits apply to direct uploads too"""
+        monkeypatch.setattr(settings, "media_max_photo_bytes", 16)
+        response = client.post("/v1/sightings/drafts", json={"photo": {"filename": "bird.jpg", "size": 17}})
+        assert response.status_code == 413
+        
+        draft = client.post("/v1/sightings/drafts", json={"photo": {"filename": "bird.jpg"}}).json()
+        upload = dict(draft["uploads"]["photo"])
+        upload["url"] = upload["url"].replace("signature=", "signature=0")
+        assert self.upload(upload, b"x").status_code == 403
+        
+        assert self.upload(draft["uploads"]["photo"], b"x" * 17).status_code == 413
+        response = client.post("/v1/sightings/drafts", json={})
+        assert response.status_code == 400
+
+class TestSightingResumableUploadsAPI:
+    """Test cases for resumable (tus) uploads (local storage)"""
+
+    TUS = {"Tus-Resumable": "1.0.0"}
+
+    def create(self, length, filename="dawn-chorus.m4a", **metadata):
+        metadata = {"filename": filename, **metadata}
+        header = ",".join(f"{key} {base64.b64encode(value.encode()).decode()}" for key, value in metadata.items())
+        return client.post("/v1/sightings/uploads", headers={**self.TUS, "Upload-Length": str(length), "Upload-Metadata": header})
+
+    def patch(self, location, offset, body):
+        return client.patch(location, content=body, headers={
+            **self.TUS, "Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream",
+        })
+
+    def test_upload_in_chunks_and_finalize(self, setup_database):
+        """Chunks are appended at the acknowledged offset, then the upload becomes a sighting"""
+        response = client.options("/v1/sightings/uploads")
+        assert response.headers["Tus-Version"] == "1.0.0" and "creation" in response.headers["Tus-Extension"]
+
+        recording = os.urandom(300_000)
+        response = self.create(len(recording))
+        assert response.status_code == 201
+        location = response.headers["Location"].replace("http://testserver", "")
+        upload_id = location.rsplit("/", 1)[1]
+        assert "Upload-Expires" in response.headers
+
+        assert self.patch(location, 0, recording[:100_000]).headers["Upload-Offset"] == "100000"
+        # A retried chunk that was already acknowledged is refused with the offset to use
+        assert self.patch(location, 0, recording[:100_000]).status_code == 409
+        response = client.head(location, headers=self.TUS)
+        assert (response.headers["Upload-Offset"], response.headers["Upload-Length"]) == ("100000", "300000")
+
+        details = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser", "audio_upload_id": upload_id}
+        assert client.post("/v1/sightings/uploads/finalize", json=details).status_code == 409  # incomplete
+
+        response = self.patch(location, 100_000, recording[100_000:])
+        assert response.status_code == 204 and response.headers["Upload-Offset"] == "300000"
+        response = client.post("/v1/sightings/uploads/finalize", json=details)
+        assert response.status_code == 200
+        db = TestingSessionLocal()
+        sighting = db.get(Sighting, response.json()["id"])
+        db.close()
+        assert sighting.audio_url.endswith("_dawn-chorus.m4a") and sighting.media_url is None
+        with open(sighting.audio_url, "rb") as f:
+            assert f.read() == recording
+        # Consumed by finalize
+        assert client.head(location).status_code == 404
+
+    def test_interrupted_patch_keeps_received_bytes(self, setup_database):
+        """Bytes that arrived before the connection dropped are acknowledged, so the client resumes there"""
+        upload_id = self.create(3000).headers["Location"].rsplit("/", 1)[1]
+
+        async def dropped():
+            yield b"a" * 1000
+            yield b"b" * 500
+            raise ClientDisconnect()
+
+        db = TestingSessionLocal()
+        upload = asyncio.run(resumable_upload.append(db, upload_id, 0, dropped()))
+        assert upload.offset == 1500
+        db.close()
+
+        location = f"/v1/sightings/uploads/{upload_id}"
+        assert client.head(location).headers["Upload-Offset"] == "1500"
+        assert self.patch(location, 1500, b"c" * 1500).headers["Upload-Offset"] == "3000"
+        details = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser", "audio_upload_id": upload_id}
+        sighting_id = client.post("/v1/sightings/uploads/finalize", json=details).json()["id"]
+        db = TestingSessionLocal()
+        with open(db.get(Sighting, sighting_id).audio_url, "rb") as f:
+            assert f.read() == b"a" * 1000 + b"b" * 500 + b"c" * 1500
+        db.close()
+
+    def test_rejects_bad_requests(self, setup_database, monkeypatch):
+        """Size limits, protocol headers, kinds and expiry are checked"""
+        monkeypatch.setattr(settings, "media_max_audio_bytes", 1000)
+        assert self.create(1001).status_code == 413
+        assert client.post("/v1/sightings/uploads", headers=self.TUS).status_code == 400
+        assert client.post("/v1/sightings/uploads", headers={"Tus-Resumable": "0.2.2", "Upload-Length": "1"}).status_code == 412
+
+        location = self.create(10).headers["Location"].replace("http://testserver", "")
+        upload_id = location.rsplit("/", 1)[1]
+        assert client.patch(location, content=b"x", headers={"Upload-Offset": "0"}).status_code == 415
+        assert self.patch(location, 0, b"x" * 11).status_code == 413
+        assert self.patch(location, 0, b"x" * 10).status_code == 204
+        details = {"species_id": 1, "lat": 42.3603, "lon": -71.0591, "username": "newuser", "photo_upload_id": upload_id}
+        assert client.post("/v1/sightings/uploads/finalize", json=details).status_code == 400  # audio, not a photo
+
+        # Terminated uploads are removed with their data
+        location = self.create(10, filename="bird.jpg").headers["Location"].replace("http://testserver", "")
+        self.patch(location, 0, b"x" * 4)
+        db = TestingSessionLocal()
+        partial = db.get(ResumableUpload, location.rsplit("/", 1)[1]).key + ".part"
+        db.close()
+        assert os.path.exists(partial)
+        assert client.delete(location).status_code == 204
+        assert not os.path.exists(partial) and client.head(location).status_code == 404
+
+        db = TestingSessionLocal()
+        db.get(ResumableUpload, upload_id).expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+        db.close()
+        assert client.head(location.rsplit("/", 1)[0] + "/" + upload_id).status_code == 410
+
+    def test_claim_is_shared_by_workers(self, setup_database):
+        """A PATCH claims the upload in the database: other requests wait for it, and it only finishes while holding it"""
+        location = self.create(10).headers["Location"].replace("http://testserver", "")
+        upload_id = location.rsplit("/", 1)[1]
+
+        def set_claim(token, seconds):
+            db = TestingSessionLocal()
+            upload = db.get(ResumableUpload, upload_id)
+            upload.locked_by, upload.locked_until = token, datetime.utcnow() + timedelta(seconds=seconds)
+            db.commit()
+            db.close()
+
+        # Held by a request on another worker
+        set_claim("other-worker", 60)
+        assert self.patch(location, 0, b"x" * 10).status_code == 423
+        assert client.delete(location).status_code == 423
+
+        # Taken over from this request while its bytes arrive: nothing is acknowledged or moved into place
+        set_claim(None, 0)
+
+        async def taken_over():
+            yield b"x" * 10
+            set_claim("other-worker", 60)
+
+        db = TestingSessionLocal()
+        with pytest.raises(resumable_upload.UploadError) as error:
+            asyncio.run(resumable_upload.append(db, upload_id, 0, taken_over()))
+        assert error.value.status_code == 409
+        upload = db.get(ResumableUpload, upload_id)
+        assert upload.offset == 0 and upload.locked_by == "other-worker"
+        assert not os.path.exists(upload.key)
+        db.close()
+
+        # A claim whose request died lapses
+        set_claim("other-worker", -1)
+        response = self.patch(location, 0, b"y" * 10)
+        assert response.status_code == 204 and response.headers["Upload-Offset"] == "10"
+        db = TestingSessionLocal()
+        upload = db.get(ResumableUpload, upload_id)
+        assert upload.locked_by is None
+        with open(upload.key, "rb") as f:
+            assert f.read() == b"y" * 10
+        db.close()
+        assert client.delete(location).status_code == 204
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
@@ -0,0 +1,495 @@
+import pytest
+import math
+import random
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app
+from app.database import get_db, Base
+from app.models import Sighting, SightingGridCell, Species
+from app.services.hotspots import RETENTION, expire_density
+from app.services.sighting_grid import GRID_MIN_ZOOM, remove_bulk_delete, tile_for
+from app.services.tiles import decode_tile, tile_cache
+from app.services.facets import facet_cache
+from app.services import nearby
+from datetime import datetime, timedelta
+
+# Test database setup
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_sightings_map.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+# Clear any existing overrides and set our own
+app.dependency_overrides.clear()
+app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(app)
+
+ANN_ARBOR = "-83.80,42.25,-83.70,42.30"
+
+@pytest.fixture(scope="function")
+def setup_database():
+    """Set up test database with two species and no sightings"""
+    Base.metadata.create_all(bind=engine)
+    tile_cache.clear()
+    facet_cache.clear()
+
+    db = TestingSessionLocal()
+    db.add(Species(id=1, common_name="American Robin", scientific_name="Turdus migratorius"))
+    db.add(Species(id=2, common_name="Blue Jay", scientific_name="Cyanocitta cristata"))
+    db.commit()
+    db.close()
+
+    yield
+
+    # Cleanup
+    Base.metadata.drop_all(bind=engine)
+
+def post_sighting(species_id, lat, lon, username="mapper"):
+    """Create a sighting through the API so every write-path hook runs"""
+    form_data = {"species_id": species_id, "lat": lat, "lon": lon, "username": username}
+    files = {"photo": ("bird.jpg", b"fake image content", "image/jpeg")}
+    response = client.post("/v1/sightings/create", data=form_data, files=files)
+    assert response.status_code == 200
+    return response.json()
+
+class TestSightingClustersAPI:
+    """Test cases for GET /v1/sightings/clusters"""
+
+    def test_clusters_merge_at_low_zoom(self, setup_database):
+        """Nearby sightings collapse into one cluster with the right centroid and top species"""
+        post_sighting(1, 42.2800, -83.7400)
+        post_sighting(1, 42.2810, -83.7410)
+        post_sighting(2, 42.2790, -83.7390)
+
+        response = client.get("/v1/sightings/clusters", params={"area": ANN_ARBOR, "zoom": 5})
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) == 1
+
+        cluster = data["items"][0]
+        assert cluster["count"] == 3
+        assert cluster["lat"] == pytest.approx(42.28)
+        assert cluster["lon"] == pytest.approx(-83.74)
+        assert cluster["top_species_id"] == 1
+        assert cluster["top_species_name"] == "American Robin"
+        assert cluster["top_species_count"] == 2
+
+    def test_clusters_split_at_high_zoom(self, setup_database):
+        """Sightings a few km apart land in separate clusters when zoomed in"""
+        post_sighting(1, 42.2800, -83.7400)
+        post_sighting(2, 42.2900, -83.7900)
+
+        response = client.get("/v1/sightings/clusters", params={"area": ANN_ARBOR, "zoom": 13})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["zoom"] == 16
+        assert sorted(c["count"] for c in data["items"]) == [1, 1]
+
+    def test_clusters_outside_viewport(self, setup_database):
+        """Clusters outside the requested bbox are not returned"""
+        post_sighting(1, 42.2800, -83.7400)
+
+        response = client.get("/v1/sightings/clusters", params={"area": "0,0,1,1", "zoom": 12})
+        assert response.status_code == 200
+        assert response.json()["items"] == []
+
+    def test_clusters_at_coarse_levels(self, setup_database):
+        """Levels below GRID_MIN_ZOOM are not stored but summed from it on read"""
+        post_sighting(1, 42.2800, -83.7400)
+        post_sighting(1, 10.0, -83.7400)
+        post_sighting(2, 42.2790, -80.0)
+
+        db = TestingSessionLocal()
+        assert db.query(SightingGridCell).filter(SightingGridCell.zoom < GRID_MIN_ZOOM).count() == 0
+        db.close()
+
+        response = client.get("/v1/sightings/clusters", params={"area": "-180,-80,180,80", "zoom": 0})
+        data = response.json()
+        assert data["zoom"] == 3
+        [north, south] = sorted(data["items"], key=lambda c: -c["lat"])
+        assert (north["count"], south["count"]) == (2, 1)
+        assert north["lat"] == pytest.approx(42.2795) and north["lon"] == pytest.approx(-81.87)
+        assert north["top_species_count"] == 1
+
+        url = "/v1/sightings/tiles/0/0/0"
+        etag = client.get(url).headers["etag"]
+        post_sighting(2, -30.0, 120.0)
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+    def test_clusters_drop_deleted_sightings(self, setup_database):
+        """Deleted sightings, bulk or through the ORM, leave the clusters and hotspots"""
+        first = post_sighting(1, 42.2800, -83.7400)
+        second = post_sighting(2, 42.2810, -83.7410)
+        post_sighting(2, 42.2790, -83.7390)
+
+        db = TestingSessionLocal()
+        query = db.query(Sighting).filter(Sighting.id == first["id"])
+        remove_bulk_delete(db, query)
+        query.delete(synchronize_session=False)
+        db.delete(db.get(Sighting, second["id"]))
+        db.commit()
+        db.close()
+
+        response = client.get("/v1/sightings/clusters", params={"area": ANN_ARBOR, "zoom": 5})
+        [cluster] = response.json()["items"]
+        assert (cluster["count"], cluster["top_species_id"], cluster["top_species_count"]) == (1, 2, 1)
+        assert cluster["lat"] == pytest.approx(42.279)
+
+        response = client.get("/v1/sightings/hotspots", params={"area": ANN_ARBOR, "min_count": 1})
+        assert sum(hotspot["count"] for hotspot in response.json()["items"]) == 1
+
+    def test_clusters_follow_moved_sighting(self, setup_database):
+        """A sighting whose position is edited moves to its new cluster"""
+        sighting = post_sighting(1, 42.2800, -83.7400)
+
+        db = TestingSessionLocal()
+        db.get(Sighting, sighting["id"]).lat = 10.0
+        db.commit()
+        db.close()
+
+        response = client.get("/v1/sightings/clusters", params={"area": ANN_ARBOR, "zoom": 13})
+        assert response.json()["items"] == []
+        response = client.get("/v1/sightings/clusters", params={"area": "-84,9,-83,11", "zoom": 10})
+        assert [cluster["count"] for cluster in response.json()["items"]] == [1]
+
+    def test_clusters_invalid_area(self, setup_database):
+        """Malformed bbox returns 400"""
+        response = client.get("/v1/sightings/clusters", params={"area": "1,2,3", "zoom": 10})
+        assert response.status_code == 400
+
+class TestSightingHotspotsAPI:
+    """Test cases for GET /v1/sightings/hotspots"""
+
+    def test_hotspot_over_threshold(self, setup_database):
+        """Only cells with at least min_count sightings are returned"""
+        for _ in range(3):
+            post_sighting(1, 42.28000, -83.74000)
+        post_sighting(2, 42.29500, -83.78000)  # lone sighting elsewhere
+
+        response = client.get("/v1/sightings/hotspots", params={"area": ANN_ARBOR, "min_count": 3})
+        assert response.status_code == 200
+        items = response.json()["items"]
+        assert len(items) == 1
+        assert items[0]["count"] == 3
+        assert items[0]["lat"] == pytest.approx(42.28)
+        assert items[0]["lon"] == pytest.approx(-83.74)
+
+    def test_hotspot_time_window(self, setup_database):
+        """Sightings outside the time window are not counted"""
+        for _ in range(3):
+            post_sighting(1, 42.28000, -83.74000)
+
+        past = {"area": ANN_ARBOR, "start_time": "2020-01-01T00:00:00Z", "end_time": "2020-02-01T00:00:00Z"}
+        response = client.get("/v1/sightings/hotspots", params=past)
+        assert response.status_code == 200
+        assert response.json()["items"] == []
+
+    def test_hotspot_expiry(self, setup_database):
+        """Buckets older than the retention window are aged out"""
+        post_sighting(1, 42.28000, -83.74000)
+        db = TestingSessionLocal()
+        assert expire_density(db) == 0
+        assert expire_density(db, now=datetime.utcnow() + RETENTION + RETENTION) == 1
+        db.commit()
+        db.close()
+
+    def test_hotspot_invalid_time(self, setup_database):
+        """Malformed timestamps return 400"""
+        response = client.get("/v1/sightings/hotspots", params={"area": ANN_ARBOR, "start_time": "yesterday"})
+        assert response.status_code == 400
+
+class TestSightingTilesAPI:
+    """Test cases for GET /v1/sightings/tiles/{z}/{x}/{y}"""
+
+    def test_tile_contains_sightings(self, setup_database):
+        """A tile decodes to the sightings inside it"""
+        created = post_sighting(2, 42.2800, -83.7400)
+        x, y = tile_for(42.2800, -83.7400, 14)
+
+        response = client.get(f"/v1/sightings/tiles/14/{x}/{y}")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/vnd.sightings.tile"
+        tile = decode_tile(response.content)
+        assert (tile["zoom"], tile["x"], tile["y"]) == (14, x, y)
+        assert tile["ids"] == [created["id"]]
+        assert tile["species_id"] == [2]
+        assert not tile["truncated"]
+
+    def test_tile_etag_revalidation(self, setup_database):
+        """Unchanged tiles return 304; a new sighting in the tile changes the ETag"""
+        post_sighting(1, 42.2800, -83.7400)
+        x, y = tile_for(42.2800, -83.7400, 18)
+        url = f"/v1/sightings/tiles/18/{x}/{y}"
+
+        etag = client.get(url).headers["etag"]
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        post_sighting(1, 42.2800, -83.7400)
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert len(decode_tile(response.content)["ids"]) == 2
+
+    def test_tile_etag_changes_on_delete_and_privacy(self, setup_database):
+        """Deleting a sighting, or making it private, changes the tile's ETag"""
+        first = post_sighting(1, 42.2800, -83.7400)
+        second = post_sighting(1, 42.2800, -83.7400)
+        x, y = tile_for(42.2800, -83.7400, 12)
+        url = f"/v1/sightings/tiles/12/{x}/{y}"
+        etag = client.get(url).headers["etag"]
+
+        db = TestingSessionLocal()
+        query = db.query(Sighting).filter(Sighting.id == first["id"])
+        remove_bulk_delete(db, query)
+        query.delete(synchronize_session=False)
+        db.commit()
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert decode_tile(response.content)["ids"] == [second["id"]]
+
+        etag = response.headers["etag"]
+        db.get(Sighting, second["id"]).is_private = True
+        db.commit()
+        db.close()
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200 and response.headers["etag"] != etag
+
+    def test_tile_invalid_coordinates(self, setup_database):
+        """Tile coordinates outside the zoom level's grid return 400"""
+        response = client.get("/v1/sightings/tiles/2/4/0")
+        assert response.status_code == 400
+
+class TestSightingViewportsAPI:
+    """Test cases for POST /v1/sightings/viewports"""
+
+    def test_overlapping_viewports_share_items(self, setup_database):
+        """Each group lists its sightings; a sighting in two viewports is returned once"""
+        shared = post_sighting(1, 42.28, -83.74)["id"]
+        west_only = post_sighting(1, 42.28, -83.78)["id"]
+        far = post_sighting(2, 40.71, -74.00)["id"]
+
+        response = client.post("/v1/sightings/viewports", json={
+            "areas": ["-83.80,42.25,-83.73,42.30", "-83.76,42.25,-83.70,42.30", "0,0,1,1"],
+            "tiles": ["2/1/1"],
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert sorted(item["id"] for item in data["items"]) == sorted([shared, west_only, far])
+        groups = data["groups"]
+        assert [group["area"] for group in groups] == ["-83.80,42.25,-83.73,42.30", "-83.76,42.25,-83.70,42.30", "0,0,1,1", "2/1/1"]
+        assert set(groups[0]["ids"]) == {shared, west_only}
+        assert groups[1]["ids"] == [shared]
+        assert groups[2]["ids"] == []
+        assert set(groups[3]["ids"]) == {shared, west_only, far}
+
+    def test_shared_filters_and_limit(self, setup_database):
+        """Species filter applies to every viewport; limit is per viewport"""
+        ids = [post_sighting(1, 42.28, -83.74 + i * 0.001)["id"] for i in range(3)]
+        post_sighting(2, 42.28, -83.74)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.post("/v1/sightings/viewports", json={
+                "areas": [ANN_ARBOR, "-83.75,42.27,-83.73,42.29"], "species_id": 1, "limit": 2,
+            })
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert len(statements) == 1
+        groups = response.json()["groups"]
+        assert groups[0]["ids"] == ids[::-1][:2]  # most recent first
+        assert groups[0]["truncated"] is True
+        assert groups[1]["ids"] == ids[::-1][:2]
+
+    def test_invalid_viewports(self, setup_database):
+        assert client.post("/v1/sightings/viewports", json={}).status_code == 400
+        assert client.post("/v1/sightings/viewports", json={"tiles": ["3/9/0"]}).status_code == 400
+        assert client.post("/v1/sightings/viewports", json={"areas": ["nope"]}).status_code == 400
+        assert client.post("/v1/sightings/viewports", json={"areas": [ANN_ARBOR] * 33}).status_code == 400
+
+class TestSightingFacetsAPI:
+    """Test cases for GET /v1/sightings/facets"""
+
+    def test_species_counts(self, setup_database):
+        post_sighting(1, 42.28, -83.74)
+        post_sighting(1, 42.27, -83.75)
+        post_sighting(2, 42.28, -83.76)
+        post_sighting(2, 40.71, -74.00)  # New York
+
+        response = client.get("/v1/sightings/facets", params={"area": ANN_ARBOR})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 3
+        assert data["bucket"] == "day"
+        assert data["species"] == [
+            {"species_id": 1, "common_name": "American Robin", "count": 2},
+            {"species_id": 2, "common_name": "Blue Jay", "count": 1},
+        ]
+        assert sum(bucket["count"] for bucket in data["histogram"]) == 3
+        assert data["histogram"][-1]["count"] == 3
+
+    def test_hourly_histogram(self, setup_database):
+        db = TestingSessionLocal()
+        base = datetime(2025, 5, 1, 10, 0, 0)
+        for i, minutes in enumerate([5, 30, 65, 185]):
+            db.add(Sighting(id=f"hist-{i}", species_id=1, lat=42.28, lon=-83.74,
+                            taken_at=base + timedelta(minutes=minutes), username="mapper"))
+        db.commit()
+        db.close()
+
+        response = client.get("/v1/sightings/facets", params={
+            "area": ANN_ARBOR, "start_time": "2025-05-01T10:00:00Z", "end_time": "2025-05-01T14:00:00Z", "bucket": "hour",
+        })
+        data = response.json()
+        assert [(bucket["start"], bucket["count"]) for bucket in data["histogram"]] == [
+            ("2025-05-01T10:00:00", 2), ("2025-05-01T11:00:00", 1), ("2025-05-01T12:00:00", 0), ("2025-05-01T13:00:00", 1),
+        ]
+
+    def test_cached_until_insert(self, setup_database):
+        """Tiles inside the area are cached; an insert in one of them invalidates it"""
+        post_sighting(1, 42.28, -83.74)
+        assert client.get("/v1/sightings/facets", params={"area": ANN_ARBOR}).json()["total"] == 1
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.get("/v1/sightings/facets", params={"area": ANN_ARBOR})
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert response.json()["total"] == 1
+        assert len(statements) == 2  # the grid version lookup and the edge tiles
+
+        post_sighting(2, 42.281, -83.741)
+        assert client.get("/v1/sightings/facets", params={"area": ANN_ARBOR}).json()["total"] == 2
+
+    def test_counts_exactly_the_requested_area(self, setup_database):
+        """Cold or cached, counts match a scan of the exact bbox, not of the tiles around it"""
+        rng = random.Random(5)
+        points = [(rng.choice([1, 2]), 42.0 + rng.uniform(0, 1), -84.0 + rng.uniform(0, 1)) for _ in range(300)]
+        for species_id, lat, lon in points:
+            post_sighting(species_id, lat, lon)
+
+        for area in ["-84,42,-83,43", "-83.9,42.1,-83.2,42.75", "-83.5,42.5,-83.49,42.51", "-83.71,42.33,-83.64,42.41"]:
+            west, south, east, north = map(float, area.split(","))
+            expected = {}
+            for species_id, lat, lon in points:
+                if south <= lat <= north and west <= lon <= east:
+                    expected[species_id] = expected.get(species_id, 0) + 1
+            for _ in range(2):  # the second time from the cached tiles
+                data = client.get("/v1/sightings/facets", params={"area": area}).json()
+                assert {s["species_id"]: s["count"] for s in data["species"]} == expected
+                assert data["total"] == sum(expected.values())
+        assert data["area"] == "-83.710000,42.330000,-83.640000,42.410000"
+
+    def test_invalid_parameters(self, setup_database):
+        assert client.get("/v1/sightings/facets", params={"area": ANN_ARBOR, "bucket": "minute"}).status_code == 400
+        assert client.get("/v1/sightings/facets", params={"area": "nope"}).status_code == 400
+        assert client.get("/v1/sightings/facets", params={
+            "area": ANN_ARBOR, "start_time": "2025-05-02T00:00:00Z", "end_time": "2025-05-01T00:00:00Z",
+        }).status_code == 400
+
+class TestSightingNearbyAPI:
+    """Test cases for GET /v1/sightings/nearby"""
+
+    def seed(self, n=400):
+        rng = random.Random(13)
+        db = TestingSessionLocal()
+        points = []
+        for i in range(n):
+            species_id = 2 if i % 50 == 0 else 1
+            lat, lon = 42.28 + rng.uniform(-0.5, 0.5), -83.74 + rng.uniform(-0.5, 0.5)
+            db.add(Sighting(id=f"near-{i:03d}", species_id=species_id, lat=lat, lon=lon, taken_at=datetime.utcnow(), username="mapper"))
+            points.append((f"near-{i:03d}", species_id, lat, lon))
+        db.commit()
+        db.close()
+        return points
+
+    def brute_force(self, points, lat, lon, species_id=None):
+        import numpy as np
+        kept = [p for p in points if species_id is None or p[1] == species_id]
+        distances = nearby.haversine_m(lat, lon, np.array([p[2] for p in kept]), np.array([p[3] for p in kept]))
+        return sorted(zip(distances.tolist(), [p[0] for p in kept]))
+
+    def test_radius_sorted_and_exact(self, setup_database):
+        """Everything inside the circle, nothing outside, closest first"""
+        points = self.seed()
+        response = client.get("/v1/sightings/nearby", params={"lat": 42.28, "lon": -83.74, "radius_m": 10000})
+        assert response.status_code == 200
+        items = response.json()["items"]
+        expected = [sighting_id for distance, sighting_id in self.brute_force(points, 42.28, -83.74) if distance <= 10000]
+        assert [item["id"] for item in items] == expected
+        assert [item["distance_m"] for item in items] == sorted(item["distance_m"] for item in items)
+
+    def test_knn_matches_brute_force(self, setup_database, monkeypatch):
+        """The expanding search finds the true k nearest"""
+        points = self.seed()
+        monkeypatch.setattr(nearby, "RARE_SPECIES_MAX_SIGHTINGS", -1)
+        expected = self.brute_force(points, 42.0, -83.9)
+        response = client.get("/v1/sightings/nearby", params={"lat": 42.0, "lon": -83.9, "k": 7})
+        assert [item["id"] for item in response.json()["items"]] == [sighting_id for _, sighting_id in expected[:7]]
+
+        response = client.get("/v1/sightings/nearby", params={"lat": 42.0, "lon": -83.9, "k": 7, "species_id": 2})
+        expected = self.brute_force(points, 42.0, -83.9, species_id=2)
+        assert [item["id"] for item in response.json()["items"]] == [sighting_id for _, sighting_id in expected[:7]]
+
+    def test_knn_rare_species(self, setup_database):
+        """A rare species is scanned directly, however far its sightings are"""
+        points = self.seed()
+        expected = self.brute_force(points, 0.0, 0.0, species_id=2)
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.get("/v1/sightings/nearby", params={"lat": 0.0, "lon": 0.0, "k": 3, "species_id": 2})
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert [item["id"] for item in response.json()["items"]] == [sighting_id for _, sighting_id in expected[:3]]
+        # Grid count, candidate scan, then the winning rows
+        assert len(statements) == 3
+
+    def test_radius_includes_points_on_the_box_edge(self, setup_database):
+        """Points just inside the radius due north, south, east and west are kept"""
+        db = TestingSessionLocal()
+        dlat = math.degrees(1999.0 / nearby.EARTH_RADIUS_M)
+        dlon = math.degrees(1999.0 / (nearby.EARTH_RADIUS_M * math.cos(math.radians(42.28))))
+        for name, lat, lon in [("n", 42.28 + dlat, -83.74), ("s", 42.28 - dlat, -83.74), ("e", 42.28, -83.74 + dlon), ("w", 42.28, -83.74 - dlon)]:
+            db.add(Sighting(id=f"edge-{name}", species_id=1, lat=lat, lon=lon, taken_at=datetime.utcnow(), username="mapper"))
+        db.commit()
+        db.close()
+        response = client.get("/v1/sightings/nearby", params={"lat": 42.28, "lon": -83.74, "radius_m": 2000})
+        assert sorted(item["id"] for item in response.json()["items"]) == ["edge-e", "edge-n", "edge-s", "edge-w"]
+
+    def test_knn_within_radius(self, setup_database):
+        """k and radius_m together return at most k, all within the radius"""
+        self.seed()
+        response = client.get("/v1/sightings/nearby", params={"lat": 42.28, "lon": -83.74, "k": 100, "radius_m": 5000})
+        items = response.json()["items"]
+        assert 0 < len(items) < 100
+        assert all(item["distance_m"] <= 5000 for item in items)
+
+    def test_invalid_parameters(self, setup_database):
+        """A mode is required and k is bounded"""
+        response = client.get("/v1/sightings/nearby", params={"lat": 42.28, "lon": -83.74})
+        assert response.status_code == 400
+        response = client.get("/v1/sightings/nearby", params={"lat": 42.28, "lon": -83.74, "k": 100000})
+        assert response.status_code == 400
+        response = client.get("/v1/sightings/nearby", params={"lat": 95, "lon": -83.74, "k": 1})
+        assert response.status_code == 422
+
+if __name__ == "__main__":
+    pytest.main([__file__])
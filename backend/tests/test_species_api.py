@@ -148,6 +148,24 @@ class TestSpeciesSearchAPI:
         assert "items" in data
         assert len(data["items"]) <= 2
     
+    def test_search_species_sparse_fields(self, setup_database):
+        """Only the requested fields are returned, in the same shape"""
+        response = client.get("/v1/species/?q=robin&fields=id,common_name")
+        
+        assert response.status_code == 200
+        items = response.json()["items"]
+        assert len(items) == 1
+        assert set(items[0]) == {"id", "common_name"}
+        assert items[0]["common_name"] == "American Robin"
+        
+        response = client.get(f"/v1/species/id/{items[0]['id']}?fields=scientific_name")
+        assert response.status_code == 200
+        assert response.json() == {"scientific_name": "Turdus migratorius"}
+        
+        response = client.get("/v1/species/?q=robin&fields=id,wingspan")
+        assert response.status_code == 400
+        assert "wingspan" in response.json()["detail"]
+    
     def test_search_species_limit_validation(self, setup_database):
         """Test that limit parameter is properly validated"""
         # Test limit too high
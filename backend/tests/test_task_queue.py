@@ -0,0 +1,205 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import Base
+from app.config import settings
+from app.models import Task
+from app.services import task_queue
+from app.services.task_queue import PermanentTaskError, TaskRunner, enqueue, task_handler
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_task_queue.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(scope="function")
+def setup_database(monkeypatch):
+    """Empty queue with only the handlers a test registers"""
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(task_queue, "HANDLERS", {})
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def drain(runner=None):
+    asyncio.run((runner or TaskRunner(TestingSessionLocal)).drain())
+
+
+def add_task(kind, payload=None, **columns):
+    db = TestingSessionLocal()
+    enqueue(db, kind, payload or {})
+    db.commit()
+    task = db.query(Task).order_by(Task.id.desc()).first()
+    for column, value in columns.items():
+        setattr(task, column, value)
+    db.commit()
+    task_id = task.id
+    db.close()
+    return task_id
+
+
+def get_task(task_id):
+    db = TestingSessionLocal()
+    task = db.get(Task, task_id)
+    db.close()
+    return task
+
+
+def get_task_count():
+    db = TestingSessionLocal()
+    count = db.query(Task).count()
+    db.close()
+    return count
+
+
+class TestTaskQueue:
+    """Test cases for the durable task queue and its runner"""
+
+    def test_runs_committed_tasks_only(self, setup_database):
+        """A task runs once its transaction commits and is deleted when done"""
+        seen = []
+
+        @task_handler("test.record")
+        async def record(db, payload):
+            seen.append(payload["n"])
+
+        db = TestingSessionLocal()
+        enqueue(db, "test.record", {"n": 1})
+        db.rollback()
+        enqueue(db, "test.record", {"n": 2})
+        db.commit()
+        db.close()
+
+        drain()
+        assert seen == [2]
+        assert get_task_count() == 0
+
+    def test_retry_with_backoff(self, setup_database, monkeypatch):
+        """A failed attempt is requeued for later with its error, then retried"""
+        monkeypatch.setattr(settings, "task_backoff_seconds", 60)
+        calls = []
+
+        @task_handler("test.flaky")
+        async def flaky(db, payload):
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("storage unavailable")
+
+        task_id = add_task("test.flaky")
+        drain()
+        task = get_task(task_id)
+        assert (task.status, task.attempts, task.last_error) == ("queued", 1, "storage unavailable")
+        assert task.run_at >= datetime.utcnow() + timedelta(seconds=55)
+
+        drain()  # not due yet
+        assert len(calls) == 1
+
+        db = TestingSessionLocal()
+        db.get(Task, task_id).run_at = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+        db.close()
+        drain()
+        assert len(calls) == 2 and get_task(task_id) is None
+
+    def test_gives_up_after_max_attempts(self, setup_database, monkeypatch):
+        """Attempts stop at task_max_attempts, or at once for a PermanentTaskError"""
+        monkeypatch.setattr(settings, "task_backoff_seconds", 0)
+        monkeypatch.setattr(settings, "task_max_attempts", 3)
+
+        @task_handler("test.broken")
+        async def broken(db, payload):
+            if payload.get("permanent"):
+                raise PermanentTaskError("not an image")
+            raise RuntimeError("still broken")
+
+        retried = add_task("test.broken")
+        permanent = add_task("test.broken", {"permanent": True})
+        drain()
+        assert (get_task(retried).status, get_task(retried).attempts) == ("failed", 3)
+        assert (get_task(permanent).status, get_task(permanent).attempts) == ("failed", 1)
+        assert get_task(permanent).last_error == "not an image"
+
+    def test_lapsed_claim_is_taken_over(self, setup_database):
+        """A task whose runner stopped is run by another once its visibility timeout lapses"""
+        seen = []
+
+        @task_handler("test.record")
+        async def record(db, payload):
+            seen.append(payload["n"])
+
+        now = datetime.utcnow()
+        lapsed = add_task("test.record", {"n": 1}, status="running", attempts=1, claimed_by="dead:1",
+                          run_at=now - timedelta(seconds=1))
+        held = add_task("test.record", {"n": 2}, status="running", attempts=1, claimed_by="busy:1",
+                        run_at=now + timedelta(minutes=5))
+        drain()
+        assert seen == [1]
+        assert get_task(lapsed) is None
+        assert get_task(held).claimed_by == "busy:1"
+
+    def test_stale_claim_cannot_finish(self, setup_database):
+        """A runner that lost its claim does not delete or requeue the task"""
+        @task_handler("test.record")
+        async def record(db, payload):
+            pass
+
+        task_id = add_task("test.record")
+        first, second = TaskRunner(TestingSessionLocal), TaskRunner(TestingSessionLocal)
+        [stale] = first._claim({"test.record": 1})
+        db = TestingSessionLocal()
+        db.get(Task, task_id).run_at = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+        db.close()
+        [current] = second._claim({"test.record": 1})
+
+        first._finish(stale, None)
+        first._finish(stale, RuntimeError("late"))
+        task = get_task(task_id)
+        assert (task.status, task.attempts, task.claimed_by) == ("running", 2, current.claim)
+        second._finish(current, None)
+        assert get_task(task_id) is None
+
+    def test_hung_task_times_out(self, setup_database, monkeypatch):
+        """A handler running past the visibility timeout is cancelled and retried later"""
+        monkeypatch.setattr(settings, "task_visibility_seconds", 0.05)
+
+        @task_handler("test.hang")
+        async def hang(db, payload):
+            await asyncio.sleep(5)
+
+        task_id = add_task("test.hang")
+        drain()
+        task = get_task(task_id)
+        assert (task.status, task.attempts) == ("queued", 1)
+        assert "0.05s" in task.last_error
+
+    def test_concurrency_limits(self, setup_database):
+        """Tasks run concurrently up to the runner's limit and each kind's own limit"""
+        running = {"test.wide": 0, "test.narrow": 0}
+        peak = dict(running)
+
+        def make_handler(kind):
+            async def handler(db, payload):
+                running[kind] += 1
+                peak[kind] = max(peak[kind], running[kind])
+                await asyncio.sleep(0.02)
+                running[kind] -= 1
+            return handler
+
+        task_handler("test.wide")(make_handler("test.wide"))
+        task_handler("test.narrow", concurrency=1)(make_handler("test.narrow"))
+        for _ in range(5):
+            add_task("test.wide")
+            add_task("test.narrow")
+
+        drain(TaskRunner(TestingSessionLocal, concurrency=3))
+        assert peak == {"test.wide": 3, "test.narrow": 1}
+        assert get_task_count() == 0
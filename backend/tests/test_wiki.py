@@ -1,3 +1,4 @@
+import asyncio
 import io
 import os
 import sys
@@ -13,7 +14,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.main import app
 from app.database import get_db, Base
-from app.models import Species
+from app.models import Species, Task
+from app.services.species_info import wiki_details
+from app.services.task_queue import TaskRunner
 
 # -------------------- DB & Client Setup --------------------
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test_species.db"
@@ -155,6 +158,14 @@ class TestSpeciesWithImageAPI:
         assert data["main_image"] == "https://upload.wikimedia.org/wikipedia/commons/american_robin.jpg"
 
 # -------------------- NEW: /v1/identify/photo & /v1/identify/audio --------------------
+def _stored_wiki(species_id):
+    db = TestingSessionLocal()
+    try:
+        return wiki_details(db.get(Species, species_id))
+    finally:
+        db.close()
+
+
 class TestIdentifyAPI:
 
     @pytest.fixture
@@ -166,11 +177,13 @@ class TestIdentifyAPI:
             "main_image": "https://upload.wikimedia.org/wikipedia/commons/american_robin.jpg",
         }
 
+    @patch("app.routers.identify._enrich_with_wikipedia_with_image")
     @patch("app.routers.identify._identify_species_from_image")
     def test_identify_photo_flow(
-        self, mock_gpt, setup_database, wiki_payload
+        self, mock_gpt, mock_wiki, setup_database, wiki_payload
     ):
         mock_gpt.return_value = "American Robin"
+        mock_wiki.return_value = wiki_payload
 
         fake_image = io.BytesIO(b"\x89PNG\r\n\x1a\nFAKE_IMAGE")
         files = {"photo": ("test.png", fake_image, "image/png")}
@@ -178,18 +191,29 @@ class TestIdentifyAPI:
         assert r.status_code == 200
         data = r.json()
 
+        # Answered before Wikipedia is called; the enrichment is queued
         assert data["label"] == "American Robin"
-        assert data["wiki_data"]["english_name"].lower() == "American Robin".lower()
-        print("Image URL returned:", data["wiki_data"]["main_image"])
-        assert data["wiki_data"]["main_image"] is not None
+        assert data["species_id"] == 1
+        assert data["wiki_data"] is None
+        mock_wiki.assert_not_called()
+
+        asyncio.run(TaskRunner(TestingSessionLocal).drain())
+        mock_wiki.assert_called_once_with("American Robin")
+        assert _stored_wiki(1) == wiki_payload
 
-        mock_gpt.assert_called_once()
+        fake_image = io.BytesIO(b"\x89PNG\r\n\x1a\nFAKE_IMAGE")
+        files = {"photo": ("test.png", fake_image, "image/png")}
+        r = client.post("/v1/identify/photo", files=files)
+        assert r.json()["wiki_data"]["main_image"] == wiki_payload["main_image"]
+        assert mock_gpt.call_count == 2
 
+    @patch("app.routers.identify._enrich_with_wikipedia_with_image")
     @patch("app.routers.identify._identify_species_from_audio")
     def test_identify_audio_flow(
-        self, mock_gpt, setup_database, wiki_payload
+        self, mock_gpt, mock_wiki, setup_database, wiki_payload
     ):
         mock_gpt.return_value = "American Robin"
+        mock_wiki.return_value = wiki_payload
 
         fake_wav = io.BytesIO(b"RIFF\x00\x00\x00\x00WAVEfmt ")
         files = {"audio": ("test.wav", fake_wav, "audio/wav")}
@@ -197,10 +221,54 @@ class TestIdentifyAPI:
         assert r.status_code == 200
         data = r.json()
 
+        # Answered before Wikipedia is called; the enrichment is queued
         assert data["label"] == "American Robin"
-        assert data["wiki_data"]["english_name"].lower() == "American Robin".lower()
-        print("Image URL returned:", data["wiki_data"]["main_image"])
-        assert data["wiki_data"]["main_image"] is not None
+        assert data["species_id"] == 1
+        assert data["wiki_data"] is None
+        mock_wiki.assert_not_called()
+
+        asyncio.run(TaskRunner(TestingSessionLocal).drain())
+        mock_wiki.assert_called_once_with("American Robin")
+        assert _stored_wiki(1) == wiki_payload
 
-        mock_gpt.assert_called_once()
+        fake_wav = io.BytesIO(b"RIFF\x00\x00\x00\x00WAVEfmt ")
+        files = {"audio": ("test.wav", fake_wav, "audio/wav")}
+        r = client.post("/v1/identify/audio", files=files)
+        assert r.json()["wiki_data"]["main_image"] == wiki_payload["main_image"]
+        assert mock_gpt.call_count == 2
 
+    @patch("app.routers.identify._fetch_taxon_name")
+    @patch("app.routers.identify._enrich_with_wikipedia_with_image")
+    @patch("app.routers.identify._identify_species_from_image")
+    def test_identify_new_species_enriched_once(
+        self, mock_gpt, mock_wiki, mock_taxon, setup_database, wiki_payload
+    ):
+        """Repeated identifications queue one enrichment, which also sets the scientific name"""
+        mock_gpt.return_value = "Northern Cardinal"
+        mock_wiki.return_value = wiki_payload
+        mock_taxon.return_value = "Cardinalis cardinalis"
+
+        for _ in range(3):
+            files = {"photo": ("test.png", io.BytesIO(b"\x89PNG\r\n\x1a\nFAKE_IMAGE"), "image/png")}
+            r = client.post("/v1/identify/photo", files=files)
+            assert r.json()["wiki_data"] is None
+        species_id = r.json()["species_id"]
+
+        db = TestingSessionLocal()
+        assert db.query(Task).filter(Task.kind == "species.enrich").count() == 1
+        db.close()
+
+        asyncio.run(TaskRunner(TestingSessionLocal).drain())
+        mock_wiki.assert_called_once_with("Northern Cardinal")
+        db = TestingSessionLocal()
+        species = db.get(Species, species_id)
+        assert species.scientific_name == "Cardinalis cardinalis"
+        assert species.main_image == wiki_payload["main_image"]
+        db.close()
+
+        files = {"photo": ("test.png", io.BytesIO(b"\x89PNG\r\n\x1a\nFAKE_IMAGE"), "image/png")}
+        r = client.post("/v1/identify/photo", files=files)
+        assert r.json()["wiki_data"] == wiki_payload
+        db = TestingSessionLocal()
+        assert db.query(Task).filter(Task.kind == "species.enrich").count() == 0
+        db.close()